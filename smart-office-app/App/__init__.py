@@ -8,8 +8,8 @@ from flask_pymongo import PyMongo
 mongo = PyMongo()
 
 
-def create_app():
-    """Application factory function."""
+def create_app(config=None):
+    """Application factory function; `config` overrides the settings read from the environment."""
     app = Flask(
         __name__,
         instance_relative_config=True,
@@ -20,9 +20,25 @@ def create_app():
     # This connection string points to your local MongoDB server
     # and creates a database named 'smart_office'.
     app.config["MONGO_URI"] = os.getenv("MONGO_URI", "mongodb://localhost:27017/smart_office")
+    # Baseline endpoints for python -m App.commands bench-prepare; off in every deployment
+    app.config["BENCH_ENDPOINTS"] = os.getenv("BENCH_ENDPOINTS", "0") == "1"
+
+    # Connection pool per process. The client is created here, i.e. after
+    # gunicorn forks (preload_app is off), and connects lazily on first use.
+    app.config["MONGO_POOL"] = {
+        "maxPoolSize": int(os.getenv("MONGO_MAX_POOL_SIZE", "50")),
+        "minPoolSize": int(os.getenv("MONGO_MIN_POOL_SIZE", "0")),
+        "maxIdleTimeMS": int(os.getenv("MONGO_MAX_IDLE_TIME_MS", "60000")),
+        "connectTimeoutMS": int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", "5000")),
+        "serverSelectionTimeoutMS": int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "5000")),
+        "socketTimeoutMS": int(os.getenv("MONGO_SOCKET_TIMEOUT_MS", "20000")),
+        "waitQueueTimeoutMS": int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", "2000")),
+    }
+
+    app.config.update(config or {})
 
     # 3. Initialize the PyMongo extension with your app.
-    mongo.init_app(app)
+    mongo.init_app(app, **app.config["MONGO_POOL"])
 
     # --- Import & Register Blueprints ---
     # This part stays the same. The blueprints will be updated separately.
@@ -33,6 +49,7 @@ def create_app():
     from .blueprints.meeting_rooms import meeting_bp
     from .blueprints.wellness import wellness_bp
     from .blueprints.automation_rules import automation_rules_bp
+    from .blueprints.live import live_bp
 
     # Register the blueprints with the app
     app.register_blueprint(main_bp)
@@ -42,5 +59,13 @@ def create_app():
     app.register_blueprint(meeting_bp)
     app.register_blueprint(wellness_bp)
     app.register_blueprint(automation_rules_bp)
+    app.register_blueprint(live_bp)
+    if app.config["BENCH_ENDPOINTS"]:
+        from .bench import bench_bp
+        app.register_blueprint(bench_bp)
+
+    # --- CLI maintenance commands (python -m App.commands <command>) ---
+    from .commands import register_commands
+    register_commands(app)
 
     return app
\ No newline at end of file
@@ -0,0 +1,25 @@
+# App/background.py
+import os
+import threading
+
+from .blueprints.control import schedule_loop
+from .blueprints.energy import energy_loop
+from .blueprints.meeting_rooms import room_status_loop
+from .journal import snapshot_loop
+from .leader import run_as_leader
+
+BACKGROUND_LOOPS = os.getenv("BACKGROUND_LOOPS", "1") == "1"
+
+
+def start_background_loops(app):
+    """
+    Start the HVAC scheduler, energy meter, state snapshot and room status threads in this process.
+    Call it after fork (gunicorn post_worker_init); each loop only does work in
+    the worker holding its lease (see App/leader.py).
+    """
+    if not BACKGROUND_LOOPS:
+        return
+    threading.Thread(target=run_as_leader, args=("hvac-scheduler", schedule_loop, app), daemon=True).start()
+    threading.Thread(target=run_as_leader, args=("energy-meter", energy_loop, app), daemon=True).start()
+    threading.Thread(target=run_as_leader, args=("state-snapshots", snapshot_loop, app), daemon=True).start()
+    threading.Thread(target=run_as_leader, args=("room-status", room_status_loop, app), daemon=True).start()
@@ -0,0 +1,143 @@
+# App/bench.py
+# Latency benchmark for the meeting-room prepare path (python -m App.commands
+# bench-prepare). The command copies the room's devices into a throwaway
+# database, builds a separate app on it with the factory (BENCH_ENDPOINTS=1
+# adds the baseline endpoint below) and drops the copy afterwards, so nothing
+# in a serving app is swapped or registered at runtime.
+import contextlib
+import statistics
+import threading
+import time
+from urllib.parse import urlsplit, urlunsplit
+
+from bson import ObjectId
+from flask import Blueprint, jsonify, request
+
+from . import journal, mongo
+from .blueprints.meeting_rooms import _equipment
+from .device_cache import DEVICE_PROJECTION, device_cache
+from .metering import metered_update
+from .versions import record_write
+from .write_behind import write_behind
+
+bench_bp = Blueprint("bench", __name__, url_prefix="/bench")
+
+
+def legacy_prepare(db, room_name, data):
+    """
+    The original prepare flow on `db`, kept as the baseline: five sequential
+    round trips (plus the version bump and journal entry of each write, as
+    every write path used to wait for).
+    """
+    room = db.meeting_rooms.find_one({"room_name": room_name})
+    if "light" in data:
+        fields = {"is_on": bool(data["light"])}
+        db.lights.update_one({"room": room_name}, metered_update("lights", {"$set": fields}), upsert=True)
+        record_write("lights", room_name)
+        journal.record("lights", [(room_name, fields)])
+    update_doc = {f"{d}_on": bool(data[d]) for d in ("projector", "tv") if d in data and room.get(f"has_{d}")}
+    if update_doc:
+        db.meeting_rooms.update_one({"room_name": room_name}, {"$set": update_doc})
+        record_write("meeting_rooms", room_name)
+        journal.record("meeting_rooms", [(room_name, update_doc)])
+    room = db.meeting_rooms.find_one({"room_name": room_name}, DEVICE_PROJECTION)
+    light = db.lights.find_one({"room": room_name}, DEVICE_PROJECTION)
+    return room, light
+
+
+@bench_bp.route('/rooms/<string:room_name>/legacy-prepare', methods=['POST'])
+def legacy_prepare_view(room_name):
+    room, light = legacy_prepare(mongo.db, room_name, request.json or {})
+    return jsonify({"message": f"{room_name} prepared", "equipment": _equipment(room, light)})
+
+
+def with_database(uri, name):
+    """`uri` pointing at database `name` instead (host list, credentials and options kept)."""
+    parts = urlsplit(uri)
+    return urlunsplit(parts._replace(path=f"/{name}"))
+
+
+@contextlib.contextmanager
+def scratch_copy(db, room_name):
+    """A new database next to `db` holding a copy of the room's devices; dropped on exit."""
+    scratch = db.client[f"{db.name}_bench_{ObjectId()}"]
+    try:
+        copied = 0
+        for collection, field in (("meeting_rooms", "room_name"), ("lights", "room")):
+            doc = db[collection].find_one({field: room_name}, DEVICE_PROJECTION)
+            if doc:
+                scratch[collection].insert_one(doc)
+                copied += 1
+        if not copied:
+            raise ValueError(f"unknown room: {room_name}")
+        yield scratch
+    finally:
+        db.client.drop_database(scratch.name)
+
+
+def _run(call, clients, requests):
+    """Run call(i) `requests` times from `clients` threads; returns (seconds, per-call latencies)."""
+    latencies, lock = [], threading.Lock()
+    per_client = max(1, requests // clients)
+    barrier = threading.Barrier(clients + 1)
+
+    def client(c):
+        mine = []
+        barrier.wait()
+        for i in range(per_client):
+            started = time.perf_counter()
+            call(c * per_client + i)
+            mine.append(time.perf_counter() - started)
+        with lock:
+            latencies.extend(mine)
+
+    threads = [threading.Thread(target=client, args=(c,)) for c in range(clients)]
+    for t in threads:
+        t.start()
+    barrier.wait()
+    started = time.perf_counter()
+    for t in threads:
+        t.join()
+    return time.perf_counter() - started, latencies
+
+
+def _summary(name, seconds, latencies):
+    ms = sorted(x * 1000 for x in latencies)
+
+    def pct(p):
+        return ms[min(len(ms) - 1, int(p * len(ms)))]
+    return (f"{name:10} {len(ms) / seconds:8.0f} req/s   p50 {statistics.median(ms):6.2f} ms   "
+            f"p95 {pct(0.95):6.2f} ms   p99 {pct(0.99):6.2f} ms")
+
+
+def bench_prepare(app, room_name="london", clients=32, requests=2000):
+    """
+    Compare the five-round-trip baseline with POST /rooms/<room>/prepare on an
+    app built with BENCH_ENDPOINTS (see scratch_copy); returns report lines.
+    Both are timed through the Flask test client, so request handling costs
+    the same on each side.
+    """
+    if "bench" not in app.blueprints:
+        raise RuntimeError("bench-prepare needs an app created with BENCH_ENDPOINTS=1")
+
+    def body(i):
+        return {"light": i % 2 == 0, "projector": i % 3 == 0, "tv": i % 5 == 0}
+
+    def caller(path):
+        def call(i):
+            r = app.test_client().post(path, json=body(i))
+            if r.status_code != 200:
+                raise RuntimeError(f"{path} failed: {r.status_code} {r.get_data(as_text=True)}")
+        return call
+
+    lines = []
+    try:
+        for name, path in (("baseline", f"/bench/rooms/{room_name}/legacy-prepare"),
+                           ("prepare", f"/api/meetings/rooms/{room_name}/prepare")):
+            call = caller(path)
+            call(0)                     # warm the pool / device cache
+            lines.append(_summary(name, *_run(call, clients, requests)))
+    finally:
+        device_cache.drain()            # bookkeeping still in flight belongs to the scratch database
+        write_behind.stop()
+    return lines
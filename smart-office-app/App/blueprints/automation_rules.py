@@ -1,12 +1,23 @@
+import json
+import os
 from datetime import datetime, timedelta, timezone
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, Response, jsonify, request, stream_with_context
 from .. import mongo  # uses your existing mongo from App/__init__.py
 from flask import request, jsonify
 from bson import ObjectId
+from pymongo import UpdateOne
+from ..rule_engine import rule_engine, bump_rules_version
+from ..scene_cache import scene_cache
+from ..write_behind import write_behind
+from .. import savings_rollups
+from ..indexes import ensure_indexes
 
 # URL base: /api/automation
 automation_rules_bp = Blueprint("automation_rules", __name__, url_prefix="/api/automation")
 
+MAX_BATCH_EVENTS = int(os.getenv("MOTION_BATCH_MAX_EVENTS", "5000"))
+NDJSON_FLUSH_EVERY = 500
+
 
 @automation_rules_bp.route("/rules/create", methods=["POST"])
 def create_rule():
@@ -56,6 +67,8 @@ def create_rule():
     }
 
     res = mongo.db.automation_rules.insert_one(doc)
+    # keep the in-process rule engine in sync (other workers pick it up via the version bump)
+    rule_engine.add_rule(doc, version=bump_rules_version())
 
     return jsonify({"id": str(res.inserted_id), "message": "rule created"}), 201
 
@@ -75,9 +88,14 @@ def list_active_rules():
     return jsonify({"count": len(rules), "rules": rules}), 200
 
 
-@automation_rules_bp.route("/triggers/motion", methods=["POST"])
-def trigger_motion():
-    b = request.get_json(silent=True) or {}
+def _process_motion(b, index, events, executions, memo=None):
+    """
+    Validate/evaluate one motion event against a RuleIndex.
+    Appends the documents to log to `events`/`executions` and returns (payload, status).
+    `memo` caches (matched, actions) per (zone, minute, lux-bucket) within a batch.
+    """
+    if not isinstance(b, dict):
+        b = {}
     sid = b.get("sensor_id")
     det = b.get("detected")
     zone = b.get("zone")
@@ -85,9 +103,9 @@ def trigger_motion():
     ts   = b.get("timestamp")
 
     if not isinstance(sid, str) or not sid.strip():
-        return jsonify({"error": "sensor_id required"}), 400
+        return {"error": "sensor_id required"}, 400
     if not isinstance(det, bool):
-        return jsonify({"error": "detected must be boolean"}), 400
+        return {"error": "detected must be boolean"}, 400
 
     # parse timestamp (ISO); fallback to server UTC
     now = datetime.utcnow()
@@ -102,58 +120,121 @@ def trigger_motion():
             pass
 
     # log raw event
-    mongo.db.automation_events.insert_one({
+    events.append({
         "type": "motion", "sensor_id": sid, "detected": det,
         "zone": zone, "metadata": meta, "timestamp": now.isoformat()
     })
     if not det:
-        return jsonify({"processed": False, "reason": "no motion"}), 200
-
-    # helpers
-    def hhmm(s):
-        try: h, m = map(int, (s or "0:0").split(":")); return h*60 + m
-        except: return None
+        return {"processed": False, "reason": "no motion"}, 200
+
+    nowm = now.hour*60 + now.minute
+    key = None
+    if memo is not None:
+        lux_key = index.lux_key(meta.get("lux"))
+        if lux_key is not None:
+            key = (zone, nowm, lux_key)
+            try:
+                hash(key)
+            except TypeError:       # e.g. zone sent as a list -> evaluate on its own
+                key = None
+    if key is not None and key in memo:
+        matched, actions, energy = memo[key]
+    else:
+        matched, actions = _evaluate(index, zone, nowm, meta)
+        energy = _energy_fields(actions)
+        if key is not None:
+            memo[key] = (matched, actions, energy)
+
+    # log execution summary (created_ts/energy_* let energy_savings aggregate in Mongo)
+    created = datetime.utcnow()
+    executions.append({
+        "event": {"type": "motion", "sensor_id": sid, "zone": zone, "metadata": meta, "timestamp": now.isoformat()},
+        "matched_rules": matched, "actions_fired": actions, "created_at": created.isoformat(),
+        "created_ts": created, **energy
+    })
+    return {"processed": True, "matched_rules": matched, "actions_fired": actions}, 200
 
-    nowm, matched, actions = now.hour*60 + now.minute, [], []
 
+def _evaluate(index, zone, nowm, meta):
+    matched, actions = [], []
     # evaluate enabled rules (support: motion/zone, time after/before, lux lte/gte)
-    for r in mongo.db.automation_rules.find({"enabled": True}):
-        ok = True
-        for c in (r.get("conditions") or []):
-            t = c.get("type")
-            if t == "motion" and c.get("zone") and c["zone"] != zone:
-                ok = False; break
-            if t == "time":
-                a = hhmm(c.get("after"))
-                b4 = hhmm(c.get("before") or "23:59")
-                if a is not None and nowm < a:  ok = False; break
-                if b4 is not None and nowm > b4: ok = False; break
-            if t == "lux":
-                lux = meta.get("lux")
-                if lux is None or ("lte" in c and not (lux <= c["lte"])) or ("gte" in c and not (lux >= c["gte"])):
-                    ok = False; break
-        if not ok:
-            continue
-
+    # rules come pre-compiled and indexed by zone/hour from the rule engine
+    for r in index.match(zone, nowm, meta):
         # expand actions (scene → device actions) and keep device actions
-        for a in (r.get("actions") or []):
+        for a in r.actions:
             if isinstance(a, dict) and a.get("scene_id"):
-                sc = None
-                try:   sc = mongo.db.automation_scenes.find_one({"_id": ObjectId(a["scene_id"])})
-                except Exception: sc = mongo.db.automation_scenes.find_one({"name": a["scene_id"]})
-                if sc:
-                    for d in sc.get("devices", []):
-                        actions.append({"device_id": d.get("device_id"), "action": "set_state", "state": d.get("state", {})})
+                actions.extend(scene_cache.resolve(a["scene_id"]))
             elif isinstance(a, dict) and a.get("device_id") and a.get("action"):
                 actions.append(a)
-        matched.append(str(r.get("_id")))
+        matched.append(r.rule_id)
+    return matched, actions
+
+
+def _log_motion(events, executions):
+    """Queue event/execution documents and the matching energy-savings rollup increments."""
+    write_behind.insert_many("automation_events", events)
+    write_behind.insert_many("automation_executions", executions)
+    for op in savings_rollups.rollup_ops(executions):
+        write_behind.submit(savings_rollups.ROLLUP_COLLECTION, op)
 
-    # log execution summary
-    mongo.db.automation_executions.insert_one({
-        "event": {"type": "motion", "sensor_id": sid, "zone": zone, "metadata": meta, "timestamp": now.isoformat()},
-        "matched_rules": matched, "actions_fired": actions, "created_at": datetime.utcnow().isoformat()
-    })
-    return jsonify({"processed": True, "matched_rules": matched, "actions_fired": actions}), 200
+
+@automation_rules_bp.route("/triggers/motion", methods=["POST"])
+def trigger_motion():
+    events, executions = [], []
+    payload, status = _process_motion(request.get_json(silent=True) or {},
+                                      rule_engine.snapshot(), events, executions)
+    # written behind, batched with other events
+    _log_motion(events, executions)
+    return jsonify(payload), status
+
+
+@automation_rules_bp.route("/triggers/motion/batch", methods=["POST"])
+def trigger_motion_batch():
+    """
+    Bulk version of /triggers/motion for sensor gateways.
+    Body: a JSON array of motion events (or {"events": [...]}), answered with
+    {"count", "results": [{"status", "body"}]} where each body is what the
+    single endpoint would return. With Content-Type application/x-ndjson the
+    events are read one per line and results are streamed back the same way.
+    """
+    index = rule_engine.snapshot()
+    memo = {}
+
+    if request.mimetype == "application/x-ndjson":
+        def generate():
+            events, executions = [], []
+            for line in request.stream:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    b = json.loads(line)
+                except ValueError:
+                    payload, status = {"error": "invalid JSON"}, 400
+                else:
+                    payload, status = _process_motion(b, index, events, executions, memo)
+                yield json.dumps({"status": status, "body": payload}) + "\n"
+                if len(events) >= NDJSON_FLUSH_EVERY:
+                    _log_motion(events, executions)
+                    events, executions = [], []
+            _log_motion(events, executions)
+
+        return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+
+    body = request.get_json(silent=True)
+    items = body.get("events") if isinstance(body, dict) else body
+    if not isinstance(items, list):
+        return jsonify({"error": "expected an array of motion events"}), 400
+    if len(items) > MAX_BATCH_EVENTS:
+        return jsonify({"error": f"at most {MAX_BATCH_EVENTS} events per batch"}), 413
+
+    events, executions, results = [], [], []
+    for b in items:
+        payload, status = _process_motion(b, index, events, executions, memo)
+        results.append({"status": status, "body": payload})
+
+    _log_motion(events, executions)
+    return jsonify({"count": len(results), "results": results}), 200
 
 
 # tiny heuristic used if executions don't already contain energy_kwh_est
@@ -175,49 +256,108 @@ def _estimate_kwh(action: dict) -> float:
     return round(k, 4)
 
 
+def _energy_fields(actions, stored_kwh=None):
+    """Precomputed energy fields for an execution (total + per-device kWh)."""
+    by_device = {}
+    for a in actions:
+        dev = (a.get("device_id") or "scene/unknown")
+        by_device[dev] = round(by_device.get(dev, 0.0) + _estimate_kwh(a), 4)
+    # prefer stored estimate, else compute from actions
+    kwh = stored_kwh if isinstance(stored_kwh, (int, float)) else sum(_estimate_kwh(a) for a in actions)
+    return {
+        "energy_kwh_est": kwh,
+        "energy_by_device": [{"device_id": d, "kwh": k} for d, k in by_device.items()],
+    }
+
+
+def backfill_execution_fields(batch_size=1000):
+    """
+    Add created_ts/energy_kwh_est/energy_by_device to executions written before
+    they existed. Returns the number of documents updated.
+    """
+    coll = mongo.db.automation_executions
+    cursor = coll.find(
+        {"$or": [{"created_ts": {"$exists": False}}, {"energy_by_device": {"$exists": False}}]},
+        {"created_at": 1, "actions_fired": 1, "energy_kwh_est": 1},
+    )
+    ops, updated = [], 0
+    for ex in cursor:
+        try:
+            created = datetime.fromisoformat((ex.get("created_at") or "").replace("Z", "+00:00"))
+            if created.tzinfo:
+                created = created.astimezone(timezone.utc).replace(tzinfo=None)
+        except Exception:
+            created = ex["_id"].generation_time.replace(tzinfo=None) if isinstance(ex["_id"], ObjectId) else None
+        fields = _energy_fields(ex.get("actions_fired") or [], ex.get("energy_kwh_est"))
+        if created:
+            fields["created_ts"] = created
+        ops.append(UpdateOne({"_id": ex["_id"]}, {"$set": fields}))
+        if len(ops) >= batch_size:
+            updated += coll.bulk_write(ops, ordered=False).modified_count
+            ops = []
+    if ops:
+        updated += coll.bulk_write(ops, ordered=False).modified_count
+    ensure_indexes(collections=["automation_executions"])
+    return updated
+
+
+def _savings_pipeline(since):
+    return [
+        {"$match": {"created_ts": {"$gte": since}}},
+        {"$project": {"_id": 0, "created_ts": 1, "energy_kwh_est": 1, "energy_by_device": 1}},
+        {"$facet": {
+            "totals": [{"$group": {"_id": None, "count": {"$sum": 1}, "kwh": {"$sum": "$energy_kwh_est"}}}],
+            "by_day": [
+                {"$group": {"_id": {"$dateToString": {"format": "%Y-%m-%d", "date": "$created_ts"}},
+                            "kwh": {"$sum": "$energy_kwh_est"}}},
+                {"$sort": {"_id": 1}},
+            ],
+            "by_device": [
+                {"$unwind": "$energy_by_device"},
+                {"$group": {"_id": "$energy_by_device.device_id", "kwh": {"$sum": "$energy_by_device.kwh"}}},
+                {"$sort": {"_id": 1}},
+            ],
+        }},
+    ]
+
+
 @automation_rules_bp.route("/energy-savings", methods=["GET"])
 def energy_savings():
     """
     GET params (optional):
       - days: int (default 7)
-    Returns total kWh + breakdown by date and device from automation_executions.
+      - source: "rollup" (default) or "raw"
+    Returns total kWh + breakdown by date and device.
+    By default this reads the per-day documents in energy_savings_daily, so the window
+    is whole UTC days. source=raw aggregates automation_executions over the exact
+    created_ts range instead (see backfill_execution_fields for older executions).
     """
     days = request.args.get("days", default=7, type=int)
     since = datetime.utcnow() - timedelta(days=max(days, 1))
 
-    docs = list(mongo.db.automation_executions.find().sort("created_at", -1))
-    total, by_day, by_device, execs = 0.0, {}, {}, 0
-
-    for ex in docs:
-        # filter by created_at (stored as ISO string)
-        try:
-            created = datetime.fromisoformat((ex.get("created_at") or "").replace("Z", "+00:00"))
-        except Exception:
-            created = None
-        if created and created < since:
-            continue
-
-        execs += 1
-        # prefer stored estimate, else compute from actions
-        kwh = ex.get("energy_kwh_est")
-        if not isinstance(kwh, (int, float)):
-            kwh = sum(_estimate_kwh(a) for a in (ex.get("actions_fired") or []))
-        total += kwh
-
-        day = (created.date().isoformat() if created else "unknown")
-        by_day[day] = round(by_day.get(day, 0.0) + kwh, 4)
-
-        for a in (ex.get("actions_fired") or []):
-            dev = (a.get("device_id") or "scene/unknown")
-            by_device[dev] = round(by_device.get(dev, 0.0) + _estimate_kwh(a), 4)
+    if request.args.get("source") == "raw":
+        res = next(mongo.db.automation_executions.aggregate(_savings_pipeline(since)), {})
+        totals = (res.get("totals") or [{}])[0]
+        count, total = totals.get("count", 0), totals.get("kwh", 0.0)
+        by_day = {d["_id"]: d["kwh"] for d in res.get("by_day", [])}
+        by_device = {d["_id"]: d["kwh"] for d in res.get("by_device", [])}
+    else:
+        rollups = savings_rollups.read_rollups(since.date().isoformat())
+        count, total, by_day, by_device = 0, 0.0, {}, {}
+        for day, r in rollups.items():
+            count += r["executions"]
+            total += r["kwh"]
+            by_day[day] = r["kwh"]
+            for dev, kwh in r["devices"].items():
+                by_device[dev] = by_device.get(dev, 0.0) + kwh
 
     # shape response
     return jsonify({
         "window_days": days,
-        "count_executions": execs,
+        "count_executions": count,
         "total_kwh": round(total, 4),
-        "by_day": [{"date": d, "kwh": by_day[d]} for d in sorted(by_day.keys())],
-        "by_device": [{"device_id": d, "kwh": by_device[d]} for d in sorted(by_device.keys())]
+        "by_day": [{"date": d, "kwh": round(by_day[d], 4)} for d in sorted(by_day.keys())],
+        "by_device": [{"device_id": d, "kwh": round(by_device[d], 4)} for d in sorted(by_device.keys())]
     }), 200
 
 
@@ -254,5 +394,7 @@ def create_scene():
     }
 
     res = mongo.db.automation_scenes.insert_one(doc)
+    # a new scene may shadow a cached (possibly "not found") lookup by name
+    scene_cache.invalidate(scene_id=res.inserted_id, name=doc["name"])
 
     return jsonify({"id": str(res.inserted_id), "message": "scene created"}), 201
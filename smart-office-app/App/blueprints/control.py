@@ -1,11 +1,17 @@
-from flask import Blueprint, request, jsonify
-from .. import mongo
-import time
 import datetime
+import os
+from flask import Blueprint, request, jsonify
+from .. import journal, mongo
 from ..utils import parse_time
+from ..device_cache import device_cache
+from ..hvac_scheduler import hvac_scheduler
+from ..versions import record_write, versioned
 
 control_bp = Blueprint("control", __name__, url_prefix="/api/environment")
 
+# Largest number of rooms a single bulk request may touch
+BULK_MAX_CHANGES = int(os.getenv("BULK_MAX_CHANGES", "1000"))
+
 
 # --------------------------------------------- LIGHTS API ---------------------------------------------------------
 #---------------------------------------------------------------------------------
@@ -14,30 +20,26 @@ control_bp = Blueprint("control", __name__, url_prefix="/api/environment")
 def post_control_lights():
     """Controls the state of a single light in the MongoDB 'lights' collection."""
     data = request.json
-    mongo.db.lights.update_one(
-        {'room': data.get("room")},
-        {'$set': {'is_on': bool(data.get("state"))}},
-        upsert=True
-    )
+    device_cache.update("lights", data.get("room"), {'$set': {'is_on': bool(data.get("state"))}}, upsert=True)
     return jsonify({"status": "success"})
 
 #-----------------------------------------------------------------------------------------
 #GET /api/environment/lights/status - Get current lighting status
 @control_bp.route('/lights/status', methods=['GET'])
+@versioned("lights")
 def get_lights_status():
-    lights_cursor = mongo.db.lights.find({})
-    status_dict = {light['room']: light['is_on'] for light in lights_cursor}
+    status_dict = {light['room']: light['is_on'] for light in device_cache.all("lights")}
     return jsonify(status_dict)
 
 
 # ------------------------------------------ TEMPERATURE + AC API ---------------------------------
 #GET /api/environment/temperature/current - Get current temperatures
 @control_bp.route('/temperature/current', methods=['GET'])
+@versioned("room_states")
 def get_temperature():
-    states_cursor = mongo.db.room_states.find({})
     status_dict = {
         state['room']: {"temperature": state.get('temperature'), "ac_on": state.get('ac_on', False)}
-        for state in states_cursor
+        for state in device_cache.all("room_states")
     }
     return jsonify(status_dict)
 
@@ -47,6 +49,11 @@ def get_temperature():
 def set_temperature():
     """Sets the state of a single AC unit in the 'room_states' collection."""
     data = request.json
+    device_cache.update("room_states", data.get("room"), {'$set': _ac_fields(data)}, upsert=True)
+    return jsonify({"status": "success"})
+
+
+def _ac_fields(data):
     update_doc = {}
     if "ac_on" in data:
         update_doc["ac_on"] = bool(data["ac_on"])
@@ -54,11 +61,83 @@ def set_temperature():
             update_doc["temperature"] = None
     if "temperature" in data:
         update_doc["temperature"] = data["temperature"]
-
-    mongo.db.room_states.update_one(
-        {'room': data.get("room")}, {'$set': update_doc}, upsert=True
-    )
-    return jsonify({"status": "success"})
+    return update_doc
+
+
+def _light_fields(data):
+    return {"is_on": bool(data["state"])} if "state" in data else {}
+
+
+# ------------------------------------------ BULK CONTROL ---------------------------------
+# Body: {"changes": [{"room": "london", "state": false}, ...]}
+#   and/or a selector over existing rooms, with the fields at the top level:
+#       {"select": {"all": true} | {"prefix": "floor2-"} | {"rooms": [...]}, "state": false}
+# Explicit changes win over the selector for the same room; unknown rooms in
+# `changes` are created, like the single-room endpoints do.
+def _bulk_apply(collection, fields_of):
+    data = request.json or {}
+    select = data.get("select")
+    changes = data.get("changes") or []
+    if not isinstance(changes, list) or (select is not None and not isinstance(select, dict)):
+        return jsonify({"error": "'changes' must be a list and 'select' an object"}), 400
+    if not changes and not select:
+        return jsonify({"error": "Provide 'changes' and/or 'select'"}), 400
+
+    targets = {}                        # room -> (fields, upsert), in request order
+    results = {}
+    if select:
+        shared = fields_of(data)
+        if not shared:
+            return jsonify({"error": "No state given for the selected rooms"}), 400
+        rooms = [d["room"] for d in device_cache.all(collection)]
+        if select.get("all"):
+            picked = rooms
+        elif select.get("prefix"):
+            picked = [r for r in rooms if r.startswith(str(select["prefix"]))]
+        elif isinstance(select.get("rooms"), list):
+            wanted = {str(r) for r in select["rooms"]}
+            picked = [r for r in rooms if r in wanted]
+        else:
+            return jsonify({"error": "select needs 'all', 'prefix' or 'rooms'"}), 400
+        for room in picked:
+            targets[room] = (shared, False)
+    for change in changes:
+        room = change.get("room") if isinstance(change, dict) else None
+        fields = fields_of(change) if room else {}
+        if not room or not fields:
+            results[str(room)] = {"room": room, "status": "error", "error": "room and a state are required"}
+            continue
+        targets.pop(room, None)
+        targets[room] = (fields, True)
+
+    if len(targets) > BULK_MAX_CHANGES:
+        return jsonify({"error": f"At most {BULK_MAX_CHANGES} rooms per request"}), 400
+
+    ops = [(room, {"$set": fields}, upsert) for room, (fields, upsert) in targets.items()]
+    if ops:
+        details = device_cache.bulk_update(collection, ops)
+        created = {u["index"] for u in details.get("upserted", [])}
+        failed = {e["index"]: e.get("errmsg") for e in details.get("writeErrors", [])}
+        for i, (room, _update, _upsert) in enumerate(ops):
+            if i in failed:
+                results[room] = {"room": room, "status": "error", "error": failed[i]}
+            else:
+                results[room] = {"room": room, "status": "created" if i in created else "updated"}
+
+    out = list(results.values())
+    return jsonify({"count": len(out), "results": out})
+
+
+#POST /api/environment/lights/bulk - Switch many lighting zones in one call
+@control_bp.route('/lights/bulk', methods=['POST'])
+def bulk_control_lights():
+    return _bulk_apply("lights", _light_fields)
+
+
+#POST /api/environment/temperature/bulk - Set AC state/temperature for many zones in one call
+@control_bp.route('/temperature/bulk', methods=['POST'])
+def bulk_set_temperature():
+    return _bulk_apply("room_states", _ac_fields)
 
 
 #--------------------------------------------------------------------
@@ -82,60 +161,43 @@ def set_hvac_schedule():
     if end <= start:
         return jsonify({"error": "End time must be after start time"}), 400
 
-    mongo.db.hvac_schedules.insert_one({
+    doc = {
         "room": room,
-        "start": start_str,
-        "end": end_str,
+        "start": start,   # stored as BSON dates so they can be indexed/range-queried
+        "end": end,
         "temperature": temp,
         "active": False   # ✅ will be activated later by schedule_loop
-    })
+    }
+    mongo.db.hvac_schedules.insert_one(doc)
+    record_write("hvac_schedules")  # the scheduler (leader worker) loads it on its next wake
+    hvac_scheduler.add(doc)   # ...or right away when this worker is the leader
     return jsonify({"message": f"Schedule added for {room} from {start_str} → {end_str} at {temp}°C"})
 
 
 
-def schedule_loop(app):
-    """Background task to manage HVAC schedules using MongoDB."""
-    while True:
-        with app.app_context():
-            now = datetime.datetime.now()
-            schedules = list(mongo.db.hvac_schedules.find({}))
-
-            for schedule in schedules:
-                start_time = parse_time(schedule.get('start'))
-                end_time = parse_time(schedule.get('end'))
-                room = schedule.get('room')
-
-                if not all([start_time, end_time, room]):
-                    continue
-
-                try:
-                    if start_time <= now <= end_time:
-                        # ACTIVE PERIOD
-                        mongo.db.room_states.update_one(
-                            {"room": room},
-                            {"$set": {"ac_on": True, "temperature": schedule.get("temperature")}},
-                            upsert=True
-                        )
-                        if not schedule.get("active", False):
-                            mongo.db.hvac_schedules.update_one(
-                                {"_id": schedule["_id"]},
-                                {"$set": {"active": True}}
-                            )
-                            print(f"✅ Schedule started for {room} at {schedule.get('temperature')}°C")
-
-                    elif now > end_time and schedule.get("active", False):
-                        # EXPIRED
-                        mongo.db.room_states.update_one(
-                            {"room": room},
-                            {"$set": {"ac_on": False, "temperature": None}}
-                        )
-                        mongo.db.hvac_schedules.update_one(
-                            {"_id": schedule["_id"]},
-                            {"$set": {"active": False}}
-                        )
-                        print(f"⏹ Schedule ended for {room}")
-                except Exception as e:
-                    print("⚠️ Error in schedule loop:", e)
-
-        time.sleep(5)
-
+def schedule_loop(app, keep_running=lambda: True):
+    """Background task to manage HVAC schedules (event-driven, see App/hvac_scheduler.py)."""
+    hvac_scheduler.run(app, keep_running)
+
+
+# ------------------------------------------ STATE HISTORY ---------------------------------
+#GET /api/environment/state-at?t=2026-10-18T09:30&collections=lights,room_states
+#    - device state as it was at t (UTC), replayed from the nearest snapshot
+@control_bp.route('/state-at', methods=['GET'])
+def get_state_at():
+    try:
+        t = datetime.datetime.fromisoformat(request.args.get("t", ""))
+    except ValueError:
+        return jsonify({"error": "Provide 't' as an ISO-8601 datetime (UTC)"}), 400
+    if t.tzinfo is not None:
+        t = t.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    collections = [c for c in request.args.get("collections", "").split(",") if c] or None
+    unknown = [c for c in collections or [] if c not in journal.JOURNALED]
+    if unknown:
+        return jsonify({"error": f"unknown collections: {', '.join(unknown)}"}), 400
+    result = journal.state_at(t, collections)
+    return jsonify({
+        "t": result["t"].isoformat(),
+        "snapshot": result["snapshot"].isoformat() if result["snapshot"] else None,
+        "state": {c: list(docs.values()) for c, docs in result["state"].items()},
+    })
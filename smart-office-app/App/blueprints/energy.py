@@ -1,71 +1,152 @@
 # App/blueprints/energy.py
 import datetime
+import os
 import time
-from flask import Blueprint, jsonify
+from flask import Blueprint, jsonify, request
+from pymongo import ReturnDocument
+from pymongo.errors import PyMongoError
 from .. import mongo  # Import the mongo instance from App/__init__.py
+from ..metering import METER_INTERVAL_SECONDS, settle
 
 energy_bp = Blueprint("energy", __name__, url_prefix="/api/environment/energy")
 
+KWH_FIELDS = ("lights_kwh", "ac_kwh", "total_kwh")
+# granularity -> (bucket collection read, its time field, length of one stored bucket)
+GRANULARITIES = {
+    "hour": ("energy_hourly", "hour", datetime.timedelta(hours=1)),
+    "day": ("energy_daily", "day", datetime.timedelta(days=1)),
+    "week": ("energy_daily", "day", datetime.timedelta(days=1)),
+}
+# a day's per-hour average and peak hour still need its hourly buckets
+AVG_SOURCES = {"day": GRANULARITIES["hour"]}
+STEPS = {"hour": datetime.timedelta(hours=1), "day": datetime.timedelta(days=1), "week": datetime.timedelta(weeks=1)}
+AGGS = ("sum", "avg", "max")
+ENERGY_MAX_POINTS = int(os.getenv("ENERGY_MAX_POINTS", "10000"))
+
 
 def get_or_create_today_usage():
-    today_str = datetime.date.today().isoformat()
-    usage_doc = mongo.db.energy_usage.find_one({"date": today_str})
-
-    if not usage_doc:
-        # If no document exists for today, create a new one
-        new_usage = {
-            "date": today_str,
-            "lights_kwh": 0.0,
-            "ac_kwh": 0.0,
-            "total_kwh": 0.0
-        }
-        # Insert the new document into the 'energy_usage' collection
-        mongo.db.energy_usage.insert_one(new_usage)
-        return new_usage
-
-    return usage_doc
+    """Today's totals document, created on first use with a single atomic upsert."""
+    today_str = datetime.datetime.utcnow().date().isoformat()    # metering buckets by UTC day
+    return mongo.db.energy_usage.find_one_and_update(
+        {"date": today_str},
+        {"$setOnInsert": {"lights_kwh": 0.0, "ac_kwh": 0.0, "total_kwh": 0.0}},
+        projection={"_id": 0},
+        upsert=True,
+        return_document=ReturnDocument.AFTER,
+    )
+
+
+def _truncate(ts, granularity):
+    ts = ts.replace(minute=0, second=0, microsecond=0)
+    if granularity != "hour":
+        ts = ts.replace(hour=0)
+    if granularity == "week":
+        ts -= datetime.timedelta(days=ts.weekday())     # weeks start on Monday
+    return ts
+
+
+def _parse_ts(value, default):
+    if not value:
+        return default
+    ts = datetime.datetime.fromisoformat(value)
+    if ts.tzinfo is not None:
+        ts = ts.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return ts
+
+
+def usage_series(start, end, granularity="day", agg="sum", room=None):
+    """
+    [{"t", "lights_kwh", "ac_kwh", "total_kwh"}] for every `granularity` bucket in
+    [start, end), downsampled on the server from the stored buckets: sum, avg
+    (per stored hour, or per day for weeks) or max (the peak stored bucket).
+    Days and weeks read one daily bucket per day; only a day's avg and max
+    read its hourly ones. room=None means the whole office.
+    """
+    coll, field, unit = (AVG_SOURCES if agg in ("avg", "max") else {}).get(granularity) or GRANULARITIES[granularity]
+    start, step = _truncate(start, granularity), STEPS[granularity]
+    acc = "$max" if agg == "max" else "$sum"
+    rows = mongo.db[coll].aggregate([
+        {"$match": {"room": room, field: {"$gte": start, "$lt": end}}},
+        {"$group": {
+            "_id": {"$dateTrunc": {"date": f"${field}", "unit": granularity, "startOfWeek": "monday"}},
+            **{f: {acc: f"${f}"} for f in KWH_FIELDS},
+        }},
+    ])
+    by_bucket = {r["_id"]: r for r in rows}
+
+    points = []
+    t = start
+    while t < end:
+        row = by_bucket.get(t, {})
+        point = {"t": t.isoformat()}
+        # avg covers every stored bucket in range, including the empty (0 kWh) ones
+        slots = max(1, round((min(t + step, end) - t) / unit)) if agg == "avg" else 1
+        for f in KWH_FIELDS:
+            point[f] = round(row.get(f, 0.0) / slots, 6)
+        points.append(point)
+        t += step
+    return points
+
 
 #GET /api/environment/energy/usage - Monitor energy consumption
+#    ?from=&to=&granularity=hour|day|week&agg=sum|avg|max&room=  -> history series
 @energy_bp.route('/usage', methods=['GET'])
 def get_energy_usage():
-    """API endpoint to get today's energy usage."""
-    usage = get_or_create_today_usage()
+    """Today's energy usage, or a downsampled history series when a range/granularity is given."""
+    args = request.args
+    if any(k in args for k in ("from", "to", "granularity", "agg", "room")):
+        return _usage_history(args)
 
-    # MongoDB's _id is not JSON serializable by default, so we convert it to a string.
-    if '_id' in usage:
-        usage['_id'] = str(usage['_id'])
+    usage = get_or_create_today_usage()
+    now = datetime.datetime.utcnow()
+    week_start, month_start = _truncate(now, "week"), _truncate(now, "day").replace(day=1)
+    days = list(mongo.db.energy_daily.find(
+        {"room": None, "day": {"$gte": min(week_start, month_start)}}, {"_id": 0, "day": 1, "total_kwh": 1}
+    ))
 
     return jsonify({
         "lights_today_kwh": usage.get("lights_kwh", 0),
         "ac_today_kwh": usage.get("ac_kwh", 0),
         "total_today_kwh": usage.get("total_kwh", 0),
+        # what the dashboard's energy tab reads
+        "today_kwh": round(usage.get("total_kwh", 0), 3),
+        "week_kwh": round(sum(d.get("total_kwh", 0) for d in days if d["day"] >= week_start), 3),
+        "month_kwh": round(sum(d.get("total_kwh", 0) for d in days if d["day"] >= month_start), 3),
+    })
+
+
+def _usage_history(args):
+    granularity = args.get("granularity", "day")
+    agg = args.get("agg", "sum")
+    if granularity not in GRANULARITIES:
+        return jsonify({"error": f"granularity must be one of {', '.join(GRANULARITIES)}"}), 400
+    if agg not in AGGS:
+        return jsonify({"error": f"agg must be one of {', '.join(AGGS)}"}), 400
+    now = datetime.datetime.utcnow()
+    try:
+        end = _parse_ts(args.get("to"), now)
+        start = _parse_ts(args.get("from"), end - datetime.timedelta(days=7))
+    except ValueError:
+        return jsonify({"error": "from/to must be ISO-8601 dates or datetimes"}), 400
+    if start >= end:
+        return jsonify({"error": "from must be before to"}), 400
+    if (end - _truncate(start, granularity)) / STEPS[granularity] > ENERGY_MAX_POINTS:
+        return jsonify({"error": f"at most {ENERGY_MAX_POINTS} points, use a coarser granularity"}), 400
+
+    room = args.get("room") or None
+    return jsonify({
+        "from": start.isoformat(), "to": end.isoformat(),
+        "granularity": granularity, "agg": agg, "room": room,
+        "points": usage_series(start, end, granularity, agg, room),
     })
 
 
-def energy_loop(app):
-    while True:
+def energy_loop(app, keep_running=lambda: True):
+    """Settle the device meters into the energy buckets every METER_INTERVAL_SECONDS."""
+    while keep_running():
         with app.app_context():
-            usage = get_or_create_today_usage()
-
-            lights_on = mongo.db.lights.count_documents({"is_on": True})
-            ac_on = mongo.db.room_states.count_documents({"ac_on": True})
-
-            lights_power_kw = lights_on * 0.01
-            ac_power_kw = ac_on * 0.02
-
-            interval_hours = 30 / 3600
-            lights_kwh_increment = lights_power_kw * interval_hours
-            ac_kwh_increment = ac_power_kw * interval_hours
-
-            mongo.db.energy_usage.update_one(
-                {"_id": usage["_id"]},
-                {
-                    "$inc": {
-                        "lights_kwh": lights_kwh_increment,
-                        "ac_kwh": ac_kwh_increment,
-                        "total_kwh": lights_kwh_increment + ac_kwh_increment
-                    }
-                }
-            )
-
-        time.sleep(30)
\ No newline at end of file
+            try:
+                settle()
+            except PyMongoError as e:
+                print("⚠️ energy metering failed, retrying next tick:", e)
+        time.sleep(METER_INTERVAL_SECONDS)
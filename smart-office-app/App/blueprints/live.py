@@ -0,0 +1,60 @@
+# App/blueprints/live.py
+# Server-sent events for the dashboards: one snapshot, then deltas.
+#   GET /api/live/stream?topics=parking_spots
+#   event: snapshot  data: {"data": {topic: {key: doc}}, "versions": {topic: n}}
+#   event: delta     data: {"topic", "key", "doc" (null = deleted), "v"}
+import json
+import os
+import queue
+
+from flask import Blueprint, Response, jsonify, request
+
+from ..live import RESYNC, TOPICS, live_bus
+
+live_bp = Blueprint("live", __name__, url_prefix="/api/live")
+
+# Under gthread every open stream holds a server thread, so cap them below
+# GUNICORN_THREADS; under gevent a stream is an idle greenlet and the cap stays
+# below GUNICORN_WORKER_CONNECTIONS. Past the cap the pages poll and retry the
+# stream with backoff (Retry-After).
+GEVENT_WORKERS = os.getenv("GUNICORN_WORKER_CLASS", "gthread") == "gevent"
+LIVE_MAX_STREAMS = int(os.getenv("LIVE_MAX_STREAMS", "900" if GEVENT_WORKERS else "24"))
+KEEPALIVE_SECONDS = 15
+
+
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+@live_bp.route("/stream", methods=["GET"])
+def stream():
+    topics = [t for t in request.args.get("topics", ",".join(TOPICS)).split(",") if t]
+    unknown = [t for t in topics if t not in TOPICS]
+    if unknown:
+        return jsonify({"error": f"unknown topics: {', '.join(unknown)}", "topics": list(TOPICS)}), 400
+    if live_bus.subscribers >= LIVE_MAX_STREAMS:
+        return jsonify({"error": "too many live streams, poll and retry later"}), 503, {"Retry-After": "30"}
+
+    sub, snapshot = live_bus.subscribe(topics)
+
+    def generate():
+        try:
+            yield "retry: 3000\n\n"
+            yield _sse("snapshot", snapshot)
+            while True:
+                try:
+                    event = sub.queue.get(timeout=KEEPALIVE_SECONDS)
+                except queue.Empty:
+                    yield ": keepalive\n\n"     # also how we notice a closed connection
+                    continue
+                if event is RESYNC:
+                    yield _sse("snapshot", live_bus.snapshot(topics))
+                else:
+                    yield _sse("delta", event)
+        finally:
+            live_bus.unsubscribe(sub)
+
+    return Response(generate(), mimetype="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",      # don't let an ingress buffer the stream
+    })
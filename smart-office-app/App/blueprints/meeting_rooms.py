@@ -1,7 +1,13 @@
 # App/blueprints/meeting_rooms.py
 from flask import Blueprint, request, jsonify
-from .. import mongo
+from .. import journal, mongo
+from ..bookings import booking_index, public, to_utc
+from ..device_cache import device_cache
+from ..versions import record_write, versioned
+from pymongo.errors import PyMongoError
 import datetime
+import os
+import time
 import pytz
 
 meeting_bp = Blueprint("meeting_rooms", __name__, url_prefix="/api/meetings")
@@ -31,183 +37,266 @@ def seed_meeting_rooms():
 
 # --- API ROUTES ---
 
+# Bookings are shown (messages, booked_until) in the office's local time
+LOCAL_TZ = pytz.timezone('Asia/Jerusalem')
+# How late the meeting_rooms mirror may flip after a booking starts or ends
+ROOM_STATUS_SECONDS = float(os.getenv("ROOM_STATUS_SECONDS", "1"))
+
+
+def _local(ts):
+    return ts.replace(tzinfo=datetime.timezone.utc).astimezone(LOCAL_TZ).isoformat()
+
+
+def _sync_room_status(room_name, now=None):
+    """
+    Mirror the room's running booking into meeting_rooms (is_available /
+    booked_until / booking_id, what the live dashboards show). Stamped with the
+    bookings document's updated_at and the last booking start/end passed, so an
+    older view never overwrites a newer one.
+    """
+    current, stamp, boundary = booking_index.current(room_name, now)
+    if stamp is None:
+        return
+    fields = {
+        "is_available": current is None,
+        "booked_until": _local(current["end"]) if current else None,
+        "booking_id": current["id"] if current else None,
+    }
+    res = mongo.db.meeting_rooms.update_one(
+        {"room_name": room_name, "$or": [
+            {"bookings_at": {"$exists": False}},
+            {"bookings_at": {"$lt": stamp}},
+            # same bookings, but one of them has started or ended since
+            {"bookings_at": stamp, "boundary_at": {"$not": {"$gte": boundary}}},
+        ]},
+        {"$set": {**fields, "bookings_at": stamp, "boundary_at": boundary}},
+    )
+    if res.modified_count:
+        record_write("meeting_rooms", room_name)
+        journal.record("meeting_rooms", [(room_name, fields)])
+
+
+def room_status_loop(app, keep_running=lambda: True):
+    """
+    Leader loop: bookings start and end without any request, so every
+    ROOM_STATUS_SECONDS re-mirror the rooms where a booking started or ended
+    (or that another worker wrote) since the previous pass.
+    """
+    since = None                        # first pass: every room, boundaries may have passed while nobody led
+    while keep_running():
+        now = datetime.datetime.utcnow()
+        with app.app_context():
+            try:
+                booking_index.sync()
+                for room_name in booking_index.due(since, now):
+                    _sync_room_status(room_name, now)
+                since = now
+            except PyMongoError as e:
+                print("⚠️ room status sync failed, retrying next round:", e)
+        time.sleep(ROOM_STATUS_SECONDS)
+
+
+def migrate_legacy_bookings():
+    """Move bookings made before the booking engine (meeting_rooms fields only) into room_bookings."""
+    now = datetime.datetime.utcnow()
+    moved = 0
+    for room in mongo.db.meeting_rooms.find({"is_available": False}):
+        until = to_utc(room.get("booked_until"))
+        if not until or until <= now:
+            continue
+        booking, _taken = booking_index.book(room["room_name"], now, until, booking_id=room.get("booking_id"))
+        moved += booking is not None
+    return moved
+
+
+def _free_rooms(start, end, projector=False, tv=False):
+    rooms = [
+        r for r in device_cache.all("meeting_rooms")
+        if (not projector or r.get("has_projector")) and (not tv or r.get("has_tv"))
+    ]
+    return booking_index.free_rooms([r["room_name"] for r in rooms], start, end)
+
+
 @meeting_bp.route('/rooms/available', methods=['GET'])
 def get_available_rooms():
-    """Return only rooms that are marked as available."""
-    available_rooms_cursor = mongo.db.meeting_rooms.find({"is_available": True})
-    available = [room['room_name'] for room in available_rooms_cursor]
+    """Return the rooms nobody has booked right now (computed at request time, so bookings lapse on their own)."""
+    now = datetime.datetime.utcnow()
+    available = _free_rooms(now, now + datetime.timedelta(seconds=1))
     return jsonify({"available_rooms": available})
 
 
+#GET /api/meetings/rooms/free?start=&end=&projector=1&tv=1 - rooms free for the whole [start, end)
+@meeting_bp.route('/rooms/free', methods=['GET'])
+def get_free_rooms():
+    start, end = to_utc(request.args.get("start")), to_utc(request.args.get("end"))
+    if not start or not end or start >= end:
+        return jsonify({"error": "Provide ISO-8601 'start' and 'end' with start < end"}), 400
+    rooms = _free_rooms(start, end, request.args.get("projector") == "1", request.args.get("tv") == "1")
+    return jsonify({"start": start.isoformat(), "end": end.isoformat(), "free_rooms": rooms})
+
+
+#POST /api/meetings/bookings {room, start, end, user?, title?} - reserve a future slot
+@meeting_bp.route('/bookings', methods=['POST'])
+def create_booking():
+    data = request.json or {}
+    room_name = data.get("room")
+    start, end = to_utc(data.get("start")), to_utc(data.get("end"))
+    if not device_cache.get("meeting_rooms", room_name):
+        return jsonify({"error": "Invalid room"}), 400
+    if not start or not end or start >= end:
+        return jsonify({"error": "Provide ISO-8601 'start' and 'end' with start < end"}), 400
+    if end <= datetime.datetime.utcnow():
+        return jsonify({"error": "That slot is already over"}), 400
+
+    booking, taken = booking_index.book(room_name, start, end, data.get("user"), data.get("title"))
+    if taken is not None:
+        return jsonify({"error": f"{room_name} is already booked then",
+                        "conflict": public(taken) if taken else None}), 409
+    _sync_room_status(room_name)
+    return jsonify({"room": room_name, "booking": public(booking)}), 201
+
+
+#GET /api/meetings/rooms/<room>/bookings?from=&to= - a room's bookings (default: the next 24h)
+@meeting_bp.route('/rooms/<string:room_name>/bookings', methods=['GET'])
+def get_room_bookings(room_name):
+    now = datetime.datetime.utcnow()
+    start = to_utc(request.args.get("from")) or now
+    end = to_utc(request.args.get("to")) or start + datetime.timedelta(days=1)
+    booking_index.sync()
+    return jsonify({"room": room_name, "bookings": [public(b) for b in booking_index.between(room_name, start, end)]})
+
+
+#DELETE /api/meetings/bookings/<booking_id>
+@meeting_bp.route('/bookings/<string:booking_id>', methods=['DELETE'])
+def delete_booking(booking_id):
+    room_name = booking_index.cancel(booking_id)
+    if room_name is None:
+        return jsonify({"error": "Booking not found"}), 404
+    _sync_room_status(room_name)
+    return jsonify({"message": f"Booking {booking_id} cancelled", "room": room_name})
+
+
 @meeting_bp.route('/rooms/book', methods=['POST'])
 def book_room():
+    """Book a room from now for one hour (a single guarded write, see App/bookings.py)."""
     data = request.json
     room_name = data.get("room")
 
-    room = mongo.db.meeting_rooms.find_one({"room_name": room_name})
-    if not room:
+    if not device_cache.get("meeting_rooms", room_name):
         return jsonify({"error": "Invalid room"}), 400
-    if not room.get('is_available', True):
-        return jsonify({"error": "Room already booked"}), 409
 
-    # Use your local timezone for correct timestamps
-    local_tz = pytz.timezone('Asia/Jerusalem')
-    now_local = datetime.datetime.now(local_tz)
-    end_time = now_local + datetime.timedelta(hours=1)
-    booking_id = f"bk-{int(datetime.datetime.utcnow().timestamp())}"
-
-    mongo.db.meeting_rooms.update_one(
-        {"room_name": room_name},
-        {"$set": {
-            "is_available": False,
-            "booked_until": end_time.isoformat(),  # Always save as ISO string
-            "booking_id": booking_id
-        }}
-    )
-    return jsonify({"message": f"{room_name} booked until {end_time.isoformat()}", "booking_id": booking_id})
+    now = datetime.datetime.utcnow()
+    booking, _taken = booking_index.book(room_name, now, now + datetime.timedelta(hours=1), data.get("user"))
+    if booking is None:
+        return jsonify({"error": "Room already booked"}), 409
+    _sync_room_status(room_name)
+    end_time = _local(booking["end"])
+    return jsonify({"message": f"{room_name} booked until {end_time}", "booking_id": booking["id"]})
 
 
 @meeting_bp.route('/rooms/<string:room_name>/extend', methods=['PUT'])
 def extend_booking(room_name):
-    room = mongo.db.meeting_rooms.find_one({"room_name": room_name})
-    if not room or room.get('is_available'):
-        return jsonify({"error": "Room is not currently booked"}), 404
-
-    extra_minutes = request.json.get("extra_minutes")
-    if not isinstance(extra_minutes, int):
-        return jsonify({"error": "Please provide 'extra_minutes' as an integer"}), 400
-
-    current_end_time = room.get('booked_until')
-    if isinstance(current_end_time, str):
-        current_end_time = datetime.datetime.fromisoformat(current_end_time)
+    extra_minutes = (request.json or {}).get("extra_minutes")
+    if not isinstance(extra_minutes, int) or isinstance(extra_minutes, bool) or extra_minutes <= 0:
+        return jsonify({"error": "Please provide 'extra_minutes' as a positive integer"}), 400
 
-    new_end_time = current_end_time + datetime.timedelta(minutes=extra_minutes)
+    booking_index.sync()
+    current, _stamp, _boundary = booking_index.current(room_name)
+    if not current:
+        return jsonify({"error": "Room is not currently booked"}), 404
 
-    mongo.db.meeting_rooms.update_one(
-        {"room_name": room_name},
-        {"$set": {"booked_until": new_end_time.isoformat()}}
-    )
-    return jsonify({"message": f"Booking for {room_name} extended until {new_end_time.isoformat()}"})
+    _room, booking, reason = booking_index.extend(current["id"], datetime.timedelta(minutes=extra_minutes))
+    if reason == "not_found":
+        return jsonify({"error": "Room is not currently booked"}), 404
+    if booking is None:
+        return jsonify({"error": "The room is booked right after, can't extend" if reason == "conflict"
+                        else "Too many concurrent changes, try again"}), 409
+    _sync_room_status(room_name)
+    return jsonify({"message": f"Booking for {room_name} extended until {_local(booking['end'])}"})
 
 
 @meeting_bp.route('/rooms/<string:booking_id>', methods=['DELETE'])
 def cancel_booking(booking_id):
-    room_to_cancel = mongo.db.meeting_rooms.find_one({"booking_id": booking_id})
-    if not room_to_cancel:
+    room_name = booking_index.cancel(booking_id)
+    if room_name is None:
         return jsonify({"error": "Booking not found"}), 404
-
-    room_name = room_to_cancel['room_name']
-    mongo.db.meeting_rooms.update_one(
-        {"booking_id": booking_id},
-        {"$set": {
-            "is_available": True,
-            "booked_until": None,
-            "booking_id": None
-        }}
-    )
+    _sync_room_status(room_name)
     return jsonify({"message": f"Booking {booking_id} cancelled, {room_name} is now available"})
 
 
-@meeting_bp.route('/rooms/<string:room_name>/equipment', methods=['GET'])
-def get_equipment(room_name):
-    room = mongo.db.meeting_rooms.find_one({"room_name": room_name})
-    light = mongo.db.lights.find_one({"room": room_name}) or {"is_on": False}
-
-    if not room:
-        return jsonify({"error": "Invalid room"}), 400
-
-    equipment_status = {
+def _equipment(room, light):
+    return {
         "projector": room.get("has_projector", False),
         "projector_on": room.get("projector_on", False),
         "tv": room.get("has_tv", False),
         "tv_on": room.get("tv_on", False),
         "light": True,
-        "light_on": light.get("is_on", False)
+        "light_on": light.get("is_on", False) if light else False
     }
-    return jsonify({"equipment": equipment_status})
+
+
+@meeting_bp.route('/rooms/<string:room_name>/equipment', methods=['GET'])
+@versioned("meeting_rooms", "lights")
+def get_equipment(room_name):
+    room = device_cache.get("meeting_rooms", room_name)
+    if not room:
+        return jsonify({"error": "Invalid room"}), 400
+    return jsonify({"equipment": _equipment(room, device_cache.get("lights", room_name))})
+
 
 @meeting_bp.route('/rooms/<string:room_name>/prepare', methods=['POST'])
 def prepare_room(room_name):
-    room = mongo.db.meeting_rooms.find_one({"room_name": room_name})
+    """
+    Switch a room's light/projector/TV. The room comes from the device cache and
+    the light and equipment writes (find_one_and_update, returning the new
+    documents) are issued together; their version bumps and journal entries
+    follow off the request (DeviceCache.update_many), so a click costs one
+    round trip.
+    """
+    room = device_cache.get("meeting_rooms", room_name)
     if not room:
         return jsonify({"error": "Invalid room"}), 404
 
-    data = request.json
+    data = request.json or {}
     update_doc = {}
     actions = []
+    changes = []
 
     # --- Lights ---
     if "light" in data:
-        mongo.db.lights.update_one(
-            {"room": room_name},
-            {"$set": {"is_on": bool(data["light"])}},
-            upsert=True
-        )
+        changes.append(("lights", room_name, {"$set": {"is_on": bool(data["light"])}}, True))
         actions.append(f"Lights {'ON' if data['light'] else 'OFF'}")
 
-    # --- Projector ---
-    if "projector" in data:
-        if room.get("has_projector", False):
-            update_doc["projector_on"] = bool(data["projector"])
-            actions.append(f"Projector {'ON' if data['projector'] else 'OFF'}")
-        else:
-            actions.append("No projector in this room")
-
-    # --- TV ---
-    if "tv" in data:
-        if room.get("has_tv", False):
-            update_doc["tv_on"] = bool(data["tv"])
-            actions.append(f"TV {'ON' if data['tv'] else 'OFF'}")
+    # --- Projector / TV ---
+    for device, label, name in (("projector", "Projector", "projector"), ("tv", "TV", "TV")):
+        if device not in data:
+            continue
+        if room.get(f"has_{device}", False):
+            update_doc[f"{device}_on"] = bool(data[device])
+            actions.append(f"{label} {'ON' if data[device] else 'OFF'}")
         else:
-            actions.append("No TV in this room")
-
-    # Apply DB updates for projector/TV
+            actions.append(f"No {name} in this room")
     if update_doc:
-        mongo.db.meeting_rooms.update_one(
-            {"room_name": room_name},
-            {"$set": update_doc}
-        )
-
-    # --- Always return latest state from DB ---
-    updated_room = mongo.db.meeting_rooms.find_one({"room_name": room_name}, {"_id": 0})
-    light_status = mongo.db.lights.find_one({"room": room_name}, {"_id": 0})
-
-    equipment_status = {
-        "projector": updated_room.get("has_projector", False),
-        "projector_on": updated_room.get("projector_on", False),
-        "tv": updated_room.get("has_tv", False),
-        "tv_on": updated_room.get("tv_on", False),
-        "light": True,
-        "light_on": light_status.get("is_on", False) if light_status else False
-    }
+        changes.append(("meeting_rooms", room_name, {"$set": update_doc}, False))
+
+    written = dict(zip((c[0] for c in changes), device_cache.update_many(changes)))
+    updated_room = written.get("meeting_rooms") or room
+    light = written["lights"] if "lights" in written else device_cache.get("lights", room_name)
 
     return jsonify({
         "message": f"{room_name} prepared",
         "actions": actions,
-        "equipment": equipment_status
+        "equipment": _equipment(updated_room, light)
     })
 
 
-
-
 @meeting_bp.route('/rooms/all/equipment', methods=['GET'])
+@versioned("meeting_rooms", "lights")
 def get_all_equipment_status():
     """Return unified equipment status for all meeting rooms."""
-    lights = {doc['room']: doc['is_on'] for doc in mongo.db.lights.find({})}
-
-    all_equipment = {}
-    for room in mongo.db.meeting_rooms.find({}):
-        room_name = room['room_name']
-        light_status = lights.get(room_name, False)
-
-        all_equipment[room_name] = {
-            "equipment": {
-                "projector": room.get("has_projector", False),
-                "projector_on": room.get("projector_on", False),
-                "tv": room.get("has_tv", False),
-                "tv_on": room.get("tv_on", False),
-                "light": True,
-                "light_on": light_status
-            }
-        }
+    lights = {doc['room']: doc for doc in device_cache.all("lights")}
+    all_equipment = {
+        room['room_name']: {"equipment": _equipment(room, lights.get(room['room_name']))}
+        for room in device_cache.all("meeting_rooms")
+    }
     return jsonify(all_equipment)
@@ -1,14 +1,23 @@
 # App/blueprints/parking.py
+import os
 import random
 from datetime import datetime
 from flask import Blueprint, jsonify, request
+from pymongo import ReturnDocument, UpdateOne
 from .. import mongo  # from your App/__init__.py
+from ..versions import record_write, versioned
+from ..write_behind import write_behind
 
 parking_bp = Blueprint("parking", __name__, url_prefix="/api/parking")
 
 # --- Constants ---
 STATUSES = ["available", "reserved", "guest"]
 USERS = ["Nelly", "Basil", "Admin", "Visitor1", "Guest2"]
+# Only the latest attempts stay embedded in the spot; the full history goes to
+# parking_attempts (TTL'd, see App/indexes.py)
+MAX_EMBEDDED_ATTEMPTS = int(os.getenv("PARKING_MAX_EMBEDDED_ATTEMPTS", "20"))
+# What the listing endpoints return (the polling UI never needs the attempt log)
+SPOT_LISTING = {"_id": 0, "attempts": 0}
 
 # --- Seed once (idempotent) ---
 def seed_parking_spots(count: int = 7):
@@ -28,9 +37,6 @@ def seed_parking_spots(count: int = 7):
             "users": users
         })
     mongo.db.parking_spots.insert_many(docs)
-    mongo.db.parking_spots.create_index("spot_id", unique=True)
-    mongo.db.parking_spots.create_index("spot_name", unique=True)
-    mongo.db.violations.create_index([("spot_id", 1), ("type", 1)], unique=True)
 
 # --- Helpers ---
 def _coerce_spot_identifier(data):
@@ -62,28 +68,141 @@ def _upsert_violation(spot: dict, vtype: str, users, reason: str):
         upsert=True
     )
 
-def _resolve_violation(spot_id: int, vtype: str | None = None):
+def _resolve_violation(spot_id: int, vtype: str | None = None, before: str | None = None):
     flt = {"spot_id": spot_id}
     if vtype:
         flt["type"] = vtype
+    if before:
+        # leave conflicts raised by reservers that lost against this claim
+        flt["updated_at"] = {"$lt": before}
     mongo.db.violations.update_many(
         flt,
         {"$set": {"active": False, "resolved_at": datetime.utcnow().isoformat()}}
     )
 
+def _is_free(spot: dict) -> bool:
+    return spot.get("status") == "available" or not spot.get("users")
+
+def _reserve_pipeline(user: str, ts: str):
+    """Update pipeline: append the attempt and take the spot if it is free (same rule as _is_free)."""
+    free = {"$or": [{"$eq": ["$status", "available"]},
+                    {"$eq": [{"$size": {"$ifNull": ["$users", []]}}, 0]}]}
+    attempt = {"user": {"$literal": user}, "ts": {"$literal": ts}}
+    return [
+        {"$set": {
+            "status": {"$cond": [free, "reserved", "$status"]},
+            "users": {"$cond": [free, [{"$literal": user}], "$users"]},
+            "attempts": {"$slice": [
+                {"$concatArrays": [{"$ifNull": ["$attempts", []]}, [attempt]]}, -MAX_EMBEDDED_ATTEMPTS
+            ]},
+        }},
+    ]
+
+def trim_embedded_attempts():
+    """Cut attempt arrays written before they were bounded; returns documents changed."""
+    return mongo.db.parking_spots.update_many(
+        {f"attempts.{MAX_EMBEDDED_ATTEMPTS}": {"$exists": True}},
+        [{"$set": {"attempts": {"$slice": ["$attempts", -MAX_EMBEDDED_ATTEMPTS]}}}],
+    ).modified_count
+
+def _log_attempt(spot: dict, user: str, ts: str, outcome: str):
+    write_behind.insert("parking_attempts", {
+        "spot_id": spot["spot_id"],
+        "spot_name": spot["spot_name"],
+        "user": user,
+        "outcome": outcome,
+        "ts": datetime.fromisoformat(ts),
+    })
+
+# Distinct check-in users per spot, kept in checkin_summaries:
+#   {_id: "3", spot_id: 3, day: None, users: [...], multi: bool,            (all time)
+#    reservers: [...], reserved: bool, double: bool}
+#   {_id: "3:2026-10-18", spot_id: 3, day: "2026-10-18", users: [...], ...}  (per UTC day)
+# The all-time document also holds everyone who has held or tried to reserve
+# the spot (written behind, so it trails a reservation by up to one flush), so
+# /violations is one indexed read of these documents.
+def _summary_id(spot_id, day=None):
+    return f"{spot_id}:{day}" if day else str(spot_id)
+
+def _add_checkin_user(spot: dict, user: str, day: str | None, return_document=None):
+    users = {"$setUnion": [{"$ifNull": ["$users", []]}, [{"$literal": user}]]}
+    pipeline = [
+        {"$set": {"spot_id": spot["spot_id"], "spot_name": spot["spot_name"], "day": day, "users": users}},
+        {"$set": {"multi": {"$gt": [{"$size": "$users"}, 1]}}},
+    ]
+    flt = {"_id": _summary_id(spot["spot_id"], day)}
+    if return_document is None:
+        mongo.db.checkin_summaries.update_one(flt, pipeline, upsert=True)
+        return None
+    return mongo.db.checkin_summaries.find_one_and_update(flt, pipeline, upsert=True,
+                                                         return_document=return_document)
+
+def _reservers_update(spot: dict, users, reserved: bool):
+    """Union `users` into the spot's reservers; double = reserved by one and attempted by another."""
+    return UpdateOne({"_id": _summary_id(spot["spot_id"])}, [
+        {"$set": {"spot_id": spot["spot_id"], "spot_name": spot["spot_name"], "day": None,
+                  "reservers": {"$setUnion": [{"$ifNull": ["$reservers", []]}, {"$literal": sorted(set(users))}]},
+                  "reserved": reserved}},
+        {"$set": {"double": {"$and": ["$reserved", {"$gt": [{"$size": "$reservers"}, 1]}]}}},
+    ], upsert=True)
+
+def rebuild_reservation_summaries():
+    """Fold the holders and logged attempts of reserved spots into checkin_summaries; unions, so safe while live."""
+    spots = list(mongo.db.parking_spots.find({"status": "reserved"},
+                                             {"_id": 0, "spot_id": 1, "spot_name": 1, "users": 1, "attempts.user": 1}))
+    logged = {
+        row["_id"]: row["users"]
+        for row in mongo.db.parking_attempts.aggregate([
+            {"$match": {"spot_id": {"$in": [s["spot_id"] for s in spots]}}},
+            {"$group": {"_id": "$spot_id", "users": {"$addToSet": "$user"}}},
+        ])
+    } if spots else {}
+    ops = []
+    for spot in spots:
+        users = set(spot.get("users", [])) | {a.get("user") for a in spot.get("attempts", [])}
+        users |= set(logged.get(spot["spot_id"], []))
+        ops.append(_reservers_update(spot, {u for u in users if u}, True))
+    if ops:
+        mongo.db.checkin_summaries.bulk_write(ops, ordered=False)
+    return len(ops)
+
+def rebuild_checkin_summaries():
+    """(Re)build checkin_summaries from the raw check-ins; unions, so it's safe while live."""
+    day = {"$substrBytes": ["$timestamp", 0, 10]}
+    rows = mongo.db.checkins.aggregate([
+        {"$group": {"_id": {"spot_id": "$spot_id", "day": day},
+                    "spot_name": {"$first": "$spot_name"}, "users": {"$addToSet": "$user"}}},
+    ])
+    merged = {}
+    for row in rows:
+        spot = {"spot_id": row["_id"]["spot_id"], "spot_name": row["spot_name"]}
+        for d in (row["_id"]["day"], None):
+            key = _summary_id(spot["spot_id"], d)
+            merged.setdefault(key, ({**spot, "day": d}, set()))[1].update(row["users"])
+    coll = mongo.db.checkin_summaries
+    for key, (fields, users) in merged.items():
+        coll.update_one({"_id": key}, [
+            {"$set": {**fields, "users": {"$setUnion": [{"$ifNull": ["$users", []]}, {"$literal": sorted(users)}]}}},
+            {"$set": {"multi": {"$gt": [{"$size": "$users"}, 1]}}},
+        ], upsert=True)
+    return len(merged)
+
 # ---------------- API ROUTES ----------------
 
 @parking_bp.route("/spots/all", methods=["GET"])
+@versioned("parking_spots")
 def get_all_spots():
-    docs = list(mongo.db.parking_spots.find({}, {"_id": 0}))
+    docs = list(mongo.db.parking_spots.find({}, SPOT_LISTING))
     return jsonify({"spots": docs})
 
 @parking_bp.route("/spots/available", methods=["GET"])
+@versioned("parking_spots")
 def get_available_spots():
-    docs = list(mongo.db.parking_spots.find({"status": "available"}, {"_id": 0}))
+    docs = list(mongo.db.parking_spots.find({"status": "available"}, SPOT_LISTING))
     return jsonify({"spots": docs})
 
 @parking_bp.route("/my-reservations", methods=["GET"])
+@versioned("parking_spots")
 def my_reservations():
     user = request.args.get("user")
     if not user:
@@ -108,16 +227,18 @@ def checkin_spot():
         return jsonify({"error": "Invalid spot"}), 404
 
     if spot["status"] in ("reserved", "guest"):
+        now = datetime.utcnow()
         mongo.db.checkins.insert_one({
             "spot_id": spot["spot_id"],
             "spot_name": spot["spot_name"],
             "user": user,
-            "timestamp": datetime.utcnow().isoformat()
+            "timestamp": now.isoformat()
         })
 
-        distinct_users = {d["user"] for d in mongo.db.checkins.find(
-            {"spot_id": spot["spot_id"]}, {"_id": 0, "user": 1}
-        )}
+        # O(1): add the user to the spot's running set instead of re-reading its check-ins
+        summary = _add_checkin_user(spot, user, None, ReturnDocument.AFTER)
+        _add_checkin_user(spot, user, now.date().isoformat())
+        distinct_users = set(summary["users"])
         if len(distinct_users) > 1:
             _upsert_violation(
                 spot,
@@ -148,26 +269,32 @@ def reserve_spot():
     if err:
         return err
 
-    spot = mongo.db.parking_spots.find_one(flt)
+    # One atomic round trip: log the attempt and claim the spot only if it is free.
+    # Returns the document as it was *before*, so we can tell who won.
+    ts = datetime.utcnow().isoformat()
+    spot = mongo.db.parking_spots.find_one_and_update(
+        flt, _reserve_pipeline(user, ts), return_document=ReturnDocument.BEFORE
+    )
     if not spot:
         return jsonify({"error": "Invalid spot"}), 404
 
     users = spot.get("users", [])
-
-    attempt_doc = {"user": user, "ts": datetime.utcnow().isoformat()}
-    mongo.db.parking_spots.update_one(flt, {"$push": {"attempts": attempt_doc}})
-
-    if spot.get("status") == "available" or not users:
-        mongo.db.parking_spots.update_one(
-            flt,
-            {"$set": {"status": "reserved", "users": [user]}}
-        )
-        _resolve_violation(spot["spot_id"], "double_booking")
+    free = _is_free(spot)
+    # a set union, so it is safe to write behind (and to replay)
+    write_behind.submit("checkin_summaries",
+                        _reservers_update(spot, [user] + ([] if free else users), free or spot.get("status") == "reserved"))
+
+    if free:
+        _log_attempt(spot, user, ts, "reserved")
+        record_write("parking_spots", spot["spot_name"])
+        _resolve_violation(spot["spot_id"], "double_booking", before=ts)
         return jsonify({"message": f"Spot {spot['spot_name']} reserved for {user}"}), 200
 
     if user in users:
+        _log_attempt(spot, user, ts, "already_reserved")
         return jsonify({"message": f"Spot {spot['spot_name']} already reserved for {user}"}), 200
 
+    _log_attempt(spot, user, ts, "conflict")
     all_users = set(users) | {user}
     _upsert_violation(
         spot,
@@ -190,53 +317,48 @@ def guest_spot():
     if err:
         return err
 
-    spot = mongo.db.parking_spots.find_one(flt)
+    # conditional update so a guest pass can't overwrite a reservation made in between
+    spot = mongo.db.parking_spots.find_one_and_update(
+        {**flt, "status": "available"}, {"$set": {"status": "guest", "users": [user]}}
+    )
     if not spot:
-        return jsonify({"error": "Invalid spot"}), 404
-    if spot["status"] != "available":
+        spot = mongo.db.parking_spots.find_one(flt, {"spot_name": 1})
+        if not spot:
+            return jsonify({"error": "Invalid spot"}), 404
         return jsonify({"error": f"Spot {spot['spot_name']} is not available"}), 409
 
-    mongo.db.parking_spots.update_one(flt, {"$set": {"status": "guest", "users": [user]}})
+    record_write("parking_spots", spot["spot_name"])
     return jsonify({"message": f"Spot {spot['spot_name']} assigned as guest pass for {user}!"})
 
 @parking_bp.route("/violations", methods=["GET"])
 def get_violations():
     spot_filter = request.args.get("spot_id", type=int)
-    violations = []
-    spots = list(mongo.db.parking_spots.find({}, {"_id": 0}))
-
-    for spot in spots:
-        if spot_filter and spot["spot_id"] != spot_filter:
-            continue
-
-        status = spot.get("status")
-        users = set(spot.get("users", []))
-        attempt_users = {a.get("user") for a in spot.get("attempts", []) if a.get("user")}
-        all_reservation_users = users | attempt_users
-
-        # --- Scenario 1: Double booking / conflicting reservations ---
-        if status == "reserved" and len(all_reservation_users) > 1:
-            violations.append({
-                "spot_id": spot["spot_id"],
-                "users": sorted(all_reservation_users),
+    day = request.args.get("day")   # YYYY-MM-DD: only check-ins of that day
+
+    # One indexed read of checkin_summaries: the all-time documents of double-booked
+    # spots and the (day's) documents with several checked-in users
+    branches = [{"day": None, "double": True}, {"day": day, "multi": True}]
+    if spot_filter:
+        for branch in branches:
+            branch["spot_id"] = spot_filter
+    proj = {"_id": 0, "spot_id": 1, "day": 1, "users": 1, "multi": 1, "reservers": 1, "double": 1}
+    double, multi = [], []
+    for summary in mongo.db.checkin_summaries.find({"$or": branches}, proj).sort("spot_id"):
+        # --- Scenario 1: Double booking / conflicting reservations (reserved spots only) ---
+        if summary.get("day") is None and summary.get("double"):
+            double.append({
+                "spot_id": summary["spot_id"],
+                "users": sorted(summary["reservers"]),
                 "violation_reason": "Conflicting reservations (double booking attempt)"
             })
-
-    # --- Scenario 2: Multiple check-ins ---
-    checkins = list(mongo.db.checkins.find({}, {"_id": 0}))
-    checkin_map = {}
-    for ci in checkins:
-        sid = ci["spot_id"]
-        if spot_filter and sid != spot_filter:
-            continue
-        checkin_map.setdefault(sid, set()).add(ci["user"])
-    for sid, u in checkin_map.items():
-        if len(u) > 1:
-            violations.append({
-                "spot_id": sid,
-                "users": sorted(u),
+        # --- Scenario 2: Multiple check-ins ---
+        if summary.get("day") == day and summary.get("multi"):
+            multi.append({
+                "spot_id": summary["spot_id"],
+                "users": sorted(summary["users"]),
                 "violation_reason": "Multiple users checked in to same spot"
             })
+    violations = double + multi
 
     return jsonify({"count": len(violations), "violations": violations})
 
@@ -256,14 +378,3 @@ def resolve_violation():
         return jsonify({"error": "spot_id is required"}), 400
     _resolve_violation(int(spot_id), vtype)
     return jsonify({"message": "resolved"}), 200
-
-# --- Reset DB on first run (single hook) ---
-_seeded = False
-@parking_bp.before_app_request
-def _ensure_seed_once():
-    global _seeded
-    if not _seeded:
-        mongo.db.parking_spots.delete_many({})
-        mongo.db.checkins.delete_many({})
-        seed_parking_spots()
-        _seeded = True
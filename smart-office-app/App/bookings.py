@@ -0,0 +1,258 @@
+# App/bookings.py
+# Meeting-room booking engine. Bookings live in room_bookings, one document per room:
+#   {_id: room_name, bookings: [{id, start, end, user, title}], updated_at}
+# A booking is added by a single update that only matches while nothing in the
+# room overlaps it, so two requests for the same slot can't both succeed.
+# Each process keeps an interval index (per room: bookings sorted by start) for
+# conflict checks in O(log n) and free-room searches; it follows other
+# writers incrementally through updated_at. Ended bookings simply stop
+# overlapping anything (no expiry polling) and are dropped from the room
+# document on its next write; the meeting_rooms mirror of the running booking
+# is moved along at each start/end by the leader's room-status loop.
+import bisect
+import datetime
+import os
+import threading
+
+from bson import ObjectId
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError, PyMongoError
+
+from . import mongo
+from .versions import record_write, versions
+
+# Ended bookings stay visible (room history, my bookings) this long
+BOOKING_RETENTION_HOURS = float(os.getenv("BOOKING_RETENTION_HOURS", "24"))
+# Re-read documents written up to this long before the newest one we saw (writers' commit order)
+BOOKING_SYNC_OVERLAP = datetime.timedelta(seconds=5)
+
+
+def to_utc(value):
+    """ISO-8601 string (or datetime) -> naive UTC datetime, None if unparseable."""
+    if isinstance(value, str):
+        try:
+            value = datetime.datetime.fromisoformat(value)
+        except ValueError:
+            return None
+    if not isinstance(value, datetime.datetime):
+        return None
+    if value.tzinfo is not None:
+        value = value.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return value
+
+
+class RoomSchedule:
+    """Non-overlapping bookings of one room, sorted by start."""
+
+    __slots__ = ("starts", "bookings", "updated_at")
+
+    def __init__(self, bookings=(), updated_at=None):
+        self.bookings = sorted(bookings, key=lambda b: b["start"])
+        self.starts = [b["start"] for b in self.bookings]
+        self.updated_at = updated_at
+
+    def conflict(self, start, end):
+        """The booking overlapping [start, end), or None."""
+        # ends are sorted too (no overlaps), so only the last booking starting before `end` can overlap
+        i = bisect.bisect_left(self.starts, end)
+        if i and self.bookings[i - 1]["end"] > start:
+            return self.bookings[i - 1]
+        return None
+
+    def last_boundary(self, now):
+        """The latest booking start or end at or before `now`, or None."""
+        i = bisect.bisect_right(self.starts, now)
+        if not i:
+            return None
+        booking = self.bookings[i - 1]
+        return booking["end"] if booking["end"] <= now else booking["start"]
+
+    def between(self, start, end):
+        """Bookings overlapping [start, end), in order."""
+        i = bisect.bisect_left(self.starts, end)
+        out = []
+        while i and self.bookings[i - 1]["end"] > start:
+            i -= 1
+            out.append(self.bookings[i])
+        return out[::-1]
+
+
+class BookingIndex:
+    def __init__(self):
+        self._rooms = {}                # room -> RoomSchedule
+        self._version = None
+        self._watermark = None          # newest updated_at seen
+        self._lock = threading.Lock()
+
+    # ---- sync ----
+    def sync(self):
+        """Pick up writes from other processes (one version check; a read only if something changed)."""
+        try:
+            version = versions.current("room_bookings")[0]
+        except PyMongoError:
+            version = None              # can't tell -> re-read what changed recently
+        with self._lock:
+            if version is not None and version == self._version:
+                return
+            watermark = self._watermark
+        flt = {} if watermark is None else {"updated_at": {"$gte": watermark - BOOKING_SYNC_OVERLAP}}
+        for doc in mongo.db.room_bookings.find(flt):
+            self._apply(doc)
+        with self._lock:
+            self._version = version
+
+    def _apply(self, doc):
+        with self._lock:
+            known = self._rooms.get(doc["_id"])
+            if known and known.updated_at and doc.get("updated_at") and doc["updated_at"] < known.updated_at:
+                return                  # an older copy (re-read by sync) than the one we already have
+            self._rooms[doc["_id"]] = RoomSchedule(doc.get("bookings") or [], doc.get("updated_at"))
+            if doc.get("updated_at") and (self._watermark is None or doc["updated_at"] > self._watermark):
+                self._watermark = doc["updated_at"]
+
+    def clear(self):
+        with self._lock:
+            self._rooms, self._version, self._watermark = {}, None, None
+
+    # ---- queries ----
+    def conflict(self, room, start, end):
+        with self._lock:
+            schedule = self._rooms.get(room)
+        return schedule.conflict(start, end) if schedule else None
+
+    def between(self, room, start, end):
+        with self._lock:
+            schedule = self._rooms.get(room)
+        return schedule.between(start, end) if schedule else []
+
+    def current(self, room, now=None):
+        """
+        (booking running at `now` or None, updated_at of the room's bookings
+        document, latest booking start/end at or before `now`).
+        """
+        now = now or datetime.datetime.utcnow()
+        with self._lock:
+            schedule = self._rooms.get(room)
+        if not schedule:
+            return None, None, None
+        running = schedule.conflict(now, now + datetime.timedelta(microseconds=1))
+        return running, schedule.updated_at, schedule.last_boundary(now)
+
+    def due(self, since, now):
+        """Rooms whose running booking may have changed in (since, now]; every known room if since is None."""
+        with self._lock:
+            schedules = dict(self._rooms)
+        if since is None:
+            return list(schedules)
+        return [
+            room for room, s in schedules.items()
+            if (s.last_boundary(now) or since) > since or (s.updated_at and s.updated_at > since)
+        ]
+
+    def free_rooms(self, rooms, start, end):
+        """The names in `rooms` with nothing booked in [start, end)."""
+        self.sync()
+        with self._lock:
+            schedules = dict(self._rooms)
+        return [r for r in rooms if r not in schedules or schedules[r].conflict(start, end) is None]
+
+    # ---- writes ----
+    def book(self, room, start, end, user=None, title=None, booking_id=None):
+        """
+        Reserve [start, end) in `room`. Returns (booking, None) on success or
+        (None, conflicting booking) when the slot is taken.
+        """
+        self.sync()
+        taken = self.conflict(room, start, end)
+        if taken:
+            return None, taken          # rejected without a round trip
+
+        # ObjectIds are unique across processes and within the same second
+        booking = {"id": booking_id or f"bk-{ObjectId()}", "start": start, "end": end, "user": user, "title": title}
+        cutoff = datetime.datetime.utcnow() - datetime.timedelta(hours=BOOKING_RETENTION_HOURS)
+        try:
+            doc = mongo.db.room_bookings.find_one_and_update(
+                # matches only while no existing booking overlaps [start, end)
+                {"_id": room, "bookings": {"$not": {"$elemMatch": {"start": {"$lt": end}, "end": {"$gt": start}}}}},
+                [{"$set": {
+                    "bookings": {"$concatArrays": [
+                        {"$filter": {"input": {"$ifNull": ["$bookings", []]}, "as": "b",
+                                     "cond": {"$gt": ["$$b.end", cutoff]}}},
+                        [{"$literal": booking}],
+                    ]},
+                    "updated_at": "$$NOW",
+                }}],
+                upsert=True,
+                return_document=ReturnDocument.AFTER,
+            )
+        except DuplicateKeyError:
+            doc = None                  # the room document exists but the guard failed: overlap
+        if doc is None:
+            self._refresh(room)
+            return None, self.conflict(room, start, end) or {}
+        record_write("room_bookings")
+        self._apply(doc)
+        return booking, None
+
+    def extend(self, booking_id, extra, attempts=20):
+        """
+        Move a booking's end `extra` later. Compare-and-set on the end we read,
+        retried when a concurrent extension got there first, so none is lost.
+        Returns (room, booking, None) or (room, None, reason) with reason
+        "not_found", "conflict" (the next booking is in the way) or "busy".
+        """
+        room = None
+        for _ in range(attempts):
+            doc = mongo.db.room_bookings.find_one({"bookings.id": booking_id})
+            booking = next((b for b in (doc or {}).get("bookings", []) if b["id"] == booking_id), None)
+            if booking is None:
+                return room, None, "not_found"
+            room, old_end = doc["_id"], booking["end"]
+            new_end = old_end + extra
+            if any(b["id"] != booking_id and b["start"] < new_end and b["end"] > old_end for b in doc["bookings"]):
+                self._apply(doc)
+                return room, None, "conflict"
+            updated = mongo.db.room_bookings.find_one_and_update(
+                {"_id": room, "$and": [
+                    {"bookings": {"$elemMatch": {"id": booking_id, "end": old_end}}},
+                    {"bookings": {"$not": {"$elemMatch": {"id": {"$ne": booking_id},
+                                                          "start": {"$lt": new_end}, "end": {"$gt": old_end}}}}},
+                ]},
+                {"$set": {"bookings.$[b].end": new_end}, "$currentDate": {"updated_at": True}},
+                array_filters=[{"b.id": booking_id}],
+                return_document=ReturnDocument.AFTER,
+            )
+            if updated is not None:
+                record_write("room_bookings")
+                self._apply(updated)
+                return room, {**booking, "end": new_end}, None
+        return room, None, "busy"
+
+    def cancel(self, booking_id):
+        """Remove a booking; returns its room, or None if there is no such booking."""
+        doc = mongo.db.room_bookings.find_one_and_update(
+            {"bookings.id": booking_id},
+            [{"$set": {
+                "bookings": {"$filter": {"input": "$bookings", "as": "b", "cond": {"$ne": ["$$b.id", booking_id]}}},
+                "updated_at": "$$NOW",
+            }}],
+            return_document=ReturnDocument.AFTER,
+        )
+        if doc is None:
+            return None
+        record_write("room_bookings")
+        self._apply(doc)
+        return doc["_id"]
+
+    def _refresh(self, room):
+        doc = mongo.db.room_bookings.find_one({"_id": room})
+        if doc:
+            self._apply(doc)
+
+
+def public(booking):
+    return {**booking, "start": booking["start"].isoformat(), "end": booking["end"].isoformat()}
+
+
+# Shared per-process index
+booking_index = BookingIndex()
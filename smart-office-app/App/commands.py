@@ -0,0 +1,92 @@
+# App/commands.py
+# One-shot maintenance commands, run from smart-office-app/ with:
+#   python -m App.commands <command>
+import click
+from flask.cli import FlaskGroup
+
+
+def register_commands(app):
+    """Attach the maintenance CLI commands to the app."""
+
+    @app.cli.command("seed")
+    @click.option("--reset", is_flag=True, help="Wipe device state, bookings and parking first")
+    def seed(reset):
+        """Seed rooms, devices and parking spots (idempotent) and create indexes."""
+        from .seed import seed_all
+        seed_all(reset=reset)
+        click.echo("seeded" + (" (after reset)" if reset else ""))
+
+    @app.cli.command("backfill-executions")
+    def backfill_executions():
+        """Add created_ts/energy fields to old automation_executions."""
+        from .blueprints.automation_rules import backfill_execution_fields
+        click.echo(f"updated {backfill_execution_fields()} executions")
+
+    @app.cli.command("migrate-hvac-schedules")
+    def migrate_hvac_schedules():
+        """Store hvac_schedules start/end as BSON dates and create their indexes."""
+        from .hvac_scheduler import ensure_indexes, migrate_schedules
+        converted, bad = migrate_schedules()
+        ensure_indexes()
+        click.echo(f"converted {converted} schedules ({bad} with unparseable times left as-is)")
+
+    @app.cli.command("rebuild-energy-rollups")
+    @click.option("--since", default=None, help="First day to rebuild (YYYY-MM-DD); default: all history")
+    def rebuild_energy_rollups(since):
+        """Recompute energy_savings_daily from automation_executions."""
+        from .blueprints.automation_rules import backfill_execution_fields
+        from . import savings_rollups
+        backfill_execution_fields()
+        click.echo(f"rebuilt {savings_rollups.rebuild(since)} daily rollups")
+
+    @app.cli.command("check-energy-rollups")
+    @click.option("--since", default=None, help="First day to check (YYYY-MM-DD); default: all history")
+    def check_energy_rollups(since):
+        """Compare energy_savings_daily against a raw recomputation (exit 1 on mismatch)."""
+        from . import savings_rollups
+        problems = savings_rollups.check(since)
+        for p in problems:
+            click.echo(p)
+        if problems:
+            raise SystemExit(1)
+        click.echo("energy rollups consistent")
+
+    @app.cli.command("audit-queries")
+    @click.option("--no-create", is_flag=True, help="Audit the indexes as they are, without creating missing ones")
+    def audit_queries(no_create):
+        """explain() every registered query shape (exit 1 if any is a COLLSCAN)."""
+        from .indexes import audit, ensure_indexes
+        if not no_create:
+            ensure_indexes()
+        scans = 0
+        for coll, flt, stages, collscan in audit():
+            scans += collscan
+            click.echo(f"{'COLLSCAN' if collscan else 'ok':8} {coll} {flt} -> {' > '.join(stages)}")
+        if scans:
+            click.echo(f"{scans} query shape(s) scan a whole collection")
+            raise SystemExit(1)
+
+    @app.cli.command("bench-prepare")
+    @click.option("--room", default="london", help="Meeting room to copy into the throwaway benchmark database")
+    @click.option("--clients", default=32, help="Concurrent client threads")
+    @click.option("--requests", "requests_", default=2000, help="Total requests per variant")
+    def bench_prepare(room, clients, requests_):
+        """Latency of the room-prepare path vs the old five-round-trip flow, under concurrent load."""
+        from . import create_app, mongo
+        from .bench import bench_prepare as run, scratch_copy, with_database
+        with scratch_copy(mongo.db, room) as scratch:
+            bench_app = create_app({"MONGO_URI": with_database(app.config["MONGO_URI"], scratch.name),
+                                    "BENCH_ENDPOINTS": True})
+            for line in run(bench_app, room, clients, requests_):
+                click.echo(line)
+
+
+def _create_app():
+    from . import create_app
+    return create_app()
+
+
+cli = FlaskGroup(create_app=_create_app)
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,227 @@
+# App/device_cache.py
+# Read-through / write-through cache of the small device-state collections
+# (lights, room_states, meeting_rooms), shared by all blueprints.
+# Each collection is cached whole and tagged with its collection_versions
+# counter (App/versions.py); a write anywhere bumps that counter, so a copy is
+# at most VERSION_CACHE_SECONDS stale across replicas (DEVICE_CACHE_TTL_SECONDS
+# bounds it even if the counters can't be read).
+import copy
+import datetime
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, PyMongoError
+
+from . import mongo
+from . import journal
+from .live import live_bus
+from .metering import METER_FIELDS, metered_update
+from .versions import record_write, versions
+
+DEVICE_CACHE_ENABLED = os.getenv("DEVICE_CACHE_ENABLED", "1") == "1"
+DEVICE_CACHE_TTL_SECONDS = float(os.getenv("DEVICE_CACHE_TTL_SECONDS", "30"))
+# Writes of one request that touch several collections go out side by side
+DEVICE_WRITE_THREADS = int(os.getenv("DEVICE_WRITE_THREADS", "8"))
+
+# collection -> key field
+DEVICE_COLLECTIONS = {"lights": "room", "room_states": "room", "meeting_rooms": "room_name"}
+# what readers get back (meter bookkeeping stays internal, see App/metering.py)
+DEVICE_PROJECTION = {"_id": 0, **{f: 0 for f in METER_FIELDS}}
+
+
+class DeviceCache:
+    def __init__(self, enabled=DEVICE_CACHE_ENABLED, ttl=DEVICE_CACHE_TTL_SECONDS):
+        self.enabled = enabled
+        self.ttl = ttl
+        self._data = {}                 # collection -> (version, loaded_at, {key: doc})
+        self._lock = threading.Lock()
+        self._inflight = set()          # bookkeeping futures of update_many
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def hit_ratio(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def _version(self, collection):
+        try:
+            return versions.current(collection)[0]
+        except PyMongoError:
+            return None                 # fall back to the TTL alone
+
+    def _docs(self, collection):
+        """{key: doc} for a collection, from memory when still current."""
+        version = self._version(collection)
+        with self._lock:
+            entry = self._data.get(collection)
+            if entry and entry[0] == version and time.monotonic() - entry[1] < self.ttl:
+                self.hits += 1
+                return entry[2]
+            self.misses += 1
+        field = DEVICE_COLLECTIONS[collection]
+        docs = {d[field]: d for d in mongo.db[collection].find({}, DEVICE_PROJECTION) if d.get(field) is not None}
+        if self.enabled:
+            with self._lock:
+                self._data[collection] = (version, time.monotonic(), docs)
+        return docs
+
+    # ---- reads ----
+    def get(self, collection, key):
+        doc = self._docs(collection).get(key)
+        return copy.deepcopy(doc) if doc is not None else None
+
+    def all(self, collection):
+        return [copy.deepcopy(d) for d in self._docs(collection).values()]
+
+    # ---- writes ----
+    def update(self, collection, key, update, upsert=False):
+        """
+        Apply `update` ({"$set": ...}) to one document, keep the cache in step,
+        return the new document (or None). Lights/room_states writes also accrue
+        the energy drawn under the old state (App/metering.py).
+        """
+        return self.update_many([(collection, key, update, upsert)])[0]
+
+    def update_many(self, changes):
+        """
+        [(collection, key, update, upsert)] for different documents (e.g. a room's
+        light and its meeting-room equipment). The writes go out side by side and
+        are the only round trip the caller waits for: this process sees them at
+        once (cache and a provisional version, see Versions.mark_pending), while
+        the version bumps, journal entries and live pushes follow on the writer
+        pool. Returns the new documents in the same order.
+        """
+        pool = _writers()
+        if len(changes) == 1:
+            docs = [self._write(*changes[0])]
+        else:
+            docs = list(pool.map(lambda change: self._write(*change), changes))
+
+        written = {}                    # collection -> [(key, fields, doc)]
+        for (collection, key, update, _upsert), doc in zip(changes, docs):
+            if doc is not None:
+                written.setdefault(collection, []).append((key, update["$set"], doc))
+        for collection, entries in written.items():
+            with self._lock:
+                previous, provisional = versions.mark_pending(collection)
+                entry = self._data.get(collection)
+                # a copy that was current stays current (under the provisional version) with our writes in it
+                if entry is not None and entry[0] == previous:
+                    self._data[collection] = (provisional, entry[1], {**entry[2], **{k: d for k, _f, d in entries}})
+            # both only once the writes are acknowledged: a reader seeing the new version must find the new state
+            self._track(_bookkeepers().submit(self._after_write, collection, entries, previous, provisional))
+        return [copy.deepcopy(doc) if doc is not None else None for doc in docs]
+
+    def _after_write(self, collection, entries, previous, provisional):
+        """Bookkeeping of acknowledged writes: version bump, journal entries, live pushes."""
+        try:
+            new_version = record_write(collection, pending=True)
+            with self._lock:
+                entry = self._data.get(collection)
+                # adopt the bumped version only if nobody else wrote in between
+                if entry is not None and entry[0] == provisional and new_version and _next(previous) == new_version:
+                    self._data[collection] = (new_version, entry[1], entry[2])
+            journal.record(collection, [(key, fields) for key, fields, _doc in entries])
+            for key, _fields, doc in entries:
+                live_bus.touch(collection, key, doc)
+        except Exception as e:
+            print(f"⚠️ {collection} write bookkeeping failed:", e)
+
+    def _track(self, future):
+        with self._lock:
+            self._inflight.add(future)
+        future.add_done_callback(self._untrack)
+
+    def _untrack(self, future):
+        with self._lock:
+            self._inflight.discard(future)
+
+    def drain(self, timeout=None):
+        """Wait for the bookkeeping of writes made so far (tests, benchmarks)."""
+        with self._lock:
+            inflight = list(self._inflight)
+        wait(inflight, timeout)
+
+    def _write(self, collection, key, update, upsert=False):
+        field = DEVICE_COLLECTIONS[collection]
+        return mongo.db[collection].find_one_and_update(
+            {field: key}, metered_update(collection, update), projection=DEVICE_PROJECTION, upsert=upsert,
+            return_document=ReturnDocument.AFTER,
+        )
+
+    def bulk_update(self, collection, changes):
+        """
+        Apply [(key, update, upsert)] with one unordered bulk_write, then bump the
+        version once and reload the collection once (instead of per document).
+        Returns the bulk result details ("upserted"/"writeErrors" refer to
+        indexes in `changes`).
+        """
+        field = DEVICE_COLLECTIONS[collection]
+        now = datetime.datetime.utcnow()
+        try:
+            details = mongo.db[collection].bulk_write(
+                [UpdateOne({field: key}, metered_update(collection, update, now), upsert=upsert) for key, update, upsert in changes],
+                ordered=False,
+            ).bulk_api_result
+        except BulkWriteError as e:
+            details = e.details         # the other changes were still applied
+        record_write(collection)
+        docs = self._docs(collection)
+        failed = {err["index"] for err in details.get("writeErrors", [])}
+        applied = [(key, update) for i, (key, update, _upsert) in enumerate(changes) if i not in failed and key in docs]
+        journal.record(collection, [(key, update["$set"]) for key, update in applied])
+        for key, _update in applied:
+            live_bus.touch(collection, key, docs[key])
+        return details
+
+    def warm(self):
+        for collection in DEVICE_COLLECTIONS:
+            self._docs(collection)
+
+    def invalidate(self, collection=None):
+        with self._lock:
+            if collection is None:
+                self._data.clear()
+            else:
+                self._data.pop(collection, None)
+
+    def __len__(self):
+        with self._lock:
+            return sum(len(e[2]) for e in self._data.values())
+
+
+_executors = {}
+_executor_lock = threading.Lock()
+
+
+def _pool(name):
+    # created on first use, i.e. in the worker after gunicorn forks
+    with _executor_lock:
+        if name not in _executors:
+            _executors[name] = ThreadPoolExecutor(max_workers=DEVICE_WRITE_THREADS, thread_name_prefix=f"device-{name}")
+        return _executors[name]
+
+
+def _writers():
+    return _pool("write")
+
+
+def _bookkeepers():
+    # separate from the writers, so bookkeeping never queues a request's writes
+    return _pool("bookkeeping")
+
+
+def _next(version):
+    """'epoch.n' -> 'epoch.n+1' (None if the version is unknown)."""
+    if not version or "." not in version:
+        return None
+    epoch, n = version.rsplit(".", 1)
+    return f"{epoch}.{int(n) + 1}"
+
+
+# Shared per-process cache
+device_cache = DeviceCache()
@@ -0,0 +1,206 @@
+# App/hvac_scheduler.py
+import datetime
+import heapq
+import itertools
+import os
+import threading
+
+from bson import ObjectId
+from pymongo.errors import PyMongoError
+
+from . import mongo
+from .device_cache import device_cache
+from .utils import parse_time
+from .versions import versions
+
+# Safety net: full look for schedules inserted by other processes (seconds). New
+# schedules bump the hvac_schedules version, which the loop checks on every wake.
+HVAC_RESYNC_SECONDS = float(os.getenv("HVAC_RESYNC_SECONDS", "30"))
+# Longest single sleep, so a lost leader lease and new schedules are noticed
+# quickly (the version check reads at most once per VERSION_CACHE_SECONDS)
+MAX_SLEEP_SECONDS = 1.0
+# Finished schedules are removed by a TTL index this long after their end
+HVAC_SCHEDULE_RETENTION_DAYS = int(os.getenv("HVAC_SCHEDULE_RETENTION_DAYS", "30"))
+
+
+def ensure_indexes():
+    """Indexes the scheduler relies on (start/end must be BSON dates, see migrate_schedules)."""
+    from .indexes import ensure_indexes as ensure_registered
+    ensure_registered(collections=["hvac_schedules"])
+
+
+def migrate_schedules():
+    """Convert legacy string start/end values to BSON dates; returns (converted, unparseable)."""
+    coll = mongo.db.hvac_schedules
+    converted, bad = 0, 0
+    for doc in coll.find({"$or": [{"start": {"$type": "string"}}, {"end": {"$type": "string"}}]}):
+        start, end = parse_time(doc.get("start")), parse_time(doc.get("end"))
+        if not start or not end:
+            bad += 1
+            continue
+        coll.update_one({"_id": doc["_id"]}, {"$set": {"start": start, "end": end}})
+        converted += 1
+    return converted, bad
+
+
+class HvacScheduler:
+    """
+    Event-driven replacement for the old 5-second HVAC polling loop.
+    Pending schedules sit in a heap of (boundary time, kind, schedule id); the
+    thread sleeps until the next start/end boundary (or until set_hvac_schedule
+    wakes it) and writes room_states only when a schedule starts or ends.
+    """
+
+    def __init__(self, resync_interval=HVAC_RESYNC_SECONDS):
+        self.resync_interval = resync_interval
+        self._heap = []
+        self._schedules = {}            # _id -> (room, start, end, temperature, active)
+        self._seq = itertools.count()
+        self._loaded_at = None          # utc time of the last load, for incremental resyncs
+        self._version = None            # hvac_schedules version as of the last load
+        self._running = False
+        self._cond = threading.Condition()
+
+    # ---- feeding ----
+    def _push(self, doc, now):
+        """Track one schedule document; returns True if it still has a boundary ahead."""
+        if doc["_id"] in self._schedules:
+            return False                # already tracked (e.g. added directly, then resynced)
+        start, end = parse_time(doc.get("start")), parse_time(doc.get("end"))
+        room = doc.get("room")
+        if not all([start, end, room]):
+            return False
+        if now > end:
+            if doc.get("active", False):
+                # ended while nobody was watching -> close it now
+                self._schedules[doc["_id"]] = (room, start, end, doc.get("temperature"), True)
+                heapq.heappush(self._heap, (now, next(self._seq), "end", doc["_id"]))
+                return True
+            return False
+        self._schedules[doc["_id"]] = (room, start, end, doc.get("temperature"), doc.get("active", False))
+        heapq.heappush(self._heap, (max(start, now), next(self._seq), "start", doc["_id"]))
+        heapq.heappush(self._heap, (end, next(self._seq), "end", doc["_id"]))
+        return True
+
+    def _load(self):
+        """
+        First call loads active and upcoming schedules (indexed on end/active);
+        afterwards only schedules inserted since the last load.
+        """
+        self._version = self._current_version()
+        query = {"$or": [{"end": {"$gte": datetime.datetime.now()}}, {"active": True}]}
+        if self._loaded_at is not None:
+            # overlap one resync interval so inserts racing the previous load aren't missed
+            since = self._loaded_at - datetime.timedelta(seconds=self.resync_interval)
+            query = {"_id": {"$gte": ObjectId.from_datetime(since)}}
+        self._loaded_at = datetime.datetime.utcnow()
+        now = datetime.datetime.now()
+        docs = list(mongo.db.hvac_schedules.find(query))
+        with self._cond:
+            for doc in docs:
+                self._push(doc, now)
+        return len(docs)
+
+    def _current_version(self):
+        try:
+            return versions.current("hvac_schedules")[0]
+        except PyMongoError:
+            return None
+
+    def _changed(self):
+        """Whether a schedule was added anywhere since the last load (set_hvac_schedule bumps the version)."""
+        version = self._current_version()
+        return version is not None and version != self._version
+
+    def add(self, doc):
+        """Pick up a schedule just inserted by set_hvac_schedule in this process (no wait at all)."""
+        if not self._running:
+            return
+        with self._cond:
+            if self._push(doc, datetime.datetime.now()):
+                self._cond.notify()
+
+    # ---- transitions ----
+    def _start(self, sid):
+        with self._cond:
+            room, start, end, temp, active = self._schedules[sid]
+        device_cache.update("room_states", room, {"$set": {"ac_on": True, "temperature": temp}}, upsert=True)
+        if not active:
+            mongo.db.hvac_schedules.update_one({"_id": sid}, {"$set": {"active": True}})
+            with self._cond:
+                if sid in self._schedules:
+                    self._schedules[sid] = (room, start, end, temp, True)
+        print(f"✅ Schedule started for {room} at {temp}°C")
+
+    def _still_running(self, room, now):
+        """The latest-started other schedule keeping `room` on at `now`, or None (caller holds _cond)."""
+        running = [s for s in self._schedules.values() if s[0] == room and s[1] <= now < s[2]]
+        return max(running, key=lambda s: s[1], default=None)
+
+    def _end(self, sid):
+        with self._cond:
+            room, _start, _end, _temp, active = self._schedules.pop(sid)
+            other = self._still_running(room, datetime.datetime.now()) if active else None
+        if not active:
+            return
+        if other:
+            # an overlapping schedule for the room is still on: hand over to it
+            device_cache.update("room_states", room, {"$set": {"ac_on": True, "temperature": other[3]}})
+        else:
+            device_cache.update("room_states", room, {"$set": {"ac_on": False, "temperature": None}})
+        mongo.db.hvac_schedules.update_one({"_id": sid}, {"$set": {"active": False}})
+        print(f"⏹ Schedule ended for {room}")
+
+    def _fire_due(self):
+        now = datetime.datetime.now()
+        while True:
+            with self._cond:
+                if not self._heap or self._heap[0][0] > now:
+                    return
+                _when, _seq, kind, sid = heapq.heappop(self._heap)
+                if sid not in self._schedules:
+                    continue
+            try:
+                self._start(sid) if kind == "start" else self._end(sid)
+            except Exception as e:
+                print("⚠️ Error in schedule loop:", e)
+
+    # ---- main loop ----
+    def run(self, app, keep_running=lambda: True):
+        """Run until keep_running() turns False (e.g. this worker lost its leader lease)."""
+        self._running = True
+        try:
+            with app.app_context():
+                self._load()
+            next_resync = datetime.datetime.now() + datetime.timedelta(seconds=self.resync_interval)
+            while keep_running():
+                with self._cond:
+                    now = datetime.datetime.now()
+                    wake = next_resync if not self._heap else min(self._heap[0][0], next_resync)
+                    timeout = min((wake - now).total_seconds(), MAX_SLEEP_SECONDS)
+                    if timeout > 0:
+                        self._cond.wait(timeout)
+                if not keep_running():
+                    break
+                with app.app_context():
+                    self._fire_due()
+                    if datetime.datetime.now() >= next_resync or self._changed():
+                        # schedules created through other workers/replicas
+                        try:
+                            self._load()
+                        except Exception as e:
+                            print("⚠️ Error in schedule loop:", e)
+                        next_resync = datetime.datetime.now() + datetime.timedelta(seconds=self.resync_interval)
+        finally:
+            # forget everything; whoever runs next starts from a fresh load
+            with self._cond:
+                self._running = False
+                self._heap, self._schedules, self._loaded_at = [], {}, None
+
+    @property
+    def pending(self):
+        return len(self._schedules)
+
+
+# Shared scheduler (run by control.schedule_loop)
+hvac_scheduler = HvacScheduler()
@@ -0,0 +1,169 @@
+# App/indexes.py
+# Every index the app relies on, in one place. ensure_indexes() is applied at
+# startup (seed_all, once per deployment); audit() explains each query shape
+# the blueprints issue and reports any that would still scan a whole collection.
+import datetime
+import os
+
+from pymongo import ASCENDING, IndexModel
+
+from . import mongo
+from .hvac_scheduler import HVAC_SCHEDULE_RETENTION_DAYS
+from .journal import STATE_JOURNAL_RETENTION_DAYS
+
+PARKING_ATTEMPT_RETENTION_DAYS = int(os.getenv("PARKING_ATTEMPT_RETENTION_DAYS", "30"))
+
+INDEXES = {
+    "lights": [
+        IndexModel([("room", ASCENDING)], name="room"),
+        IndexModel([("is_on", ASCENDING)], name="is_on"),
+    ],
+    "room_states": [
+        IndexModel([("room", ASCENDING)], name="room"),
+        IndexModel([("ac_on", ASCENDING)], name="ac_on"),
+    ],
+    "meeting_rooms": [
+        IndexModel([("room_name", ASCENDING)], name="room_name", unique=True),
+        IndexModel([("booking_id", ASCENDING)], name="booking_id"),
+        IndexModel([("is_available", ASCENDING)], name="is_available"),
+    ],
+    "parking_spots": [
+        IndexModel([("spot_id", ASCENDING)], name="spot_id_1", unique=True),
+        IndexModel([("spot_name", ASCENDING)], name="spot_name_1", unique=True),
+        IndexModel([("users", ASCENDING)], name="users"),
+        IndexModel([("status", ASCENDING)], name="status"),
+    ],
+    "parking_attempts": [
+        IndexModel([("spot_id", ASCENDING), ("ts", ASCENDING)], name="spot_ts"),
+        IndexModel([("ts", ASCENDING)], name="ts_ttl",
+                   expireAfterSeconds=PARKING_ATTEMPT_RETENTION_DAYS * 24 * 3600),
+    ],
+    "checkin_summaries": [
+        IndexModel([("day", ASCENDING), ("multi", ASCENDING), ("spot_id", ASCENDING)], name="day_multi_spot"),
+        IndexModel([("day", ASCENDING), ("double", ASCENDING), ("spot_id", ASCENDING)], name="day_double_spot"),
+    ],
+    "violations": [
+        IndexModel([("spot_id", ASCENDING), ("type", ASCENDING)], name="spot_id_1_type_1", unique=True),
+        IndexModel([("active", ASCENDING)], name="active"),
+    ],
+    "automation_rules": [
+        IndexModel([("enabled", ASCENDING)], name="enabled"),
+    ],
+    "automation_scenes": [
+        IndexModel([("name", ASCENDING)], name="name"),
+    ],
+    "automation_executions": [
+        IndexModel([("created_ts", ASCENDING)], name="created_ts_1"),
+    ],
+    "energy_usage": [
+        IndexModel([("date", ASCENDING)], name="date"),
+    ],
+    "energy_hourly": [
+        IndexModel([("room", ASCENDING), ("hour", ASCENDING)], name="room_hour", unique=True),
+        IndexModel([("hour", ASCENDING)], name="hour"),
+    ],
+    "energy_daily": [
+        IndexModel([("room", ASCENDING), ("day", ASCENDING)], name="room_day", unique=True),
+        IndexModel([("day", ASCENDING)], name="day"),
+    ],
+    "room_bookings": [
+        IndexModel([("bookings.id", ASCENDING)], name="booking_id"),
+        IndexModel([("updated_at", ASCENDING)], name="updated_at"),
+    ],
+    "state_journal": [
+        IndexModel([("t", ASCENDING)], name="t_ttl",
+                   expireAfterSeconds=STATE_JOURNAL_RETENTION_DAYS * 24 * 3600),
+    ],
+    "state_snapshots": [
+        IndexModel([("t", ASCENDING)], name="t_ttl",
+                   expireAfterSeconds=STATE_JOURNAL_RETENTION_DAYS * 24 * 3600),
+    ],
+    "hvac_schedules": [
+        IndexModel([("end", ASCENDING), ("room", ASCENDING)], name="end_room"),
+        IndexModel([("active", ASCENDING)], name="active_only",
+                   partialFilterExpression={"active": True}),
+        IndexModel([("end", ASCENDING)], name="end_ttl",
+                   expireAfterSeconds=HVAC_SCHEDULE_RETENTION_DAYS * 24 * 3600),
+    ],
+}
+
+# (collection, filter) for every filtered find/update/count issued at runtime.
+# Unfiltered listings of the small device/room collections are left out on purpose.
+QUERY_SHAPES = [
+    ("lights", {"room": "london"}),
+    ("lights", {"is_on": True}),
+    ("room_states", {"room": "london"}),
+    ("room_states", {"ac_on": True}),
+    ("meeting_rooms", {"room_name": "london"}),
+    ("meeting_rooms", {"booking_id": "bk-0"}),
+    ("meeting_rooms", {"is_available": True}),
+    ("parking_spots", {"spot_id": 1}),
+    ("parking_spots", {"spot_name": "A1"}),
+    ("parking_spots", {"users": "Nelly"}),
+    ("parking_spots", {"status": "available"}),
+    ("parking_spots", {"status": "reserved", "spot_id": 1}),
+    ("checkin_summaries", {"$or": [{"day": None, "double": True}, {"day": None, "multi": True}]}),
+    ("checkin_summaries", {"$or": [{"day": None, "double": True, "spot_id": 1},
+                                   {"day": "2026-01-01", "multi": True, "spot_id": 1}]}),
+    ("violations", {"spot_id": 1, "type": "multi_checkin"}),
+    ("violations", {"spot_id": 1}),
+    ("violations", {"active": True}),
+    ("automation_rules", {"enabled": True}),
+    ("automation_scenes", {"name": "evening"}),
+    ("automation_executions", {"created_ts": {"$gte": "$since"}}),
+    ("energy_usage", {"date": "2026-01-01"}),
+    ("energy_hourly", {"room": "london", "hour": {"$gte": "$since", "$lt": "$now"}}),
+    ("energy_hourly", {"hour": {"$gte": "$since", "$lt": "$now"}}),
+    ("energy_daily", {"room": "london", "day": {"$gte": "$since", "$lt": "$now"}}),
+    ("energy_daily", {"day": {"$gte": "$since", "$lt": "$now"}}),
+    ("energy_daily", {"room": None, "day": {"$gte": "$since"}}),
+    ("lights", {"_id": {"$in": [1]}, "metered_tick": 1}),
+    ("room_bookings", {"bookings.id": "bk-0"}),
+    ("room_bookings", {"updated_at": {"$gte": "$since"}}),
+    ("state_journal", {"t": {"$gt": "$since", "$lte": "$now"}, "c": {"$in": ["lights"]}}),
+    ("state_snapshots", {"t": {"$lte": "$now"}}),
+    ("hvac_schedules", {"$or": [{"end": {"$gte": "$now"}}, {"active": True}]}),
+    ("hvac_schedules", {"active": True}),
+]
+
+
+def ensure_indexes(db=None, collections=None):
+    """Create the registered indexes (create_index is a no-op for existing ones)."""
+    db = db if db is not None else mongo.db
+    for name, models in INDEXES.items():
+        if collections is None or name in collections:
+            db[name].create_indexes(models)
+
+
+def _stages(plan):
+    """All stage names in an explain() plan tree (classic and SBE layouts)."""
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            yield plan["stage"]
+        for value in plan.values():
+            yield from _stages(value)
+    elif isinstance(plan, list):
+        for value in plan:
+            yield from _stages(value)
+
+
+def _placeholders(flt):
+    # "$since"/"$now" stand for datetimes in range queries; the plan doesn't depend on the value
+    if isinstance(flt, dict):
+        return {k: _placeholders(v) for k, v in flt.items()}
+    if isinstance(flt, list):
+        return [_placeholders(v) for v in flt]
+    if flt in ("$since", "$now"):
+        return datetime.datetime(2026, 1, 1)
+    return flt
+
+
+def audit(db=None, shapes=QUERY_SHAPES):
+    """Explain every query shape; returns [(collection, filter, stages, is_collscan)]."""
+    db = db if db is not None else mongo.db
+    report = []
+    for coll, flt in shapes:
+        plan = db[coll].find(_placeholders(flt)).explain()["queryPlanner"]["winningPlan"]
+        stages = list(_stages(plan))
+        report.append((coll, flt, stages, "COLLSCAN" in stages))
+    return report
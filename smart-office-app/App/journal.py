@@ -0,0 +1,94 @@
+# App/journal.py
+# Append-only journal of device state changes (lights, room_states,
+# meeting_rooms) plus periodic snapshots, so the state at any past moment can
+# be rebuilt: state_at(t) = nearest snapshot <= t + the journal entries after it.
+#   state_journal   {t, c: collection, k: key, s: {field: new value}}
+#   state_snapshots {t, state: {collection: [doc, ...]}}
+# Journal entries are compact and written with one unordered insert_many per
+# device write (a whole bulk request is one batch); both collections expire
+# after STATE_JOURNAL_RETENTION_DAYS.
+import datetime
+import os
+import time
+
+from bson import ObjectId
+from pymongo.errors import BulkWriteError, PyMongoError
+
+from . import mongo
+from .metering import METER_FIELDS
+from .write_behind import write_behind
+
+STATE_SNAPSHOT_SECONDS = float(os.getenv("STATE_SNAPSHOT_SECONDS", "3600"))
+STATE_JOURNAL_RETENTION_DAYS = int(os.getenv("STATE_JOURNAL_RETENTION_DAYS", "30"))
+
+# collection -> key field
+JOURNALED = {"lights": "room", "room_states": "room", "meeting_rooms": "room_name"}
+
+
+def record(collection, changes, t=None):
+    """
+    Journal [(key, fields)] written to `collection`. Call after the write has
+    been acknowledged, so every entry older than a snapshot is already in it.
+    Written before the request returns; if MongoDB can't take the batch right
+    now it goes to the (retrying) write-behind queue rather than being lost.
+    """
+    t = t or datetime.datetime.utcnow()
+    # _id is assigned here so it orders entries within the same millisecond (and a retry can't duplicate them)
+    entries = [{"_id": ObjectId(), "t": t, "c": collection, "k": key, "s": fields} for key, fields in changes]
+    if not entries:
+        return
+    try:
+        mongo.db.state_journal.insert_many(entries, ordered=False)
+    except BulkWriteError as e:
+        print("⚠️ journal: entries rejected:", e.details.get("writeErrors", [])[:1])
+    except PyMongoError as e:
+        print("⚠️ journal write failed, queued for retry:", e)
+        write_behind.insert_many("state_journal", entries)
+
+
+def take_snapshot(now=None):
+    """Store the current state of every journaled collection; returns its timestamp."""
+    t = now or datetime.datetime.utcnow()      # taken before reading, see record()
+    projection = {"_id": 0, **{f: 0 for f in METER_FIELDS}}
+    state = {c: list(mongo.db[c].find({}, projection)) for c in JOURNALED}
+    mongo.db.state_snapshots.insert_one({"t": t, "state": state})
+    return t
+
+
+def state_at(t, collections=None):
+    """
+    {"t", "snapshot": <its timestamp or None>, "state": {collection: {key: doc}}}
+    as of `t`. Without a snapshot before `t` only the journaled changes are known.
+    """
+    collections = [c for c in (collections or JOURNALED) if c in JOURNALED]
+    snap = mongo.db.state_snapshots.find_one(
+        {"t": {"$lte": t}}, {"_id": 0, "t": 1, **{f"state.{c}": 1 for c in collections}}, sort=[("t", -1)]
+    )
+    state = {c: {} for c in collections}
+    since = None
+    if snap:
+        since = snap["t"]
+        for c in collections:
+            key = JOURNALED[c]
+            state[c] = {d[key]: d for d in snap["state"].get(c, []) if d.get(key) is not None}
+
+    flt = {"t": {"$lte": t}, "c": {"$in": collections}}
+    if since is not None:
+        flt["t"]["$gt"] = since
+    for e in mongo.db.state_journal.find(flt, {"_id": 0}).sort([("t", 1), ("_id", 1)]):
+        doc = state[e["c"]].setdefault(e["k"], {JOURNALED[e["c"]]: e["k"]})
+        doc.update(e["s"])
+    return {"t": t, "snapshot": since, "state": state}
+
+
+def snapshot_loop(app, keep_running=lambda: True):
+    """Leader loop: one snapshot every STATE_SNAPSHOT_SECONDS."""
+    while keep_running():
+        with app.app_context():
+            try:
+                take_snapshot()
+            except PyMongoError as e:
+                print("⚠️ state snapshot failed, retrying next round:", e)
+        deadline = time.monotonic() + STATE_SNAPSHOT_SECONDS
+        while keep_running() and time.monotonic() < deadline:
+            time.sleep(min(5.0, max(0.0, deadline - time.monotonic())))     # notice lost leadership early
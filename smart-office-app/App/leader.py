@@ -0,0 +1,161 @@
+# App/leader.py
+# Lease-based leader election so that background loops (HVAC scheduler,
+# energy metering) run in exactly one worker across all replicas.
+import atexit
+import os
+import socket
+import threading
+import time
+import uuid
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError, PyMongoError
+
+from . import mongo
+
+LEADER_ELECTION = os.getenv("LEADER_ELECTION", "1") == "1"
+LEASE_TTL_SECONDS = float(os.getenv("LEADER_LEASE_TTL_SECONDS", "10"))
+
+
+def worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+
+
+class MongoLeaseStore:
+    """Leases as documents in the `leases` collection: {_id: name, holder, expires_at}."""
+
+    def __init__(self, collection="leases", db=None):
+        self.collection = collection
+        self._db = db                   # defaults to the app's mongo.db
+
+    @property
+    def coll(self):
+        return (self._db if self._db is not None else mongo.db)[self.collection]
+
+    def try_acquire(self, name, holder, ttl):
+        # expiry is computed and compared on the server ($$NOW), so the
+        # workers' clocks never decide who leads
+        try:
+            doc = self.coll.find_one_and_update(
+                # ours already, or the previous holder let it expire
+                {"_id": name, "$or": [{"holder": holder}, {"$expr": {"$lt": ["$expires_at", "$$NOW"]}}]},
+                [{"$set": {"holder": {"$literal": holder},
+                           "expires_at": {"$add": ["$$NOW", int(ttl * 1000)]},
+                           "renewed_at": "$$NOW"}}],
+                upsert=True,
+                return_document=ReturnDocument.AFTER,
+            )
+        except DuplicateKeyError:
+            return False                # someone else holds a live lease
+        return doc is not None and doc.get("holder") == holder
+
+    def release(self, name, holder):
+        self.coll.update_one({"_id": name, "holder": holder}, [{"$set": {"expires_at": "$$NOW"}}])
+
+
+class MemoryLeaseStore:
+    """In-process stand-in with the same semantics (tests, single-process dev runs)."""
+
+    def __init__(self, clock=time.time):
+        self.clock = clock
+        self._leases = {}
+        self._lock = threading.Lock()
+
+    def try_acquire(self, name, holder, ttl):
+        with self._lock:
+            now = self.clock()
+            current = self._leases.get(name)
+            if current and current[0] != holder and current[1] >= now:
+                return False
+            self._leases[name] = (holder, now + ttl)
+            return True
+
+    def release(self, name, holder):
+        with self._lock:
+            if self._leases.get(name, (None,))[0] == holder:
+                del self._leases[name]
+
+
+class LeaderLease:
+    """
+    One worker's claim on a named lease. tick() acquires/renews it; is_leader()
+    only trusts a successful renewal younger than the TTL minus a safety margin,
+    so a worker that can't reach the store stops leading before anyone else
+    can take over.
+    """
+
+    def __init__(self, name, store=None, ttl=LEASE_TTL_SECONDS, holder=None, clock=time.monotonic):
+        self.name = name
+        self.store = store or MongoLeaseStore()
+        self.ttl = ttl
+        self.renew_every = ttl / 3
+        self.holder = holder or worker_id()
+        self.clock = clock
+        self._valid_until = 0.0
+        self._stop = threading.Event()
+        self._leading = threading.Event()
+        self._thread = None
+
+    def is_leader(self):
+        if self.clock() < self._valid_until:
+            return True
+        self._leading.clear()
+        return False
+
+    def tick(self):
+        started = self.clock()
+        try:
+            ok = self.store.try_acquire(self.name, self.holder, self.ttl)
+        except PyMongoError as e:
+            print(f"⚠️ lease {self.name}: store unavailable:", e)
+            ok = False
+        if ok:
+            if not self._leading.is_set():
+                print(f"👑 {self.holder} is now leader for {self.name}")
+            self._valid_until = started + self.ttl * 0.8
+            self._leading.set()
+        return self.is_leader()
+
+    def wait_until_leader(self, timeout=None):
+        return self._leading.wait(timeout)
+
+    # ---- background renewal ----
+    def _run(self):
+        while not self._stop.is_set():
+            self.tick()
+            self._stop.wait(self.renew_every)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name=f"lease-{self.name}", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop renewing and hand the lease over immediately."""
+        self._stop.set()
+        self._valid_until = 0.0
+        self._leading.clear()
+        try:
+            self.store.release(self.name, self.holder)
+        except PyMongoError:
+            pass
+
+
+def run_as_leader(name, target, app, store=None):
+    """
+    Run target(app, keep_running) only while this worker holds the `name` lease.
+    target must return once keep_running() turns False; it is restarted whenever
+    leadership is regained. With LEADER_ELECTION=0 the target just runs.
+    """
+    if not LEADER_ELECTION:
+        target(app, keep_running=lambda: True)
+        return
+    lease = LeaderLease(name, store).start()
+    atexit.register(lease.stop)     # graceful shutdown -> immediate failover
+    while True:
+        lease.wait_until_leader()
+        try:
+            target(app, keep_running=lease.is_leader)
+        except Exception as e:
+            print(f"⚠️ {name} loop crashed:", e)
+            time.sleep(lease.renew_every)
@@ -0,0 +1,169 @@
+# App/lifecycle.py
+# Process lifecycle: startup -> warming -> ready -> stopping.
+# Startup work (seeding, indexes) runs once per deployment, guarded by a
+# document in the `bootstrap` collection; every process then warms its own
+# caches and reports progress through /health/ready.
+import atexit
+import datetime
+import hashlib
+import json
+import os
+import threading
+import time
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError, PyMongoError
+
+from . import mongo
+from .bookings import booking_index
+from .device_cache import device_cache
+from .leader import worker_id
+from .rule_engine import rule_engine
+from .write_behind import write_behind
+
+# DEPLOYMENT_ID (e.g. the image tag) makes every rollout bootstrap once more;
+# without it only a change to the indexes or migrations does (bootstrap_key).
+DEPLOYMENT_ID = os.getenv("DEPLOYMENT_ID", "")
+BOOTSTRAP_LOCK_SECONDS = int(os.getenv("BOOTSTRAP_LOCK_SECONDS", "300"))
+
+
+def bootstrap_key():
+    """Digest of every index definition and the migration list, plus DEPLOYMENT_ID."""
+    from .indexes import INDEXES
+    from .seed import MIGRATIONS
+
+    spec = {
+        "indexes": {name: [model.document for model in models] for name, models in INDEXES.items()},
+        "migrations": [f"{fn.__module__}.{fn.__qualname__}" for fn in MIGRATIONS],
+    }
+    digest = hashlib.sha256(json.dumps(spec, sort_keys=True, default=str).encode()).hexdigest()[:16]
+    return f"{digest}:{DEPLOYMENT_ID}"
+
+
+def run_once_per_deployment(key, fn, owner=None, poll=1.0):
+    """Run fn() in exactly one process for `key`; the others wait until it is done."""
+    owner = owner or worker_id()
+    coll = mongo.db.bootstrap
+    while True:
+        now = datetime.datetime.utcnow()
+        try:
+            doc = coll.find_one_and_update(
+                {"_id": "bootstrap", "$or": [
+                    {"key": {"$ne": key}},                                  # new deployment
+                    {"status": "failed"},                                   # retry
+                    {"status": "running", "expires_at": {"$lt": now}},      # owner died
+                ]},
+                {"$set": {"key": key, "status": "running", "owner": owner, "started_at": now,
+                          "expires_at": now + datetime.timedelta(seconds=BOOTSTRAP_LOCK_SECONDS)}},
+                upsert=True,
+                return_document=ReturnDocument.AFTER,
+            )
+        except DuplicateKeyError:
+            doc = None
+
+        if doc is not None and doc.get("owner") == owner:
+            try:
+                fn()
+            except Exception:
+                coll.update_one({"_id": "bootstrap", "owner": owner}, {"$set": {"status": "failed"}})
+                raise
+            coll.update_one({"_id": "bootstrap", "owner": owner},
+                            {"$set": {"status": "done", "finished_at": datetime.datetime.utcnow()}})
+            return True
+
+        if coll.find_one({"_id": "bootstrap", "key": key, "status": "done"}, {"_id": 1}):
+            return False        # somebody else already did it
+        time.sleep(poll)
+
+
+class Lifecycle:
+    def __init__(self):
+        self.phase = "not_started"
+        self.checks = {"db": False, "bootstrap": False, "indexes": False, "caches": {}}
+        self.error = None
+        self._started = False
+        self._lock = threading.Lock()
+        self._warmers = {}          # name -> callable, run in every process
+        self._on_shutdown = []
+
+    def add_warmer(self, name, fn):
+        self._warmers[name] = fn
+        self.checks["caches"][name] = False
+
+    def on_shutdown(self, fn):
+        self._on_shutdown.append(fn)
+
+    # ---- phases ----
+    def start(self, app, background=True):
+        """Kick off startup for this process (once); serving can begin immediately."""
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        atexit.register(self.shutdown)
+        if background:
+            threading.Thread(target=self._startup, args=(app,), name="lifecycle", daemon=True).start()
+        else:
+            self._startup(app)
+
+    def _startup(self, app):
+        from .background import start_background_loops
+        from .seed import seed_all
+
+        self.phase = "starting"
+        with app.app_context():
+            while True:
+                try:
+                    mongo.db.command("ping")
+                    self.checks["db"] = True
+                    run_once_per_deployment(bootstrap_key(), seed_all)
+                    self.checks["bootstrap"] = self.checks["indexes"] = True
+                    break
+                except Exception as e:
+                    self.checks["db"] = not isinstance(e, PyMongoError)
+                    self.error = str(e)
+                    time.sleep(2)
+
+            self.phase = "warming"
+            for name, fn in self._warmers.items():
+                try:
+                    fn()
+                    self.checks["caches"][name] = True
+                except Exception as e:
+                    # a cold cache only costs latency; don't keep the pod out of rotation
+                    self.checks["caches"][name] = f"failed: {e}"
+
+        self.error = None
+        self.phase = "ready"
+        start_background_loops(app)
+
+    def shutdown(self):
+        """Stop taking traffic (readiness -> 503) and flush in-memory work."""
+        if self.phase == "stopped":
+            return
+        self.phase = "stopping"
+        for fn in self._on_shutdown:
+            try:
+                fn()
+            except Exception as e:
+                print("⚠️ shutdown hook failed:", e)
+        self.phase = "stopped"
+
+    # ---- probes ----
+    @property
+    def ready(self):
+        return self.phase == "ready"
+
+    def status(self):
+        out = {"phase": self.phase, **self.checks}
+        if self.error:
+            out["error"] = self.error
+        return out
+
+
+# Shared per-process lifecycle
+lifecycle = Lifecycle()
+lifecycle.add_warmer("rule_engine", rule_engine.reload)
+lifecycle.add_warmer("device_cache", device_cache.warm)
+lifecycle.add_warmer("bookings", booking_index.sync)
+lifecycle.on_shutdown(write_behind.stop)
@@ -0,0 +1,222 @@
+# App/live.py
+# Live state bus for the dashboards (lights, room_states, meeting_rooms,
+# parking_spots). Each process keeps one in-memory copy of those collections
+# and pushes changes to its SSE clients (see blueprints/live.py):
+#   - with a replica set, a single change stream per process feeds the bus;
+#   - on a standalone mongod, write paths call touch() after they write, and a
+#     shared poller (one read per LIVE_POLL_SECONDS per process, not per
+#     browser) picks up writes made by other workers/replicas.
+import copy
+import os
+import queue
+import threading
+import time
+
+from pymongo.errors import OperationFailure, PyMongoError
+
+from . import mongo
+
+LIVE_POLL_SECONDS = float(os.getenv("LIVE_POLL_SECONDS", "5"))
+LIVE_QUEUE_SIZE = int(os.getenv("LIVE_QUEUE_SIZE", "1000"))
+
+# topic (= collection) -> (key field, fields sent to the browser)
+TOPICS = {
+    "lights": ("room", {"room": 1, "is_on": 1}),
+    "room_states": ("room", {"room": 1, "ac_on": 1, "temperature": 1}),
+    "meeting_rooms": ("room_name", {"room_name": 1, "is_available": 1, "booked_until": 1,
+                                    "has_projector": 1, "projector_on": 1, "has_tv": 1, "tv_on": 1}),
+    "parking_spots": ("spot_name", {"spot_id": 1, "spot_name": 1, "status": 1, "users": 1}),
+}
+
+RESYNC = object()       # queued when a subscriber fell too far behind: send a fresh snapshot
+
+
+def _public(topic, doc):
+    fields = TOPICS[topic][1]
+    return {k: v for k, v in doc.items() if k in fields}
+
+
+class Subscription:
+    def __init__(self, topics, maxsize):
+        self.topics = set(topics)
+        self.queue = queue.Queue(maxsize=maxsize)
+
+    def offer(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except queue.Full:
+            # drop the backlog; the stream re-sends a snapshot instead
+            with self.queue.mutex:
+                self.queue.queue.clear()
+            self.queue.put_nowait(RESYNC)
+
+
+class LiveBus:
+    def __init__(self, poll_interval=LIVE_POLL_SECONDS, queue_size=LIVE_QUEUE_SIZE, feeder=True):
+        self.poll_interval = poll_interval
+        self.queue_size = queue_size
+        self.feeder = feeder
+        self.mode = None                # "changestream" | "poll", decided by the feeder
+        self._state = {}                # topic -> {key: doc}
+        self._ids = {}                  # topic -> {_id: key} (change-stream deletes only carry _id)
+        self._versions = {t: 0 for t in TOPICS}
+        self._subs = set()
+        self._lock = threading.RLock()
+        self._thread = None
+        self._pid = None
+
+    # ---- state ----
+    def _load(self):
+        state, ids = {}, {}
+        for topic, (key, fields) in TOPICS.items():
+            state[topic], ids[topic] = {}, {}
+            for doc in mongo.db[topic].find({}, {**fields, "_id": 1}):
+                if doc.get(key) is None:
+                    continue
+                ids[topic][doc["_id"]] = doc[key]
+                state[topic][doc[key]] = _public(topic, doc)
+        with self._lock:
+            old, self._state, self._ids = self._state, state, ids
+            if old:
+                # publish whatever changed while nobody was looking
+                for topic in TOPICS:
+                    for k in set(old.get(topic, {})) | set(state[topic]):
+                        if old.get(topic, {}).get(k) != state[topic].get(k):
+                            self._emit(topic, k, state[topic].get(k))
+
+    def _apply(self, topic, key, doc, _id=None):
+        """Record the new value of one document and fan it out if it changed."""
+        with self._lock:
+            current = self._state.setdefault(topic, {})
+            if doc is None:
+                if key is None:
+                    key = self._ids.get(topic, {}).pop(_id, None)
+                if key is None or key not in current:
+                    return
+                del current[key]
+            else:
+                if _id is not None:
+                    self._ids.setdefault(topic, {})[_id] = key
+                doc = _public(topic, doc)
+                if current.get(key) == doc:
+                    return
+                current[key] = doc
+            self._emit(topic, key, doc)
+
+    def _emit(self, topic, key, doc):
+        self._versions[topic] += 1
+        event = {"topic": topic, "key": key, "doc": doc, "v": self._versions[topic]}
+        for sub in self._subs:
+            if topic in sub.topics:
+                sub.offer(event)
+
+    def publish(self, topic, key, doc):
+        """Push a new value (None = deleted) for one document of a topic."""
+        self._apply(topic, key, doc)
+
+    def touch(self, topic, key, doc=None):
+        """
+        Call after writing topic/key. With change streams this is a no-op;
+        otherwise the new document (re-read with one indexed find_one unless
+        the writer already has it) is published.
+        """
+        if self.mode != "poll" or not self._state or topic not in TOPICS:
+            return
+        if doc is None:
+            field, fields = TOPICS[topic]
+            try:
+                doc = mongo.db[topic].find_one({field: key}, {**fields, "_id": 0})
+            except PyMongoError as e:
+                print("⚠️ live: touch failed:", e)
+                return
+        self._apply(topic, key, doc)
+
+    # ---- subscribers ----
+    def subscribe(self, topics=None):
+        """Register a subscriber; returns (subscription, snapshot) taken atomically."""
+        topics = [t for t in (topics or TOPICS) if t in TOPICS]
+        self._ensure_feeder()
+        with self._lock:
+            # without a change stream the copy goes stale while nobody is subscribed
+            if not self._state or (not self._subs and self.mode != "changestream"):
+                self._load()
+            sub = Subscription(topics, self.queue_size)
+            self._subs.add(sub)
+            return sub, self.snapshot(topics)
+
+    def unsubscribe(self, sub):
+        with self._lock:
+            self._subs.discard(sub)
+
+    def snapshot(self, topics=None):
+        with self._lock:
+            topics = [t for t in (topics or TOPICS) if t in TOPICS]
+            return {
+                "data": {t: copy.deepcopy(self._state.get(t, {})) for t in topics},
+                "versions": {t: self._versions[t] for t in topics},
+            }
+
+    @property
+    def subscribers(self):
+        return len(self._subs)
+
+    # ---- feeders ----
+    def _ensure_feeder(self):
+        if not self.feeder:
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._feed, name="live-bus", daemon=True)
+            self._thread.start()
+
+    def _feed(self):
+        try:
+            self._watch()
+        except OperationFailure as e:
+            # standalone mongod: no change streams
+            print("ℹ️ live: change streams unavailable, polling every", self.poll_interval, "s:", e)
+        self.mode = "poll"
+        self._poll()
+
+    def _watch(self):
+        pipeline = [{"$match": {"ns.coll": {"$in": list(TOPICS)},
+                                "operationType": {"$in": ["insert", "update", "replace", "delete"]}}}]
+        resume = None
+        while True:
+            try:
+                with mongo.db.watch(pipeline, full_document="updateLookup", resume_after=resume) as stream:
+                    self.mode = "changestream"
+                    self._load()        # after the cursor is open, so nothing falls in between
+                    for change in stream:
+                        resume = stream.resume_token
+                        topic = change["ns"]["coll"]
+                        doc = change.get("fullDocument")
+                        _id = change["documentKey"]["_id"]
+                        if doc is None:
+                            self._apply(topic, None, None, _id=_id)
+                        elif doc.get(TOPICS[topic][0]) is not None:
+                            self._apply(topic, doc[TOPICS[topic][0]], doc, _id=_id)
+            except OperationFailure:
+                if self.mode != "changestream":
+                    raise
+                print("⚠️ live: change stream invalidated, reloading")
+                resume = None
+            except PyMongoError as e:
+                print("⚠️ live: change stream error:", e)
+                time.sleep(self.poll_interval)
+
+    def _poll(self):
+        while True:
+            time.sleep(self.poll_interval)
+            if not self._subs:
+                continue        # nobody listening: no reads at all
+            try:
+                self._load()
+            except PyMongoError as e:
+                print("⚠️ live: poll failed:", e)
+
+
+# Shared per-process bus
+live_bus = LiveBus()
@@ -0,0 +1,163 @@
+# App/metering.py
+# Energy metering from the actual on-intervals of each device.
+# Every device write (DeviceCache.update/bulk_update) first accrues the energy
+# drawn since the previous write into the device document itself:
+#   meter: {since: <last write/settle>, pending_wh: <energy not yet bucketed>}
+# The leader's energy loop then settles every device (pending + the interval
+# still running) into per-room bucket documents:
+#   energy_hourly {room, hour, lights_kwh, ac_kwh, total_kwh}
+#   energy_daily  {room, day,  lights_kwh, ac_kwh, total_kwh}
+# (room None = the whole office) and the energy_usage {date, ...} day totals. Nothing is sampled, so a
+# late or missed tick only delays the numbers, it doesn't change them.
+import datetime
+import os
+from collections import namedtuple
+
+from bson import ObjectId
+from pymongo import UpdateOne
+
+from . import mongo
+
+LIGHT_WATTS = float(os.getenv("LIGHT_WATTS", "10"))
+AC_WATTS = float(os.getenv("AC_WATTS", "20"))
+METER_INTERVAL_SECONDS = float(os.getenv("METER_INTERVAL_SECONDS", "30"))
+
+# collection -> what draws power and how much. A device document may carry its
+# own "watts" to override the default of its type (only a missing/null "watts"
+# means "use the default"; 0 is a device that draws nothing).
+Profile = namedtuple("Profile", "key on_field default_watts kwh_field")
+POWER_PROFILES = {
+    "lights": Profile("room", "is_on", LIGHT_WATTS, "lights_kwh"),
+    "room_states": Profile("room", "ac_on", AC_WATTS, "ac_kwh"),
+}
+
+# bookkeeping fields kept out of API responses
+METER_FIELDS = ("meter", "metered_tick")
+
+HOUR = datetime.timedelta(hours=1)
+
+
+def watts(collection, doc):
+    """Current draw of one device document, in watts."""
+    profile = POWER_PROFILES[collection]
+    if doc.get(profile.on_field) is not True:
+        return 0.0
+    own = doc.get("watts")
+    # same rule as metered_update's $ifNull
+    return float(profile.default_watts if own is None else own)
+
+
+def metered_update(collection, update, now=None):
+    """
+    Turn a {"$set": fields} device update into a pipeline update that first
+    accrues the energy drawn under the old state since meter.since.
+    """
+    if collection not in POWER_PROFILES:
+        return update
+    now = now or datetime.datetime.utcnow()
+    profile = POWER_PROFILES[collection]
+    since = {"$ifNull": ["$meter.since", now]}
+    drawn_wh = {"$cond": [
+        {"$eq": [f"${profile.on_field}", True]},
+        {"$multiply": [{"$ifNull": ["$watts", profile.default_watts]},
+                       {"$divide": [{"$max": [0, {"$subtract": [now, since]}]}, 3600 * 1000]}]},
+        0,
+    ]}
+    return [
+        {"$set": {"meter": {"since": now,
+                            "pending_wh": {"$add": [{"$ifNull": ["$meter.pending_wh", 0]}, drawn_wh]}}}},
+        {"$set": {k: {"$literal": v} for k, v in update["$set"].items()}},
+    ]
+
+
+def split_hours(start, end):
+    """[(hour start, hours of [start, end) in that hour)] for a time interval."""
+    out = []
+    hour = start.replace(minute=0, second=0, microsecond=0)
+    while hour < end:
+        nxt = hour + HOUR
+        seconds = (min(end, nxt) - max(start, hour)).total_seconds()
+        if seconds > 0:
+            out.append((hour, seconds / 3600))
+        hour = nxt
+    return out
+
+
+def device_energy(collection, doc, now):
+    """{hour: kWh} drawn by one device since it was last settled."""
+    meter = doc.get("meter") or {}
+    since = meter.get("since") or now
+    out = {}
+    pending = meter.get("pending_wh") or 0.0
+    if pending:
+        # accrued by writes inside [previous settle, since], so close enough to `since`
+        hour = since.replace(minute=0, second=0, microsecond=0)
+        out[hour] = pending / 1000
+    w = watts(collection, doc)
+    if w:
+        for hour, hours in split_hours(since, now):
+            out[hour] = out.get(hour, 0.0) + w * hours / 1000
+    return out
+
+
+def bucket_ops(readings):
+    """
+    Bucket $inc updates for [(collection, room, {hour: kWh})]:
+    {"energy_hourly": [...], "energy_daily": [...], "energy_usage": [...]}.
+    """
+    hourly, daily, totals = {}, {}, {}
+    for collection, room, by_hour in readings:
+        field = POWER_PROFILES[collection].kwh_field
+        for hour, kwh in by_hour.items():
+            if kwh <= 0:
+                continue
+            day = hour.replace(hour=0)
+            for acc, key in ((hourly, (room, hour)), (hourly, (None, hour)), (daily, (room, day)),
+                             (daily, (None, day)), (totals, day.date().isoformat())):
+                inc = acc.setdefault(key, {field: 0.0, "total_kwh": 0.0})
+                inc[field] = inc.get(field, 0.0) + kwh
+                inc["total_kwh"] += kwh
+    return {
+        "energy_hourly": [UpdateOne({"room": r, "hour": h}, {"$inc": inc}, upsert=True)
+                          for (r, h), inc in hourly.items()],
+        "energy_daily": [UpdateOne({"room": r, "day": d}, {"$inc": inc}, upsert=True)
+                         for (r, d), inc in daily.items()],
+        "energy_usage": [UpdateOne({"date": d}, {"$inc": inc}, upsert=True)
+                         for d, inc in totals.items()],
+    }
+
+
+def settle(now=None):
+    """
+    Move the energy drawn by every metered device up to `now` into the buckets.
+    Each device's meter is reset with a compare-and-set on the values we read,
+    so a device written in between keeps its energy pending for the next run
+    instead of being counted twice. Returns the kWh bucketed.
+    """
+    now = now or datetime.datetime.utcnow()
+    tick = ObjectId()
+    readings = []
+    for collection, profile in POWER_PROFILES.items():
+        coll = mongo.db[collection]
+        docs = list(coll.find({}, {profile.key: 1, profile.on_field: 1, "watts": 1, "meter": 1}))
+        if not docs:
+            continue
+        ops = []
+        for doc in docs:
+            meter = doc.get("meter") or {}
+            ops.append(UpdateOne(
+                {"_id": doc["_id"], "meter.since": meter.get("since"), "meter.pending_wh": meter.get("pending_wh")},
+                {"$set": {"meter": {"since": now, "pending_wh": 0.0}, "metered_tick": tick}},
+            ))
+        result = coll.bulk_write(ops, ordered=False)
+        if result.matched_count < len(docs):
+            # some device was written meanwhile: only bucket the ones we reset
+            ids = [d["_id"] for d in docs]
+            settled = {d["_id"] for d in coll.find({"_id": {"$in": ids}, "metered_tick": tick}, {"_id": 1})}
+            docs = [d for d in docs if d["_id"] in settled]
+        readings += [(collection, d.get(profile.key), device_energy(collection, d, now)) for d in docs]
+
+    for name, ops in bucket_ops(readings).items():
+        if ops:
+            mongo.db[name].bulk_write(ops, ordered=False)
+    return sum(kwh for _c, _r, by_hour in readings for kwh in by_hour.values())
@@ -0,0 +1,255 @@
+# App/rule_engine.py
+import heapq
+import os
+from bisect import bisect_left, insort
+import threading
+import time
+
+from pymongo import ReturnDocument
+
+from . import mongo
+
+# How often (seconds) we ask Mongo whether the rule set changed, and how old a
+# loaded rule set may get before we reload it anyway (catches edits made
+# directly in the database, which don't bump the version document).
+REFRESH_INTERVAL = float(os.getenv("RULE_ENGINE_REFRESH_SECONDS", "5"))
+MAX_AGE = float(os.getenv("RULE_ENGINE_MAX_AGE_SECONDS", "60"))
+
+_HOURS = 24
+_LAST_MINUTE = 23 * 60 + 59
+
+
+def hhmm(s):
+    """'HH:MM' -> minutes since midnight (None if it can't be parsed)."""
+    try:
+        h, m = map(int, (s or "0:0").split(":"))
+        return h * 60 + m
+    except Exception:
+        return None
+
+
+class CompiledRule:
+    """An enabled automation rule with its conditions pre-parsed into predicates."""
+
+    __slots__ = ("rule_id", "seq", "zone", "has_zone", "lo", "hi", "lux", "actions", "never")
+
+    def __init__(self, doc, seq):
+        self.rule_id = str(doc.get("_id"))
+        self.seq = seq
+        self.actions = doc.get("actions") or []
+        self.zone, self.has_zone = None, False
+        self.lo, self.hi = None, None
+        self.lux = []
+        self.never = False
+
+        for c in (doc.get("conditions") or []):
+            if not isinstance(c, dict):
+                continue
+            t = c.get("type")
+            if t == "motion" and c.get("zone"):
+                if self.has_zone and self.zone != c["zone"]:
+                    self.never = True      # two different zones can never both match
+                self.zone, self.has_zone = c["zone"], True
+            if t == "time":
+                a = hhmm(c.get("after"))
+                b4 = hhmm(c.get("before") or "23:59")
+                if a is not None:
+                    self.lo = a if self.lo is None else max(self.lo, a)
+                if b4 is not None:
+                    self.hi = b4 if self.hi is None else min(self.hi, b4)
+            if t == "lux":
+                self.lux.append(("lte" in c, c.get("lte"), "gte" in c, c.get("gte")))
+
+        if self.lo is not None and self.hi is not None and self.lo > self.hi:
+            self.never = True
+
+    def hours(self):
+        """Hours of the day in which this rule's time window can match."""
+        lo = 0 if self.lo is None else max(self.lo, 0)
+        hi = _LAST_MINUTE if self.hi is None else min(self.hi, _LAST_MINUTE)
+        return range(lo // 60, hi // 60 + 1) if lo <= hi else range(0)
+
+    def matches(self, zone, nowm, meta):
+        if self.never:
+            return False
+        if self.has_zone and self.zone != zone:
+            return False
+        if self.lo is not None and nowm < self.lo:
+            return False
+        if self.hi is not None and nowm > self.hi:
+            return False
+        if self.lux:
+            lux = meta.get("lux")
+            if lux is None:
+                return False
+            for has_lte, lte, has_gte, gte in self.lux:
+                if (has_lte and not (lux <= lte)) or (has_gte and not (lux >= gte)):
+                    return False
+        return True
+
+
+def _hashable(v):
+    try:
+        hash(v)
+        return True
+    except TypeError:
+        return False
+
+
+class RuleIndex:
+    """Compiled rules bucketed by (zone, hour-of-day); candidates keep load order."""
+
+    def __init__(self):
+        self.by_zone = {}                               # zone -> [rules per hour]
+        self.any_zone = [[] for _ in range(_HOURS)]     # rules without a zone condition
+        self.unindexed = []                             # zones we can't hash (odd payloads)
+        self.lux_thresholds = []                        # sorted distinct lte/gte values
+        self.lux_numeric = True
+        self.count = 0
+        self.rule_ids = set()
+
+    def add(self, rule):
+        self.rule_ids.add(rule.rule_id)
+        if rule.never:
+            return
+        self.count += 1
+        for has_lte, lte, has_gte, gte in rule.lux:
+            for has, v in ((has_lte, lte), (has_gte, gte)):
+                if not has:
+                    continue
+                if not isinstance(v, (int, float)):
+                    self.lux_numeric = False
+                elif v not in self.lux_thresholds:
+                    ths = list(self.lux_thresholds)
+                    insort(ths, v)
+                    self.lux_thresholds = ths
+        if rule.has_zone and not _hashable(rule.zone):
+            self.unindexed = self.unindexed + [rule]
+            return
+        if rule.has_zone:
+            buckets = self.by_zone.get(rule.zone)
+            if buckets is None:
+                buckets = self.by_zone[rule.zone] = [[] for _ in range(_HOURS)]
+        else:
+            buckets = self.any_zone
+        for h in rule.hours():
+            # copy-on-write so concurrent readers never see a list mid-append
+            buckets[h] = buckets[h] + [rule]
+
+    def candidates(self, zone, nowm):
+        h = min(max(nowm // 60, 0), _HOURS - 1)
+        lists = [self.any_zone[h], self.unindexed]
+        if _hashable(zone) and zone in self.by_zone:
+            lists.append(self.by_zone[zone][h])
+        return heapq.merge(*lists, key=lambda r: r.seq)
+
+    def match(self, zone, nowm, meta):
+        return [r for r in self.candidates(zone, nowm) if r.matches(zone, nowm, meta)]
+
+    def lux_key(self, lux):
+        """
+        Hashable bucket for a lux reading: two readings with the same key pass
+        or fail every lux condition alike. None if the reading can't be bucketed.
+        """
+        if lux is None:
+            return ("none",)
+        if not self.lux_numeric or not isinstance(lux, (int, float)):
+            return ("raw", lux) if _hashable(lux) else None
+        ths = self.lux_thresholds
+        i = bisect_left(ths, lux)
+        return ("bucket", i, i < len(ths) and ths[i] == lux)
+
+
+class RuleEngine:
+    """
+    In-process view of the enabled automation rules.
+    Rules are compiled once and looked up by zone/time instead of scanning
+    automation_rules on every motion event.
+    """
+
+    def __init__(self, refresh_interval=REFRESH_INTERVAL, max_age=MAX_AGE):
+        self.refresh_interval = refresh_interval
+        self.max_age = max_age
+        self._index = None
+        self._version = None
+        self._seq = 0
+        self._loaded_at = 0.0
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    # ---- building ----
+    def load(self, docs, version=None):
+        """Replace the compiled rule set with the given rule documents."""
+        index, seq = RuleIndex(), 0
+        for doc in docs:
+            seq += 1
+            index.add(CompiledRule(doc, seq))
+        with self._lock:
+            self._index, self._seq, self._version = index, seq, version
+            self._loaded_at = self._checked_at = time.monotonic()
+        return index.count
+
+    def reload(self):
+        version = _rules_version()
+        return self.load(mongo.db.automation_rules.find({"enabled": True}), version)
+
+    def add_rule(self, doc, version=None):
+        """Incrementally add a freshly inserted rule (called by create_rule)."""
+        with self._lock:
+            if self._index is None:
+                return
+            if version is not None and self._version is not None and version != self._version + 1:
+                # someone else changed the rules in between -> full reload on next use
+                self._checked_at = 0.0
+                self._loaded_at = 0.0
+                return
+            # skipped if a reload between the insert and the version bump already picked it up
+            if doc.get("enabled") and str(doc.get("_id")) not in self._index.rule_ids:
+                self._seq += 1
+                self._index.add(CompiledRule(doc, self._seq))
+            if version is not None:
+                self._version = version
+
+    def invalidate(self):
+        with self._lock:
+            self._index = None
+
+    # ---- querying ----
+    def _fresh_index(self):
+        now = time.monotonic()
+        if self._index is None or now - self._loaded_at > self.max_age:
+            self.reload()
+        elif now - self._checked_at >= self.refresh_interval:
+            self._checked_at = now
+            if _rules_version() != self._version:
+                self.reload()
+        return self._index or RuleIndex()
+
+    def snapshot(self):
+        """The current (refreshed) RuleIndex, to evaluate many events against one rule set."""
+        return self._fresh_index()
+
+    def match(self, zone, nowm, meta):
+        """Return the CompiledRules that fire for this event, in collection order."""
+        return self._fresh_index().match(zone, nowm, meta)
+
+    @property
+    def ready(self):
+        return self._index is not None
+
+
+def _rules_version():
+    doc = mongo.db.automation_meta.find_one({"_id": "rules"}, {"version": 1})
+    return (doc or {}).get("version", 0)
+
+
+def bump_rules_version():
+    """Mark the rule set as changed so every process reloads it; returns the new version."""
+    doc = mongo.db.automation_meta.find_one_and_update(
+        {"_id": "rules"}, {"$inc": {"version": 1}}, upsert=True, return_document=ReturnDocument.AFTER
+    )
+    return doc.get("version")
+
+
+# Shared engine used by the automation blueprint
+rule_engine = RuleEngine()
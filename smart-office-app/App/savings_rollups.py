@@ -0,0 +1,148 @@
+# App/savings_rollups.py
+# Materialized energy-savings rollups: one small document per UTC day in
+# energy_savings_daily, incremented whenever an automation execution is logged:
+#   {_id: "2026-10-18", executions: 12, kwh: 1.84, devices: {"light%2Ehall": 0.42, ...},
+#    applied: [<tokens of the increments applied in the last ROLLUP_REPLAY_MINUTES>]}
+# Increments go through write-behind, which resends a batch whose
+# acknowledgement was lost, so each one carries a token and is skipped when
+# the day has already applied it.
+import os
+from datetime import datetime
+
+from bson import ObjectId
+from pymongo import ReplaceOne, UpdateOne
+
+from . import mongo
+
+ROLLUP_COLLECTION = "energy_savings_daily"
+# How long a day remembers applied increments; an increment older than this is not
+# applied at all (check-energy-rollups / rebuild-energy-rollups repair the day)
+ROLLUP_REPLAY_MINUTES = int(os.getenv("ROLLUP_REPLAY_MINUTES", "30"))
+
+
+# Mongo field names can't contain "." or start with "$" -> percent-encode device ids
+def device_key(device_id):
+    return str(device_id).replace("%", "%25").replace(".", "%2E").replace("$", "%24")
+
+
+def device_name(key):
+    return key.replace("%24", "$").replace("%2E", ".").replace("%25", "%")
+
+
+def rollup_increments(executions):
+    """{day: {field: increment}} for freshly logged execution documents."""
+    incs = {}
+    for ex in executions:
+        day = ex["created_ts"].date().isoformat()
+        inc = incs.setdefault(day, {"executions": 0, "kwh": 0.0})
+        inc["executions"] += 1
+        inc["kwh"] += ex.get("energy_kwh_est") or 0.0
+        for d in ex.get("energy_by_device") or []:
+            field = "devices." + device_key(d["device_id"])
+            inc[field] = inc.get(field, 0.0) + d["kwh"]
+    return incs
+
+
+def rollup_ops(executions):
+    """Idempotent increments (one update per day touched) for freshly logged execution documents."""
+    token = ObjectId()
+    window = ROLLUP_REPLAY_MINUTES * 60 * 1000
+    applied = {"$ifNull": ["$applied", []]}
+    fresh = {"$and": [
+        {"$not": [{"$in": [token, applied]}]},
+        {"$gte": [{"$toDate": token}, {"$subtract": ["$$NOW", window]}]},
+    ]}
+    recent = {"$filter": {"input": applied, "as": "t",
+                          "cond": {"$gte": [{"$toDate": "$$t"}, {"$subtract": ["$$NOW", window]}]}}}
+    return [
+        UpdateOne({"_id": day}, [{"$set": {
+            **{f: {"$add": [{"$ifNull": [f"${f}", 0]}, {"$cond": [fresh, v, 0]}]} for f, v in inc.items()},
+            "applied": {"$concatArrays": [recent, {"$cond": [fresh, [token], []]}]},
+        }}], upsert=True)
+        for day, inc in rollup_increments(executions).items()
+    ]
+
+
+def read_rollups(since_day):
+    """{day: {"executions", "kwh", "devices"}} from the rollup documents (one indexed range read)."""
+    out = {}
+    for doc in mongo.db[ROLLUP_COLLECTION].find({"_id": {"$gte": since_day}}):
+        out[doc["_id"]] = {
+            "executions": doc.get("executions", 0),
+            "kwh": doc.get("kwh", 0.0),
+            "devices": {device_name(k): v for k, v in (doc.get("devices") or {}).items()},
+        }
+    return out
+
+
+def raw_rollups(since_day=None):
+    """Same shape as read_rollups, recomputed from automation_executions."""
+    match = {"created_ts": {"$exists": True}}
+    if since_day:
+        match["created_ts"] = {"$gte": _day_start(since_day)}
+    day_expr = {"$dateToString": {"format": "%Y-%m-%d", "date": "$created_ts"}}
+    pipeline = [
+        {"$match": match},
+        {"$facet": {
+            "days": [{"$group": {"_id": day_expr, "executions": {"$sum": 1},
+                                 "kwh": {"$sum": "$energy_kwh_est"}}}],
+            "devices": [
+                {"$unwind": "$energy_by_device"},
+                {"$group": {"_id": {"day": day_expr, "device_id": "$energy_by_device.device_id"},
+                            "kwh": {"$sum": "$energy_by_device.kwh"}}},
+            ],
+        }},
+    ]
+    res = next(mongo.db.automation_executions.aggregate(pipeline), {})
+    out = {}
+    for d in res.get("days", []):
+        out[d["_id"]] = {"executions": d["executions"], "kwh": d["kwh"], "devices": {}}
+    for d in res.get("devices", []):
+        day = out.setdefault(d["_id"]["day"], {"executions": 0, "kwh": 0.0, "devices": {}})
+        day["devices"][d["_id"]["device_id"]] = d["kwh"]
+    return out
+
+
+def rebuild(since_day=None):
+    """Overwrite the rollup documents from the raw executions; returns days written."""
+    days = raw_rollups(since_day)
+    coll = mongo.db[ROLLUP_COLLECTION]
+    if since_day:
+        coll.delete_many({"_id": {"$gte": since_day, "$nin": list(days)}})
+    else:
+        coll.delete_many({"_id": {"$nin": list(days)}})
+    ops = [
+        ReplaceOne({"_id": day}, {
+            "executions": v["executions"], "kwh": v["kwh"],
+            "devices": {device_key(k): kwh for k, kwh in v["devices"].items()},
+        }, upsert=True)
+        for day, v in days.items()
+    ]
+    if ops:
+        coll.bulk_write(ops, ordered=False)
+    return len(ops)
+
+
+def check(since_day=None, tolerance=1e-6):
+    """Compare rollups with the raw recomputation; returns a list of human-readable mismatches."""
+    raw = raw_rollups(since_day)
+    rolled = read_rollups(since_day or "")
+    problems = []
+    for day in sorted(set(raw) | set(rolled)):
+        a, b = raw.get(day), rolled.get(day)
+        if a is None or b is None:
+            problems.append(f"{day}: {'missing rollup' if b is None else 'rollup without executions'}")
+            continue
+        if a["executions"] != b["executions"]:
+            problems.append(f"{day}: executions raw={a['executions']} rollup={b['executions']}")
+        if abs(a["kwh"] - b["kwh"]) > tolerance:
+            problems.append(f"{day}: kwh raw={a['kwh']:.4f} rollup={b['kwh']:.4f}")
+        for dev in sorted(set(a["devices"]) | set(b["devices"])):
+            if abs(a["devices"].get(dev, 0.0) - b["devices"].get(dev, 0.0)) > tolerance:
+                problems.append(f"{day}: {dev} raw={a['devices'].get(dev, 0.0):.4f} "
+                                f"rollup={b['devices'].get(dev, 0.0):.4f}")
+    return problems
+
+
+def _day_start(day):
+    return datetime.strptime(day, "%Y-%m-%d")
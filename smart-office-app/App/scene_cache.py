@@ -0,0 +1,102 @@
+# App/scene_cache.py
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from bson import ObjectId
+
+from . import mongo
+
+SCENE_CACHE_SIZE = int(os.getenv("SCENE_CACHE_SIZE", "1024"))
+SCENE_CACHE_TTL = float(os.getenv("SCENE_CACHE_TTL_SECONDS", "60"))
+
+
+def _expand(scene):
+    """Scene document -> the device actions trigger_motion fires for it."""
+    if not scene:
+        return ()
+    return tuple(
+        {"device_id": d.get("device_id"), "action": "set_state", "state": d.get("state", {})}
+        for d in scene.get("devices", [])
+    )
+
+
+class SceneCache:
+    """
+    LRU + TTL cache of scene_id -> expanded device actions.
+    Keys are ("id", <ObjectId hex>) or ("name", <scene name>), mirroring how
+    trigger_motion resolves a scene_id. Missing scenes are cached too, so a
+    rule pointing at a deleted scene doesn't hit Mongo on every event.
+    """
+
+    def __init__(self, maxsize=SCENE_CACHE_SIZE, ttl=SCENE_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key_and_query(scene_id):
+        try:
+            oid = ObjectId(scene_id)
+            return ("id", str(oid)), {"_id": oid}
+        except Exception:
+            return ("name", scene_id), {"name": scene_id}
+
+    def _get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[0] < time.monotonic():
+                del self._data[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._data.move_to_end(key)
+            return entry
+
+    def _put(self, key, actions):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, actions)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def resolve(self, scene_id):
+        """Return fresh copies of the device actions for a scene_id ([] if unknown)."""
+        key, query = self._key_and_query(scene_id)
+        try:
+            entry = self._get(key)
+        except TypeError:               # unhashable scene_id -> just ask Mongo
+            return [dict(a) for a in _expand(mongo.db.automation_scenes.find_one(query))]
+
+        if entry is not None:
+            actions = entry[1]
+        else:
+            actions = _expand(mongo.db.automation_scenes.find_one(query))
+            self._put(key, actions)
+        return [dict(a) for a in actions]
+
+    def invalidate(self, scene_id=None, name=None):
+        with self._lock:
+            if scene_id is not None:
+                self._data.pop(("id", str(scene_id)), None)
+            if name is not None:
+                self._data.pop(("name", name), None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+# Shared cache used by the automation blueprint
+scene_cache = SceneCache()
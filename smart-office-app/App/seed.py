@@ -0,0 +1,60 @@
+# App/seed.py
+# Initial data for a fresh database. Safe to run on every deploy: existing
+# documents (live device state, bookings, reservations) are left alone unless
+# reset=True is passed explicitly.
+from pymongo import UpdateOne
+
+from . import journal, mongo
+from .blueprints.meeting_rooms import migrate_legacy_bookings, seed_meeting_rooms
+from .blueprints.parking import (rebuild_checkin_summaries, rebuild_reservation_summaries, seed_parking_spots,
+                                 trim_embedded_attempts)
+from .indexes import ensure_indexes
+from .versions import record_write
+
+INITIAL_ROOMS = ['london', 'boot', 'meeting']
+
+
+def seed_devices():
+    """Create lights + room_states for the initial rooms if they don't exist yet."""
+    mongo.db.lights.bulk_write([
+        UpdateOne({"room": name}, {"$setOnInsert": {"room": name, "is_on": False}}, upsert=True)
+        for name in INITIAL_ROOMS
+    ])
+    mongo.db.room_states.bulk_write([
+        UpdateOne({"room": name}, {"$setOnInsert": {"room": name, "ac_on": False, "temperature": None}}, upsert=True)
+        for name in INITIAL_ROOMS
+    ])
+
+
+# Seeding and data migrations run at bootstrap, in order. Their names are part
+# of the bootstrap key (App/lifecycle.py), so adding one re-runs bootstrap on
+# the next rollout.
+MIGRATIONS = (
+    seed_devices,
+    seed_meeting_rooms,
+    seed_parking_spots,
+    trim_embedded_attempts,     # spots written before attempts were $slice-bounded
+    rebuild_checkin_summaries,  # check-ins recorded before summaries were maintained
+    rebuild_reservation_summaries,  # reservation attempts made before summaries held them
+    migrate_legacy_bookings,    # bookings made before room_bookings existed
+)
+
+
+def seed_all(reset=False):
+    """Idempotent seeding of every collection the UI expects to be populated."""
+    if reset:
+        # old dev-server behaviour: wipe state and bookings, start from scratch
+        for name in ("lights", "room_states", "meeting_rooms", "parking_spots", "parking_attempts", "checkins",
+                     "checkin_summaries", "room_bookings"):
+            mongo.db[name].delete_many({})
+
+    for migration in MIGRATIONS:
+        migration()
+
+    ensure_indexes()        # everything in App/indexes.py (audit: python -m App.commands audit-queries)
+
+    # pollers holding ETags from before the seed must refetch
+    for name in ("lights", "room_states", "meeting_rooms", "parking_spots"):
+        record_write(name)
+    # the seed writes bypass the journal: snapshot the result so state_at() starts from it
+    journal.take_snapshot()
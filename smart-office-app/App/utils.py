@@ -5,9 +5,14 @@ def parse_time(timestr):
     """
     Parses a time string into a datetime object.
     Supports '%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M', and '%Y-%m-%d %H:%M:%S.%f' formats.
+    datetime objects (e.g. BSON dates read back from Mongo) are returned as-is.
     """
     if timestr is None:
         return None
+    if isinstance(timestr, datetime.datetime):
+        return timestr
+    if not isinstance(timestr, str):
+        return None
     for fmt in ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M", "%Y-%m-%d %H:%M:%S.%f"): # Added .%f for isoformat
         try:
             return datetime.datetime.strptime(timestr, fmt)
@@ -0,0 +1,154 @@
+# App/versions.py
+# Per-collection version counters for the status endpoints. Every write path
+# calls record_write(); GET views wrapped in @versioned(...) then answer
+# If-None-Match with 304, or with a cached serialized body, without querying
+# the collections themselves. Counters live in `collection_versions` so all
+# workers/replicas agree; each process re-reads them at most every
+# VERSION_CACHE_SECONDS.
+import functools
+import itertools
+import os
+import threading
+import time
+
+from bson import ObjectId
+from flask import make_response, request
+from pymongo import ReturnDocument
+from pymongo.errors import PyMongoError
+
+from . import mongo
+from .live import live_bus
+
+VERSION_CACHE_SECONDS = float(os.getenv("VERSION_CACHE_SECONDS", "1"))
+MAX_CACHED_BODIES = 256
+
+
+class Versions:
+    def __init__(self, ttl=VERSION_CACHE_SECONDS):
+        self.ttl = ttl
+        self._versions = {}             # collection -> "epoch.n"
+        self._loaded_at = 0.0
+        self._bodies = {}               # (endpoint, query string) -> (etag, body, mimetype)
+        self._pending = {}              # collection -> bumps still in flight (see mark_pending)
+        self._seq = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def bump(self, *collections):
+        """Increment the counters; returns the new version of the last one."""
+        version = None
+        for name in collections:
+            # the epoch changes if the counters are ever wiped, so old ETags can't match again
+            doc = mongo.db.collection_versions.find_one_and_update(
+                {"_id": name},
+                {"$inc": {"v": 1}, "$setOnInsert": {"epoch": str(ObjectId())}},
+                upsert=True, return_document=ReturnDocument.AFTER,
+            )
+            version = f"{doc['epoch']}.{doc['v']}"
+            with self._lock:
+                self._versions[name] = version      # our own writes show at once
+        return version
+
+    def mark_pending(self, name):
+        """
+        Move `name`'s version locally at once, for a write whose bump is still
+        in flight, so this process's ETags and cached bodies change with the
+        write. Returns (previous version, provisional version); the bump must
+        be followed by settle(name).
+        """
+        with self._lock:
+            previous = self._versions.get(name, "0")
+            provisional = f"{previous}+{next(self._seq)}"
+            self._versions[name] = provisional
+            self._pending[name] = self._pending.get(name, 0) + 1
+        return previous, provisional
+
+    def settle(self, name):
+        with self._lock:
+            if self._pending.get(name, 0) > 1:
+                self._pending[name] -= 1
+            else:
+                self._pending.pop(name, None)
+
+    def current(self, *collections):
+        with self._lock:
+            fresh = time.monotonic() - self._loaded_at < self.ttl
+        if not fresh:
+            versions = {d["_id"]: f"{d['epoch']}.{d['v']}" for d in mongo.db.collection_versions.find({})}
+            with self._lock:
+                # a provisional version stays until its bump lands
+                versions.update({name: self._versions[name] for name in self._pending if name in self._versions})
+                self._versions, self._loaded_at = versions, time.monotonic()
+        with self._lock:
+            return tuple(self._versions.get(name, "0") for name in collections)
+
+    def etag(self, *collections):
+        return "-".join(self.current(*collections))
+
+    # ---- cached bodies ----
+    def cached_body(self, key, etag):
+        with self._lock:
+            entry = self._bodies.get(key)
+        return entry if entry and entry[0] == etag else None
+
+    def store_body(self, key, etag, body, mimetype):
+        with self._lock:
+            if len(self._bodies) >= MAX_CACHED_BODIES and key not in self._bodies:
+                self._bodies.clear()        # only a handful of endpoint/query combinations in practice
+            self._bodies[key] = (etag, body, mimetype)
+
+    def clear(self):
+        with self._lock:
+            self._versions, self._loaded_at, self._bodies, self._pending = {}, 0.0, {}, {}
+
+
+# Shared per-process counters
+versions = Versions()
+
+
+def record_write(collection, key=None, doc=None, pending=False):
+    """
+    Call after changing a document of lights/room_states/meeting_rooms/parking_spots;
+    returns the collection's new version (None if it couldn't be bumped).
+    pending=True settles an earlier versions.mark_pending(collection).
+    """
+    version = None
+    try:
+        version = versions.bump(collection)
+    except PyMongoError as e:
+        # worst case pollers keep a stale copy until the next successful bump
+        print("⚠️ version bump failed:", e)
+    finally:
+        if pending:
+            versions.settle(collection)
+    if key is not None:
+        live_bus.touch(collection, key, doc)
+    return version
+
+
+def versioned(*collections):
+    """Serve a GET view with an ETag derived from the versions of `collections`."""
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            try:
+                tag = versions.etag(*collections)
+            except PyMongoError:
+                return view(*args, **kwargs)        # no versions -> plain uncached answer
+            if tag in request.if_none_match:
+                resp = make_response("", 304)
+            else:
+                key = (request.endpoint, request.query_string, tuple(sorted(kwargs.items())))
+                cached = versions.cached_body(key, tag)
+                if cached:
+                    resp = make_response(cached[1], 200)
+                    resp.mimetype = cached[2]
+                else:
+                    resp = make_response(view(*args, **kwargs))
+                    if resp.status_code != 200:
+                        return resp
+                    versions.store_body(key, tag, resp.get_data(), resp.mimetype)
+            resp.set_etag(tag)
+            resp.headers["Cache-Control"] = "no-cache"     # always revalidate, never serve stale
+            return resp
+        return wrapper
+    return decorator
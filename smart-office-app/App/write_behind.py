@@ -0,0 +1,242 @@
+# App/write_behind.py
+import atexit
+import os
+import queue
+import threading
+import time
+
+from pymongo import InsertOne
+from pymongo.errors import BulkWriteError, PyMongoError, ServerSelectionTimeoutError
+
+from . import mongo
+
+# Queue/flush tuning (env so it can be changed per deployment)
+WRITE_BEHIND_ENABLED = os.getenv("WRITE_BEHIND_ENABLED", "1") == "1"
+WRITE_BEHIND_MAX_QUEUE = int(os.getenv("WRITE_BEHIND_MAX_QUEUE", "10000"))
+WRITE_BEHIND_BATCH_SIZE = int(os.getenv("WRITE_BEHIND_BATCH_SIZE", "500"))
+WRITE_BEHIND_FLUSH_SECONDS = float(os.getenv("WRITE_BEHIND_FLUSH_SECONDS", "0.5"))
+WRITE_BEHIND_PUT_TIMEOUT = float(os.getenv("WRITE_BEHIND_PUT_TIMEOUT_SECONDS", "1"))
+# A failed flush is retried this many times in all, backing off from RETRY_SECONDS (doubling, max 5 s)
+WRITE_BEHIND_ATTEMPTS = int(os.getenv("WRITE_BEHIND_ATTEMPTS", "5"))
+WRITE_BEHIND_RETRY_SECONDS = float(os.getenv("WRITE_BEHIND_RETRY_SECONDS", "0.1"))
+
+DUPLICATE_KEY = 11000
+# Update operators that change the document again each time they are applied
+NOT_REPLAYABLE = ("$inc", "$mul", "$push", "$currentDate")
+
+_STOP = object()
+
+
+class WriteBehind:
+    """
+    Bounded in-memory queue of Mongo writes drained by a background thread.
+    Used for audit-style writes (automation events/executions) that the
+    request doesn't need to wait for. Batches are flushed when they reach
+    batch_size or flush_interval seconds after the first queued write.
+    A batch that can't be written (connection lost, failover) is retried with
+    backoff and then put back on the queue; only writes MongoDB rejects one by
+    one (duplicate _id, validation) are dropped. The server may have applied a
+    batch whose acknowledgement was lost, so only writes that are safe to
+    apply twice are resent (see replayable()); queue counters as guarded
+    pipeline updates, like App/savings_rollups.py does.
+    """
+
+    def __init__(self, maxsize=WRITE_BEHIND_MAX_QUEUE, batch_size=WRITE_BEHIND_BATCH_SIZE,
+                 flush_interval=WRITE_BEHIND_FLUSH_SECONDS, put_timeout=WRITE_BEHIND_PUT_TIMEOUT,
+                 enabled=WRITE_BEHIND_ENABLED, attempts=WRITE_BEHIND_ATTEMPTS,
+                 retry_delay=WRITE_BEHIND_RETRY_SECONDS):
+        self.maxsize = maxsize
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.put_timeout = put_timeout
+        self.enabled = enabled
+        self.attempts = max(1, attempts)
+        self.retry_delay = retry_delay
+        self.on_flush = None            # callback(seconds, n_ops) - wired to Prometheus in run.py
+        self.flushed = 0
+        self.sync_writes = 0
+        self.errors = 0
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    # ---- producer side ----
+    def insert(self, collection, doc):
+        """Queue a document insert into `collection`."""
+        self.submit(collection, doc)
+
+    def insert_many(self, collection, docs):
+        """Queue several inserts; written as one insert_many when the queue is off."""
+        if not docs:
+            return
+        if not self.enabled:
+            self._write_now(collection, list(docs))
+            return
+        for doc in docs:
+            self.submit(collection, doc)
+
+    def submit(self, collection, op):
+        """Queue a document (insert) or a pymongo write op (UpdateOne...) for `collection`."""
+        if not self.enabled:
+            self._write_now(collection, [op])
+            return
+        self._ensure_worker()
+        try:
+            self._queue.put((collection, op), timeout=self.put_timeout)
+        except queue.Full:
+            # backpressure: the queue is full, so this caller pays for its own write
+            self.sync_writes += 1
+            self._write_now(collection, [op])
+
+    @property
+    def depth(self):
+        return self._queue.qsize()
+
+    # ---- worker side ----
+    def _ensure_worker(self):
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            if self._pid is not None and self._pid != os.getpid():
+                # forked child: the parent's queue and thread don't exist here
+                self._queue = queue.Queue(maxsize=self.maxsize)
+            else:
+                atexit.register(self.stop)
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                return
+            batch = [item]
+            deadline = time.monotonic() + self.flush_interval
+            stop = False
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    nxt = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if nxt is _STOP:
+                    stop = True
+                    break
+                batch.append(nxt)
+            self._flush_batch(batch)
+            if stop:
+                return
+
+    def _flush_batch(self, batch):
+        started = time.perf_counter()
+        by_collection = {}
+        for collection, op in batch:
+            by_collection.setdefault(collection, []).append(op)
+        for collection, ops in by_collection.items():
+            unwritten = self._write(collection, ops)
+            if unwritten:
+                self._requeue(collection, unwritten)
+        self.flushed += len(batch)
+        if self.on_flush:
+            self.on_flush(time.perf_counter() - started, len(batch))
+
+    def _write(self, collection, ops):
+        """
+        Write ops unordered, retrying transient failures with backoff; returns
+        the ops still unwritten after the last attempt.
+        """
+        coll = mongo.db[collection]
+        delay = self.retry_delay
+        for attempt in range(self.attempts):
+            try:
+                # inserts get their _id on the first attempt, so a retry can't insert twice
+                if all(isinstance(op, dict) for op in ops):
+                    coll.insert_many(ops, ordered=False)
+                else:
+                    coll.bulk_write([InsertOne(op) if isinstance(op, dict) else op for op in ops], ordered=False)
+                return []
+            except BulkWriteError as e:
+                # unordered: everything not listed in writeErrors was applied
+                failed = [
+                    err for err in e.details.get("writeErrors", [])
+                    if not (attempt and err.get("code") == DUPLICATE_KEY)     # written by an earlier attempt
+                ]
+                if failed:
+                    self.dropped += len(failed)
+                    print(f"⚠️ write-behind: {collection} rejected {len(failed)} write(s):", failed[0].get("errmsg"))
+                return []
+            except PyMongoError as e:
+                self.errors += 1
+                print(f"⚠️ write-behind flush to {collection} failed (attempt {attempt + 1}/{self.attempts}):", e)
+                if not isinstance(e, ServerSelectionTimeoutError):      # the batch may have been applied
+                    unsafe = [op for op in ops if not replayable(op)]
+                    if unsafe:
+                        self.dropped += len(unsafe)
+                        print(f"⚠️ write-behind: not resending {len(unsafe)} non-idempotent write(s) to {collection}")
+                        ops = [op for op in ops if replayable(op)]
+                        if not ops:
+                            return []
+                if attempt + 1 < self.attempts:
+                    time.sleep(delay)
+                    delay = min(delay * 2, 5.0)
+        return ops
+
+    def _write_now(self, collection, ops):
+        """Write in the caller's thread (queue off or full); nothing to re-queue into."""
+        unwritten = self._write(collection, ops)
+        if unwritten:
+            self.dropped += len(unwritten)
+
+    def _requeue(self, collection, ops):
+        """Put a batch that failed every attempt back behind the queued writes."""
+        for i, op in enumerate(ops):
+            try:
+                self._queue.put_nowait((collection, op))
+            except queue.Full:
+                self.dropped += len(ops) - i
+                print(f"⚠️ write-behind queue full, dropped {len(ops) - i} write(s) to {collection}")
+                return
+
+    def flush(self):
+        """Synchronously write everything currently queued (caller's thread)."""
+        batch = []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not _STOP:
+                batch.append(item)
+        if batch:
+            self._flush_batch(batch)
+
+    def stop(self, timeout=10):
+        """Stop the worker and flush whatever is left (registered with atexit)."""
+        thread = self._thread
+        if thread is not None and thread.is_alive() and self._pid == os.getpid():
+            self._queue.put(_STOP)
+            thread.join(timeout)
+        self._thread = None
+        self.flush()
+
+
+def replayable(op):
+    """
+    Whether resending `op` after an unacknowledged attempt can't apply it twice:
+    inserts (their _id is assigned on the first attempt), replaces, deletes, and
+    updates without counter-style operators. Pipeline updates count as
+    replayable; queue only guarded ones.
+    """
+    update = getattr(op, "_doc", None)
+    return not isinstance(update, dict) or not any(k in update for k in NOT_REPLAYABLE)
+
+
+# Shared write-behind queue
+write_behind = WriteBehind()
@@ -0,0 +1,41 @@
+# gunicorn.conf.py - production server settings (override with env vars)
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+
+# Threaded workers: Flask views mostly wait on MongoDB, so a few threads per
+# process and one process per core scale with the CPU count. Each open live
+# stream (/api/live/stream) parks one thread, so keep GUNICORN_THREADS above
+# LIVE_MAX_STREAMS (24 by default).
+# GUNICORN_WORKER_CLASS=gevent serves every request from a greenlet instead:
+# an idle live stream then costs a few KB, so a worker holds hundreds of them
+# (up to GUNICORN_WORKER_CONNECTIONS) next to the regular API traffic.
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", "gthread")
+workers = int(os.getenv("GUNICORN_WORKERS", multiprocessing.cpu_count()))
+threads = int(os.getenv("GUNICORN_THREADS", "32"))
+worker_connections = int(os.getenv("GUNICORN_WORKER_CONNECTIONS", "1000"))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "30"))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", "20"))
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", "5"))
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", "0"))
+max_requests_jitter = int(os.getenv("GUNICORN_MAX_REQUESTS_JITTER", "0"))
+
+# Load the app in each worker after fork, so every worker builds its own
+# MongoClient / pool (PyMongo clients are not fork-safe).
+preload_app = False
+
+accesslog = os.getenv("GUNICORN_ACCESS_LOG", "-")
+errorlog = "-"
+
+
+def post_worker_init(worker):
+    """Per-worker startup: bootstrap (once per deployment), cache warm-up, background loops."""
+    from App.lifecycle import lifecycle
+    lifecycle.start(worker.wsgi)
+
+
+def worker_exit(server, worker):
+    """Flush write-behind queues before the worker goes away."""
+    from App.lifecycle import lifecycle
+    lifecycle.shutdown()
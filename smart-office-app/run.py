@@ -1,14 +1,31 @@
-import threading
+import os
 from App import create_app, mongo
-from App.blueprints.control import schedule_loop
-from App.blueprints.energy import energy_loop
-from App.blueprints.meeting_rooms import seed_meeting_rooms
-from App.blueprints.parking import seed_parking_spots
-from App.blueprints.automation_rules import automation_rules_bp
-from prometheus_client import Counter, Gauge, Histogram, generate_latest, CONTENT_TYPE_LATEST
+from App.device_cache import device_cache
+from App.lifecycle import lifecycle
+from App.live import live_bus
+from App.scene_cache import scene_cache
+from App.write_behind import write_behind
+from prometheus_client import Counter, Gauge, Histogram, REGISTRY, generate_latest, CONTENT_TYPE_LATEST
+from prometheus_client.core import CounterMetricFamily
 import time
 
 app = create_app()
+
+
+class InProcessCounter:
+    """
+    A Prometheus counter read at scrape time from a count the app already keeps
+    (cache hits, ...), so the hot path pays no extra locking. `name` is given
+    without the _total suffix; the exposition adds it.
+    """
+
+    def __init__(self, name, documentation, read):
+        self.name, self.documentation, self.read = name, documentation, read
+        REGISTRY.register(self)
+
+    def collect(self):
+        yield CounterMetricFamily(self.name, self.documentation, value=self.read())
+
 # --- 2. (Health & Metrics) ---
 # 1. מונה בקשות עם תוויות (Labels) לניתוח מעמיק
 REQUEST_COUNT = Counter(
@@ -31,6 +48,65 @@ REQUEST_LATENCY = Histogram(
     ['endpoint']
 )
 
+# 4. מטמון הסצנות (Scene cache) של האוטומציה
+SCENE_CACHE_HITS = InProcessCounter(
+    'smart_office_scene_cache_hits',
+    'Scene lookups served from the in-process scene cache',
+    lambda: scene_cache.hits
+)
+SCENE_CACHE_MISSES = InProcessCounter(
+    'smart_office_scene_cache_misses',
+    'Scene lookups that had to query automation_scenes',
+    lambda: scene_cache.misses
+)
+SCENE_CACHE_SIZE = Gauge(
+    'smart_office_scene_cache_entries',
+    'Number of scene ids/names currently cached'
+)
+
+# 5. תור הכתיבה המושהית (Write-behind) לאירועי אוטומציה
+WRITE_BEHIND_QUEUE_DEPTH = Gauge(
+    'smart_office_write_behind_queue_depth',
+    'Writes waiting in the write-behind queue'
+)
+WRITE_BEHIND_FLUSH_LATENCY = Histogram(
+    'smart_office_write_behind_flush_duration_seconds',
+    'Time spent flushing one write-behind batch to MongoDB'
+)
+WRITE_BEHIND_SYNC_WRITES = InProcessCounter(
+    'smart_office_write_behind_sync_writes',
+    'Writes done synchronously because the write-behind queue was full',
+    lambda: write_behind.sync_writes
+)
+WRITE_BEHIND_DROPPED = InProcessCounter(
+    'smart_office_write_behind_dropped_writes',
+    'Queued writes given up on (rejected by MongoDB, out of retries, or no room to requeue)',
+    lambda: write_behind.dropped
+)
+write_behind.on_flush = lambda seconds, n: WRITE_BEHIND_FLUSH_LATENCY.observe(seconds)
+
+# 6. חיבורי Live (SSE) פתוחים בתהליך הזה - מחליפים את ה-Polling של הדפים
+LIVE_STREAMS = Gauge(
+    'smart_office_live_streams',
+    'Open /api/live/stream connections in this process'
+)
+
+# 7. מטמון מצב המכשירים (תאורה, מזגנים, חדרי ישיבות) - יחס פגיעות
+DEVICE_CACHE_HITS = InProcessCounter(
+    'smart_office_device_cache_hits',
+    'Device-state reads served from the in-process cache',
+    lambda: device_cache.hits
+)
+DEVICE_CACHE_MISSES = InProcessCounter(
+    'smart_office_device_cache_misses',
+    'Device-state reads that reloaded a collection from MongoDB',
+    lambda: device_cache.misses
+)
+DEVICE_CACHE_HIT_RATIO = Gauge(
+    'smart_office_device_cache_hit_ratio',
+    'Share of device-state reads served from memory'
+)
+
 # --- 🚀 נתיבי האפליקציה (Routes) ---
 
 @app.route('/metrics')
@@ -38,6 +114,10 @@ def metrics():
     """החזרת הפלט בפורמט Prometheus תקני"""
     # עדכון זמן הריצה רגע לפני השליחה
     UPTIME_GAUGE.set(time.time() - APP_START_TIME)
+    SCENE_CACHE_SIZE.set(len(scene_cache))
+    WRITE_BEHIND_QUEUE_DEPTH.set(write_behind.depth)
+    LIVE_STREAMS.set(live_bus.subscribers)
+    DEVICE_CACHE_HIT_RATIO.set(device_cache.hit_ratio)
     return generate_latest(), 200, {'Content-Type': CONTENT_TYPE_LATEST}
 
 # Liveness Probe
@@ -45,42 +125,27 @@ def metrics():
 def health_live():
     return {"status": "alive"}, 200
 
-# Readiness Probe
+# Readiness Probe - also reports startup/warm-up progress (see App/lifecycle.py)
 @app.route('/health/ready')
 def health_ready():
+    status = lifecycle.status()
     try:
         mongo.db.command('ping')
-        return {"status": "ready", "db": "connected"}, 200
+        status["db"] = "connected"
     except Exception as e:
-        return {"status": "not ready", "error": str(e)}, 503
+        status["db"] = "unreachable"
+        status["error"] = str(e)
+        return {"status": "not ready", **status}, 503
+    if not lifecycle.ready:
+        return {"status": "not ready", **status}, 503
+    return {"status": "ready", **status}, 200
 # -----------------------------------------------------
 
 if __name__ == '__main__':
-    with app.app_context():
-
-        # Clear and re-seed lights + room_states
-        mongo.db.lights.delete_many({})
-        mongo.db.room_states.delete_many({})
-
-        initial_rooms = ['london', 'boot', 'meeting']
-
-        lights_to_insert = [{"room": name, "is_on": False} for name in initial_rooms]
-        mongo.db.lights.insert_many(lights_to_insert)
-
-        states_to_insert = [{"room": name, "ac_on": False, "temperature": None} for name in initial_rooms]
-        mongo.db.room_states.insert_many(states_to_insert)
-
-
-        mongo.db.meeting_rooms.delete_many({})   # wipe old bookings
-        seed_meeting_rooms()                     # re-seed as available
-
-        mongo.db.parking_spots.delete_many({})  # clear existing spots
-        seed_parking_spots()  # insert new random spots
-
-
-    # Start background threads for HVAC scheduling and energy monitoring
-    threading.Thread(target=schedule_loop, args=(app,), daemon=True).start()
-    threading.Thread(target=energy_loop, args=(app,), daemon=True).start()
+    # Development server only - production runs gunicorn with wsgi.py/gunicorn.conf.py.
+    # Seeds/creates indexes once per deployment (idempotent, never wipes live state),
+    # warms caches and starts the HVAC scheduling / energy monitoring threads.
+    lifecycle.start(app, background=False)
 
     # Start the Flask development server
-    app.run(host="0.0.0.0", port=5000, debug=True)
+    app.run(host="0.0.0.0", port=5000, debug=os.getenv("FLASK_DEBUG", "1") == "1")
@@ -0,0 +1,18 @@
+# Helpers for the tests that need a real mongod (skipped when none is reachable).
+import os
+
+from pymongo import MongoClient
+from pymongo.errors import PyMongoError
+
+TEST_MONGO_URI = os.getenv("TEST_MONGO_URI", "mongodb://localhost:27017/smart_office_test")
+
+
+def local_mongo_db():
+    """Return a handle to the test database, or None if no mongod answers quickly."""
+    client = MongoClient(TEST_MONGO_URI, serverSelectionTimeoutMS=500)
+    try:
+        client.admin.command("ping")
+    except PyMongoError:
+        client.close()
+        return None
+    return client.get_default_database()
@@ -8,27 +8,29 @@ class BasicTests(unittest.TestCase):
         self.app = app.test_client()
         self.app.testing = True
 
-    # הטלאי (Patch) חייב להיות כאן כדי למנוע חיבור ל-DB האמיתי
-    @patch('App.blueprints.parking.mongo')
-    def test_health_live(self, mock_parking_mongo):
-        # מלמדים את ה-Mock להחזיר 0 כשהאפליקציה שואלת "כמה מסמכים יש?"
-        # זה פותר את שגיאת ה-TypeError שהייתה קודם
-        mock_parking_mongo.db.parking_spots.count_documents.return_value = 0
-        
-        # מלמדים את ה-Mock לא לקרוס כשהאפליקציה מנסה למחוק נתונים
-        mock_parking_mongo.db.parking_spots.delete_many.return_value.deleted_count = 0
-
-        # הרצת הבדיקה בפועל
+    # אין יותר Seed בזמן בקשה (ראו App/lifecycle.py), ולכן אין צורך ב-Mock של ה-DB
+    def test_health_live(self):
         response = self.app.get('/health/live')
         self.assertEqual(response.status_code, 200)
 
-    @patch('App.blueprints.parking.mongo')
-    def test_metrics(self, mock_parking_mongo):
-        # גם כאן צריך להגדיר את זה, כי הקוד רץ בכל בקשה
-        mock_parking_mongo.db.parking_spots.count_documents.return_value = 0
-        
+    def test_metrics(self):
         response = self.app.get('/metrics')
         self.assertEqual(response.status_code, 200)
+        body = response.get_data(as_text=True)
+        # ספירות מצטברות נחשפות כ-Counter, כדי ש-rate()/increase() יעבדו
+        for name in ('smart_office_scene_cache_hits', 'smart_office_scene_cache_misses',
+                     'smart_office_write_behind_sync_writes', 'smart_office_write_behind_dropped_writes',
+                     'smart_office_device_cache_hits', 'smart_office_device_cache_misses'):
+            self.assertIn(f'# TYPE {name}_total counter', body)
+            self.assertIn(f'{name}_total ', body)
+
+    # לפני שה-Lifecycle סיים את שלב ה-startup ה-Pod לא אמור לקבל תעבורה
+    @patch('run.mongo')
+    def test_health_ready_waits_for_startup(self, mock_mongo):
+        mock_mongo.db.command.return_value = {"ok": 1}
+        response = self.app.get('/health/ready')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.get_json()["phase"], "not_started")
 
 if __name__ == "__main__":
-    unittest.main()
\ No newline at end of file
+    unittest.main()
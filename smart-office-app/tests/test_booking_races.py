@@ -0,0 +1,128 @@
+import datetime
+import random
+import threading
+import unittest
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+from App.bookings import BookingIndex
+from run import app
+from tests.mongo_utils import local_mongo_db
+
+T0 = datetime.datetime(2026, 10, 19, 9, 0)
+
+
+class ExtendCasTests(unittest.TestCase):
+
+    @patch('App.bookings.record_write')
+    @patch('App.bookings.mongo')
+    def test_extension_retries_after_losing_a_race(self, mongo, _record_write):
+        ends = [T0 + datetime.timedelta(hours=1), T0 + datetime.timedelta(hours=1, minutes=10)]
+        mongo.db.room_bookings.find_one.side_effect = [
+            {"_id": "london", "bookings": [{"id": "bk-1", "start": T0, "end": end}]} for end in ends
+        ]
+        won = {"_id": "london", "bookings": [{"id": "bk-1", "start": T0, "end": ends[1] + datetime.timedelta(minutes=5)}]}
+        mongo.db.room_bookings.find_one_and_update.side_effect = [None, won]    # someone else extended first
+
+        room, booking, reason = BookingIndex().extend("bk-1", datetime.timedelta(minutes=5))
+        self.assertEqual((room, reason), ("london", None))
+        self.assertEqual(booking["end"], ends[1] + datetime.timedelta(minutes=5))
+        flt = mongo.db.room_bookings.find_one_and_update.call_args.args[0]
+        self.assertEqual(flt["$and"][0], {"bookings": {"$elemMatch": {"id": "bk-1", "end": ends[1]}}})
+
+    @patch('App.bookings.mongo')
+    def test_extension_stops_at_the_next_booking(self, mongo):
+        mongo.db.room_bookings.find_one.return_value = {"_id": "london", "bookings": [
+            {"id": "bk-1", "start": T0, "end": T0 + datetime.timedelta(hours=1)},
+            {"id": "bk-2", "start": T0 + datetime.timedelta(hours=1, minutes=15), "end": T0 + datetime.timedelta(hours=2)},
+        ]}
+        self.assertEqual(BookingIndex().extend("bk-1", datetime.timedelta(minutes=30))[2], "conflict")
+        mongo.db.room_bookings.find_one_and_update.assert_not_called()
+
+
+class BookingLoadTests(unittest.TestCase):
+    """500 concurrent requests against a real mongod (skipped without one)."""
+
+    def setUp(self):
+        self.db = local_mongo_db()
+        if self.db is None:
+            self.skipTest("no local mongod")
+        self.db.drop_collection("room_bookings")
+        self.db.drop_collection("meeting_rooms")
+        self.db.meeting_rooms.insert_many([{"room_name": r, "is_available": True} for r in ("london", "boot")])
+        versions = MagicMock()
+        versions.current.return_value = ("static",)      # each request re-reads on conflict anyway
+        patches = [
+            patch('App.bookings.mongo', SimpleNamespace(db=self.db)),
+            patch('App.bookings.versions', versions),
+            patch('App.bookings.record_write'),
+            patch('App.blueprints.meeting_rooms.mongo', SimpleNamespace(db=self.db)),
+            patch('App.blueprints.meeting_rooms.record_write'),
+            patch('App.blueprints.meeting_rooms.journal'),
+            patch('App.blueprints.meeting_rooms.booking_index', BookingIndex()),
+            patch('App.blueprints.meeting_rooms.device_cache'),
+        ]
+        for p in patches:
+            p.start()
+            self.addCleanup(p.stop)
+
+    def _hammer(self, requests):
+        results, barrier = [None] * len(requests), threading.Barrier(len(requests))
+
+        def worker(i, method, url, body):
+            client = app.test_client()
+            barrier.wait()
+            r = getattr(client, method)(url, json=body)
+            results[i] = (r.status_code, r.get_json())
+
+        threads = [threading.Thread(target=worker, args=(i, *req)) for i, req in enumerate(requests)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        return results
+
+    def _bookings(self, room):
+        return sorted((self.db.room_bookings.find_one({"_id": room}) or {}).get("bookings", []),
+                      key=lambda b: b["start"])
+
+    def test_no_double_bookings_at_500_concurrent_requests(self):
+        rnd = random.Random(1)
+        base = datetime.datetime.utcnow().replace(microsecond=0) + datetime.timedelta(days=1)
+        requests = [("post", "/api/meetings/rooms/book", {"room": "london", "user": f"u{i}"}) for i in range(250)]
+        for i in range(250):
+            start = base + datetime.timedelta(minutes=15 * rnd.randrange(40))
+            requests.append(("post", "/api/meetings/bookings", {
+                "room": "boot", "user": f"u{i}", "start": start.isoformat(),
+                "end": (start + datetime.timedelta(minutes=15 * rnd.randrange(1, 5))).isoformat()}))
+        results = self._hammer(requests)
+
+        self.assertEqual(sum(1 for code, _ in results[:250] if code == 200), 1)
+        self.assertTrue(all(code in (200, 201, 409) for code, _ in results))
+        for room in ("london", "boot"):
+            bookings = self._bookings(room)
+            for a, b in zip(bookings, bookings[1:]):
+                self.assertLessEqual(a["end"], b["start"], f"overlap in {room}")
+        ids = [b["id"] for room in ("london", "boot") for b in self._bookings(room)]
+        self.assertEqual(len(ids), len(set(ids)))
+        self.assertEqual(len(self._bookings("boot")), sum(1 for code, _ in results[250:] if code == 201))
+
+    def test_concurrent_extensions_are_not_lost(self):
+        client = app.test_client()
+        booking_id = client.post('/api/meetings/rooms/book', json={"room": "london"}).get_json()["booking_id"]
+        start_end = self._bookings("london")[0]["end"]
+
+        results = self._hammer([("put", "/api/meetings/rooms/london/extend", {"extra_minutes": 1})] * 100)
+        extended = sum(1 for code, _ in results if code == 200)
+        self.assertGreater(extended, 0)
+        booking = self._bookings("london")[0]
+        self.assertEqual(booking["id"], booking_id)
+        self.assertEqual(booking["end"], start_end + datetime.timedelta(minutes=extended))
+
+        # cancelling by id removes exactly that booking
+        self.assertEqual(client.delete(f'/api/meetings/rooms/{booking_id}').status_code, 200)
+        self.assertEqual(self._bookings("london"), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,121 @@
+import datetime
+import random
+import time
+import unittest
+from unittest.mock import patch
+
+from pymongo.errors import DuplicateKeyError
+
+from App.bookings import BookingIndex, RoomSchedule
+
+DAY = datetime.datetime(2026, 10, 19)
+
+
+def slot(h, m=0):
+    return DAY + datetime.timedelta(hours=h, minutes=m)
+
+
+class RoomScheduleTests(unittest.TestCase):
+
+    def test_conflicts_match_a_brute_force_scan(self):
+        rnd = random.Random(7)
+        bookings, t = [], DAY
+        while len(bookings) < 50:
+            t += datetime.timedelta(minutes=rnd.choice([0, 15, 30]))
+            end = t + datetime.timedelta(minutes=rnd.choice([15, 30, 60]))
+            bookings.append({"id": len(bookings), "start": t, "end": end})
+            t = end
+        schedule = RoomSchedule(rnd.sample(bookings, len(bookings)))
+        for _ in range(500):
+            start = DAY + datetime.timedelta(minutes=rnd.randrange(0, 60 * 40, 5))
+            end = start + datetime.timedelta(minutes=rnd.choice([5, 30, 90]))
+            overlapping = [b for b in bookings if b["start"] < end and b["end"] > start]
+            self.assertEqual(schedule.between(start, end), overlapping)
+            self.assertEqual(schedule.conflict(start, end) is None, not overlapping)
+
+    def test_back_to_back_bookings_do_not_conflict(self):
+        schedule = RoomSchedule([{"id": 1, "start": slot(9), "end": slot(10)}])
+        self.assertIsNone(schedule.conflict(slot(10), slot(11)))
+        self.assertIsNone(schedule.conflict(slot(8), slot(9)))
+        self.assertEqual(schedule.conflict(slot(9, 59), slot(11))["id"], 1)
+
+    def test_last_boundary_is_the_latest_start_or_end_passed(self):
+        schedule = RoomSchedule([{"id": 1, "start": slot(9), "end": slot(10)},
+                                 {"id": 2, "start": slot(11), "end": slot(12)}])
+        self.assertIsNone(schedule.last_boundary(slot(8)))
+        self.assertEqual(schedule.last_boundary(slot(9, 30)), slot(9))
+        self.assertEqual(schedule.last_boundary(slot(10, 30)), slot(10))
+        self.assertEqual(schedule.last_boundary(slot(13)), slot(12))
+
+
+class BookingIndexTests(unittest.TestCase):
+
+    def setUp(self):
+        patches = [patch('App.bookings.mongo'), patch('App.bookings.versions'), patch('App.bookings.record_write')]
+        self.mongo, versions, self.record_write = [p.start() for p in patches]
+        for p in patches:
+            self.addCleanup(p.stop)
+        versions.current.return_value = ("e.1",)
+        self.mongo.db.room_bookings.find.return_value = [
+            {"_id": "london", "bookings": [{"id": "bk-1", "start": slot(9), "end": slot(10)}],
+             "updated_at": slot(0)},
+        ]
+        self.index = BookingIndex()
+
+    def test_known_conflicts_are_rejected_without_a_write(self):
+        booking, taken = self.index.book("london", slot(9, 30), slot(11))
+        self.assertIsNone(booking)
+        self.assertEqual(taken["id"], "bk-1")
+        self.mongo.db.room_bookings.find_one_and_update.assert_not_called()
+
+    def test_booking_is_one_guarded_update(self):
+        self.mongo.db.room_bookings.find_one_and_update.side_effect = lambda flt, update, **kw: {
+            "_id": "london", "updated_at": slot(1),
+            "bookings": [{"id": "bk-1", "start": slot(9), "end": slot(10)}, update[0]["$set"]["bookings"]
+                         ["$concatArrays"][1][0]["$literal"]]}
+        booking, taken = self.index.book("london", slot(10), slot(11), user="dana")
+        self.assertIsNone(taken)
+        self.assertTrue(booking["id"].startswith("bk-"))
+        flt = self.mongo.db.room_bookings.find_one_and_update.call_args.args[0]
+        self.assertEqual(flt["bookings"], {"$not": {"$elemMatch": {"start": {"$lt": slot(11)}, "end": {"$gt": slot(10)}}}})
+        self.assertEqual(self.index.conflict("london", slot(10, 30), slot(10, 45))["id"], booking["id"])
+        self.record_write.assert_called_once_with("room_bookings")
+
+    def test_lost_race_reports_the_winner(self):
+        self.mongo.db.room_bookings.find_one_and_update.side_effect = DuplicateKeyError("dup")
+        self.mongo.db.room_bookings.find_one.return_value = {
+            "_id": "london", "updated_at": slot(1),
+            "bookings": [{"id": "bk-1", "start": slot(9), "end": slot(10)},
+                         {"id": "bk-2", "start": slot(10), "end": slot(12)}]}
+        booking, taken = self.index.book("london", slot(11), slot(13))
+        self.assertIsNone(booking)
+        self.assertEqual(taken["id"], "bk-2")
+
+    def test_free_room_search_over_thousands_of_rooms(self):
+        rooms = [f"room-{i}" for i in range(3000)]
+        self.mongo.db.room_bookings.find.return_value = [
+            {"_id": r, "updated_at": slot(0), "bookings": [
+                {"id": f"{r}-{h}", "start": slot(h), "end": slot(h, 45)} for h in range(8, 18)]}
+            for r in rooms[::2]
+        ]
+        self.index.sync()
+        started = time.perf_counter()
+        free = self.index.free_rooms(rooms, slot(9, 50), slot(10, 10))
+        elapsed = time.perf_counter() - started
+        self.assertEqual(free, rooms[1::2])
+        self.assertLess(elapsed, 0.05)     # ~1-3 ms in practice; generous for slow CI
+
+    def test_rooms_are_due_when_a_booking_starts_or_ends(self):
+        self.index.sync()
+        self.assertEqual(self.index.due(None, slot(8)), ["london"])
+        self.assertEqual(self.index.due(slot(8), slot(8, 30)), [])
+        self.assertEqual(self.index.due(slot(8, 30), slot(9, 1)), ["london"])      # started
+        self.assertEqual(self.index.due(slot(9, 1), slot(9, 30)), [])
+        self.assertEqual(self.index.due(slot(9, 30), slot(10)), ["london"])        # ended
+        running, stamp, boundary = self.index.current("london", slot(9, 30))
+        self.assertEqual((running["id"], stamp, boundary), ("bk-1", slot(0), slot(9)))
+        self.assertEqual(self.index.current("london", slot(10))[0::2], (None, slot(10)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,49 @@
+import unittest
+from unittest.mock import patch
+
+from run import app
+
+ROOMS = [{"room": r, "is_on": True} for r in ("f1-london", "f1-boot", "f2-meeting")]
+
+
+class BulkControlTests(unittest.TestCase):
+
+    def setUp(self):
+        self.app = app.test_client()
+        self.app.testing = True
+        p = patch('App.blueprints.control.device_cache')
+        self.cache = p.start()
+        self.addCleanup(p.stop)
+        self.cache.all.return_value = ROOMS
+        self.cache.bulk_update.return_value = {"upserted": [{"index": 2, "_id": "x"}], "writeErrors": []}
+
+    def test_selector_plus_explicit_changes_in_one_bulk_write(self):
+        r = self.app.post('/api/environment/lights/bulk', json={
+            "select": {"prefix": "f1-"}, "state": False,
+            "changes": [{"room": "f1-boot", "state": True}, {"room": "lobby", "state": True}, {"state": True}],
+        })
+        self.assertEqual(r.status_code, 200)
+        self.cache.bulk_update.assert_called_once_with("lights", [
+            ("f1-london", {"$set": {"is_on": False}}, False),
+            ("f1-boot", {"$set": {"is_on": True}}, True),      # explicit change wins
+            ("lobby", {"$set": {"is_on": True}}, True),
+        ])
+        statuses = {res["room"]: res["status"] for res in r.get_json()["results"]}
+        self.assertEqual(statuses, {None: "error", "f1-london": "updated", "f1-boot": "updated", "lobby": "created"})
+
+    def test_temperature_bulk_uses_single_room_rules(self):
+        self.cache.bulk_update.return_value = {"upserted": [], "writeErrors": [{"index": 1, "errmsg": "boom"}]}
+        r = self.app.post('/api/environment/temperature/bulk', json={"select": {"all": True}, "ac_on": False})
+        ops = self.cache.bulk_update.call_args.args[1]
+        self.assertEqual(len(ops), 3)
+        self.assertEqual(ops[0][1], {"$set": {"ac_on": False, "temperature": None}})
+        self.assertEqual(r.get_json()["results"][1], {"room": "f1-boot", "status": "error", "error": "boom"})
+
+    def test_rejects_requests_without_targets_or_state(self):
+        self.assertEqual(self.app.post('/api/environment/lights/bulk', json={}).status_code, 400)
+        self.assertEqual(self.app.post('/api/environment/lights/bulk', json={"select": {"all": True}}).status_code, 400)
+        self.cache.bulk_update.assert_not_called()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,124 @@
+import threading
+import unittest
+from unittest.mock import MagicMock, patch
+
+from App.device_cache import DeviceCache
+
+
+class DeviceCacheTests(unittest.TestCase):
+
+    def setUp(self):
+        self.version = "e.1"
+        patches = [
+            patch('App.device_cache.mongo'),
+            patch('App.device_cache.versions'),
+            patch('App.device_cache.record_write'),
+            patch('App.device_cache.journal'),
+            patch('App.device_cache.live_bus'),
+        ]
+        self.mongo, versions, self.record_write, self.journal, self.live_bus = [p.start() for p in patches]
+        for p in patches:
+            self.addCleanup(p.stop)
+        versions.current.side_effect = lambda name: (self.version,)
+        versions.mark_pending.side_effect = self.mark_pending
+        self.lights = MagicMock()
+        self.lights.find.side_effect = lambda *a: [{"room": "london", "is_on": False}, {"room": "boot", "is_on": True}]
+        self.mongo.db.__getitem__.side_effect = lambda name: self.lights
+        self.cache = DeviceCache(ttl=60)
+
+    def mark_pending(self, name):
+        previous, self.version = self.version, f"{self.version}+1"
+        return previous, self.version
+
+    def bumped_to(self, version):
+        def record_write(collection, pending=False):
+            self.version = version
+            return version
+        return record_write
+
+    def test_reads_come_from_memory_until_the_version_moves(self):
+        self.assertEqual(self.cache.get("lights", "london"), {"room": "london", "is_on": False})
+        self.assertEqual(len(self.cache.all("lights")), 2)
+        self.assertIsNone(self.cache.get("lights", "nowhere"))
+        self.assertEqual(self.lights.find.call_count, 1)
+        self.assertEqual((self.cache.hits, self.cache.misses), (2, 1))
+
+        self.version = "e.2"        # written by another replica
+        self.cache.get("lights", "london")
+        self.assertEqual(self.lights.find.call_count, 2)
+        self.assertAlmostEqual(self.cache.hit_ratio, 0.5)
+
+    def test_write_through_keeps_the_cache_warm(self):
+        self.cache.all("lights")
+        self.lights.find_one_and_update.return_value = {"room": "london", "is_on": True}
+        self.record_write.side_effect = self.bumped_to("e.2")
+
+        doc = self.cache.update("lights", "london", {"$set": {"is_on": True}}, upsert=True)
+        self.cache.drain()
+        self.assertEqual(doc, {"room": "london", "is_on": True})
+        self.record_write.assert_called_once_with("lights", pending=True)
+        self.journal.record.assert_called_once_with("lights", [("london", {"is_on": True})])
+        self.live_bus.touch.assert_called_once_with("lights", "london", doc)
+
+        doc["is_on"] = "mutated by caller"
+        self.assertEqual(self.cache.get("lights", "london"), {"room": "london", "is_on": True})
+        self.assertEqual(self.lights.find.call_count, 1)
+
+    def test_the_write_is_the_only_round_trip_waited_for(self):
+        self.cache.all("lights")
+        self.lights.find_one_and_update.return_value = {"room": "london", "is_on": True}
+        bumped, release = threading.Event(), threading.Event()
+
+        def slow_bump(collection, pending=False):
+            release.wait(5)
+            self.version = "e.2"
+            bumped.set()
+            return "e.2"
+        self.record_write.side_effect = slow_bump
+
+        self.cache.update("lights", "london", {"$set": {"is_on": True}})
+        # returned before the bump; this process already reads its own write, from memory
+        self.assertFalse(bumped.is_set())
+        self.assertEqual(self.version, "e.1+1")
+        self.assertEqual(self.cache.get("lights", "london"), {"room": "london", "is_on": True})
+        self.journal.record.assert_not_called()
+
+        release.set()
+        self.cache.drain()
+        self.journal.record.assert_called_once()
+        self.cache.get("lights", "boot")
+        self.assertEqual(self.lights.find.call_count, 1)        # the bumped version was adopted
+
+    def test_concurrent_writer_forces_reload(self):
+        self.cache.all("lights")
+        self.lights.find_one_and_update.return_value = {"room": "london", "is_on": True}
+        self.record_write.side_effect = self.bumped_to("e.3")     # someone else wrote e.2
+        self.cache.update("lights", "london", {"$set": {"is_on": True}})
+        self.cache.drain()
+        self.cache.get("lights", "boot")
+        self.assertEqual(self.lights.find.call_count, 2)
+
+    def test_update_many_writes_side_by_side(self):
+        writes, bumps = threading.Barrier(2, timeout=5), threading.Barrier(2, timeout=5)
+
+        def write(collection, key, update, upsert=False):
+            writes.wait()               # deadlocks (BrokenBarrierError) if the writes were sequential
+            return {"collection": collection}
+
+        def bump(collection, pending=False):
+            bumps.wait()                # the two collections' bookkeeping runs side by side too
+            return None
+
+        self.record_write.side_effect = bump
+        with patch.object(self.cache, "_write", side_effect=write):
+            docs = self.cache.update_many([
+                ("lights", "london", {"$set": {"is_on": True}}, True),
+                ("meeting_rooms", "london", {"$set": {"tv_on": True}}, False),
+            ])
+        self.cache.drain()
+        self.assertEqual(docs, [{"collection": "lights"}, {"collection": "meeting_rooms"}])
+        self.assertEqual(sorted(c.args for c in self.record_write.call_args_list), [("lights",), ("meeting_rooms",)])
+        self.assertEqual(self.journal.record.call_count, 2)
+
+if __name__ == "__main__":
+    unittest.main()
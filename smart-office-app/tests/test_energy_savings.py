@@ -0,0 +1,129 @@
+import random
+import unittest
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+from bson import ObjectId
+
+from App.blueprints import automation_rules
+from App.blueprints.automation_rules import _estimate_kwh, _savings_pipeline, backfill_execution_fields
+from tests.mongo_utils import local_mongo_db
+
+NOW = datetime(2026, 10, 18, 12, 0)
+ACTIONS = [
+    {"device_id": "light.hall", "action": "turn_off"},
+    {"device_id": "climate.hall", "action": "set_mode", "state": {"mode": "eco"}},
+    {"device_id": "light.lobby", "action": "set_brightness", "state": {"level": 40}},
+    {"device_id": "climate.lab", "action": "set_temp", "state": {"target": 25}},
+    {"action": "turn_off"},
+]
+
+
+def legacy_energy_savings(docs, since):
+    """The per-document Python loop energy_savings ran before the aggregation."""
+    total, by_day, by_device, execs = 0.0, {}, {}, 0
+    for ex in docs:
+        try:
+            created = datetime.fromisoformat((ex.get("created_at") or "").replace("Z", "+00:00"))
+        except Exception:
+            created = None
+        if created and created < since:
+            continue
+        execs += 1
+        kwh = ex.get("energy_kwh_est")
+        if not isinstance(kwh, (int, float)):
+            kwh = sum(_estimate_kwh(a) for a in (ex.get("actions_fired") or []))
+        total += kwh
+        day = (created.date().isoformat() if created else "unknown")
+        by_day[day] = round(by_day.get(day, 0.0) + kwh, 4)
+        for a in (ex.get("actions_fired") or []):
+            dev = (a.get("device_id") or "scene/unknown")
+            by_device[dev] = round(by_device.get(dev, 0.0) + _estimate_kwh(a), 4)
+    return execs, total, by_day, by_device
+
+
+def old_executions(n, seed=11):
+    """Executions as logged before created_ts/energy_* existed."""
+    rnd = random.Random(seed)
+    docs = []
+    for _ in range(n):
+        created = NOW - timedelta(minutes=rnd.randrange(0, 14 * 24 * 60))
+        doc = {"_id": ObjectId(), "created_at": created.isoformat(), "matched_rules": [],
+               "actions_fired": rnd.sample(ACTIONS, rnd.randrange(0, 4))}
+        if rnd.random() < 0.3:
+            doc["energy_kwh_est"] = round(rnd.random(), 3)
+        docs.append(doc)
+    return docs
+
+
+class BackfillTests(unittest.TestCase):
+
+    @patch('App.blueprints.automation_rules.ensure_indexes')
+    @patch('App.blueprints.automation_rules.mongo')
+    def test_backfilled_fields_match_the_old_computation(self, mock_mongo, _ensure_indexes):
+        docs = old_executions(200)
+        bad = {"_id": ObjectId.from_datetime(NOW), "created_at": "yesterday-ish", "actions_fired": ACTIONS[:1]}
+        mock_mongo.db.automation_executions.find.return_value = docs + [bad]
+        backfill_execution_fields(batch_size=64)
+
+        ops = [op for call in mock_mongo.db.automation_executions.bulk_write.call_args_list for op in call.args[0]]
+        fields = {op._filter["_id"]: op._doc["$set"] for op in ops}
+        self.assertEqual(len(fields), len(docs) + 1)
+        for doc in docs:
+            f = fields[doc["_id"]]
+            _n, kwh, by_day, by_device = legacy_energy_savings([doc], datetime.min)
+            self.assertEqual(f["created_ts"], datetime.fromisoformat(doc["created_at"]))
+            self.assertAlmostEqual(f["energy_kwh_est"], kwh)
+            self.assertEqual({d["device_id"]: d["kwh"] for d in f["energy_by_device"]}, by_device)
+        # the old loop put unparseable timestamps under "unknown"; now the _id's time is used
+        self.assertEqual(fields[bad["_id"]]["created_ts"], NOW)
+
+    @patch('App.blueprints.automation_rules.ensure_indexes')
+    @patch('App.blueprints.automation_rules.mongo')
+    def test_offsets_are_normalised_to_utc(self, mock_mongo, _ensure_indexes):
+        mock_mongo.db.automation_executions.find.return_value = [
+            {"_id": 1, "created_at": "2026-10-18T02:30:00+03:00", "actions_fired": []},
+            {"_id": 2, "created_at": "2026-10-17T23:30:00Z", "actions_fired": []},
+        ]
+        backfill_execution_fields()
+        ops = mock_mongo.db.automation_executions.bulk_write.call_args.args[0]
+        self.assertEqual([op._doc["$set"]["created_ts"] for op in ops], [datetime(2026, 10, 17, 23, 30)] * 2)
+
+
+class SavingsPipelineTests(unittest.TestCase):
+
+    def test_window_is_an_indexed_range_on_created_ts(self):
+        since = NOW - timedelta(days=7)
+        pipeline = _savings_pipeline(since)
+        self.assertEqual(pipeline[0], {"$match": {"created_ts": {"$gte": since}}})
+        by_day = pipeline[-1]["$facet"]["by_day"][0]["$group"]["_id"]
+        self.assertEqual(by_day, {"$dateToString": {"format": "%Y-%m-%d", "date": "$created_ts"}})
+
+    def test_aggregation_matches_the_old_loop(self):
+        db = local_mongo_db()
+        if db is None:
+            self.skipTest("no local mongod")
+        db.automation_executions.drop()
+        docs = old_executions(1000)
+        db.automation_executions.insert_many([dict(d) for d in docs])
+
+        with patch.object(automation_rules.mongo, "db", db):
+            backfill_execution_fields()
+            for days in (1, 3, 7, 30):
+                since = NOW - timedelta(days=days)
+                res = next(db.automation_executions.aggregate(_savings_pipeline(since)), {})
+                execs, total, by_day, by_device = legacy_energy_savings(docs, since)
+
+                totals = (res.get("totals") or [{}])[0]
+                self.assertEqual(totals.get("count", 0), execs)
+                self.assertAlmostEqual(totals.get("kwh", 0.0), total, places=6)
+                # the old loop rounded after every addition, so allow for its drift
+                for rows, expected in ((res["by_day"], by_day), (res["by_device"], by_device)):
+                    got = {d["_id"]: d["kwh"] for d in rows}
+                    self.assertEqual(set(got), set(expected))
+                    for key, kwh in expected.items():
+                        self.assertAlmostEqual(got[key], kwh, places=3)
+
+
+if __name__ == "__main__":
+    unittest.main()
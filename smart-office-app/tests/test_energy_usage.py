@@ -0,0 +1,79 @@
+import datetime
+import unittest
+from unittest.mock import MagicMock, patch
+
+from run import app
+
+
+class EnergyUsageTests(unittest.TestCase):
+
+    def setUp(self):
+        self.app = app.test_client()
+        self.app.testing = True
+        p = patch('App.blueprints.energy.mongo')
+        self.mongo = p.start()
+        self.addCleanup(p.stop)
+
+    def test_today_is_an_atomic_upsert(self):
+        self.mongo.db.energy_usage.find_one_and_update.return_value = {
+            "date": "2026-10-18", "lights_kwh": 1.0, "ac_kwh": 2.0, "total_kwh": 3.0}
+        self.mongo.db.energy_daily.find.return_value = []
+        data = self.app.get('/api/environment/energy/usage').get_json()
+        self.assertEqual((data["total_today_kwh"], data["today_kwh"]), (3.0, 3.0))
+        kwargs = self.mongo.db.energy_usage.find_one_and_update.call_args.kwargs
+        self.assertTrue(kwargs["upsert"])
+        self.mongo.db.energy_usage.find_one.assert_not_called()
+        self.mongo.db.energy_usage.insert_one.assert_not_called()
+
+    def test_history_is_downsampled_on_the_server_and_gaps_filled(self):
+        self.mongo.db.__getitem__.return_value.aggregate.return_value = [
+            {"_id": datetime.datetime(2026, 10, 13), "lights_kwh": 2.4, "ac_kwh": 0.0, "total_kwh": 2.4},
+        ]
+        r = self.app.get('/api/environment/energy/usage?from=2026-10-13&to=2026-10-15&granularity=day&agg=avg&room=london')
+        self.assertEqual(r.status_code, 200)
+        points = r.get_json()["points"]
+        self.assertEqual([p["t"] for p in points], ["2026-10-13T00:00:00", "2026-10-14T00:00:00"])
+        self.assertAlmostEqual(points[0]["total_kwh"], 0.1)     # 2.4 kWh over 24 hourly buckets
+        self.assertEqual(points[1]["total_kwh"], 0.0)
+        self.mongo.db.__getitem__.assert_called_with("energy_hourly")
+        match = self.mongo.db.__getitem__.return_value.aggregate.call_args.args[0][0]["$match"]
+        self.assertEqual(match["room"], "london")
+
+    def test_daily_sums_read_daily_buckets_and_peaks_the_hourly_ones(self):
+        day = datetime.datetime(2026, 10, 14)
+        hourly = [{"hour": day + datetime.timedelta(hours=h), "lights_kwh": kwh, "ac_kwh": 0.0, "total_kwh": kwh}
+                  for h, kwh in ((8, 0.5), (9, 1.9), (10, 1.0))]
+        stored = {
+            "energy_hourly": hourly,
+            "energy_daily": [{"day": day, "lights_kwh": 3.4, "ac_kwh": 0.0, "total_kwh": 3.4}],
+        }
+        read = []
+
+        def collection(name):
+            def aggregate(pipeline):
+                read.append(name)
+                acc = "$max" if "$max" in pipeline[1]["$group"]["total_kwh"] else "$sum"
+                values = [d["total_kwh"] for d in stored[name]]
+                total = max(values) if acc == "$max" else sum(values)
+                return [{"_id": day, "lights_kwh": total, "ac_kwh": 0.0, "total_kwh": total}]
+            return MagicMock(aggregate=aggregate)
+        self.mongo.db.__getitem__.side_effect = collection
+
+        def series(agg):
+            url = f'/api/environment/energy/usage?from=2026-10-13&to=2026-10-15&granularity=day&agg={agg}'
+            return [p["total_kwh"] for p in self.app.get(url).get_json()["points"]]
+
+        self.assertEqual(series("sum"), [0.0, 3.4])
+        self.assertEqual(read, ["energy_daily"])
+        self.assertEqual(series("max"), [0.0, 1.9])     # the peak hour, not the day's total
+        self.assertEqual(read[-1], "energy_hourly")
+        self.assertNotEqual(series("max"), series("sum"))
+
+    def test_history_rejects_bad_parameters(self):
+        for qs in ("granularity=minute", "agg=median", "from=yesterday",
+                   "from=2026-10-15&to=2026-10-13", "from=2000-01-01&to=2026-01-01&granularity=hour"):
+            self.assertEqual(self.app.get('/api/environment/energy/usage?' + qs).status_code, 400, qs)
+
+
+if __name__ == "__main__":
+    unittest.main()
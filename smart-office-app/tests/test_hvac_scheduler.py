@@ -0,0 +1,90 @@
+import datetime
+import unittest
+from unittest.mock import patch
+
+from bson import ObjectId
+
+from App.hvac_scheduler import HvacScheduler
+
+FMT = "%Y-%m-%d %H:%M:%S"
+
+
+def _at(minutes):
+    return (datetime.datetime.now() + datetime.timedelta(minutes=minutes)).strftime(FMT)
+
+
+class HvacSchedulerTests(unittest.TestCase):
+
+    def setUp(self):
+        patches = [patch('App.hvac_scheduler.device_cache'), patch('App.hvac_scheduler.versions')]
+        self.device_cache, self.versions = [p.start() for p in patches]
+        for p in patches:
+            self.addCleanup(p.stop)
+        self.versions.current.return_value = ("e.1",)
+
+    @patch('App.hvac_scheduler.mongo')
+    def test_writes_only_on_transitions(self, mock_mongo):
+        finished = {"_id": ObjectId(), "room": "london", "start": _at(-60), "end": _at(-30), "active": True, "temperature": 21}
+        running = {"_id": ObjectId(), "room": "boot", "start": _at(-5), "end": _at(30), "active": False, "temperature": 22}
+        upcoming = {"_id": ObjectId(), "room": "meeting", "start": _at(60), "end": _at(90), "active": False, "temperature": 23}
+        old = {"_id": ObjectId(), "room": "meeting", "start": _at(-90), "end": _at(-80), "active": False, "temperature": 23}
+        mock_mongo.db.hvac_schedules.find.return_value = [finished, running, upcoming, old]
+
+        scheduler = HvacScheduler()
+        scheduler._load()
+        scheduler._fire_due()
+
+        room_writes = [c.args for c in self.device_cache.update.call_args_list]
+        self.assertEqual(room_writes, [
+            ("room_states", "london", {"$set": {"ac_on": False, "temperature": None}}),
+            ("room_states", "boot", {"$set": {"ac_on": True, "temperature": 22}}),
+        ])
+        self.assertEqual(scheduler.pending, 2)      # running + upcoming
+
+        # nothing changed -> no more writes
+        scheduler._fire_due()
+        self.assertEqual(self.device_cache.update.call_count, 2)
+
+    @patch('App.hvac_scheduler.mongo')
+    def test_ending_one_of_two_overlapping_schedules_keeps_the_room_on(self, mock_mongo):
+        short = {"_id": ObjectId(), "room": "london", "start": _at(-20), "end": _at(-1), "active": True, "temperature": 21}
+        long = {"_id": ObjectId(), "room": "london", "start": _at(-10), "end": _at(30), "active": True, "temperature": 24}
+        mock_mongo.db.hvac_schedules.find.return_value = [short, long]
+
+        scheduler = HvacScheduler()
+        scheduler._load()
+        scheduler._fire_due()
+
+        writes = [c.args[2] for c in self.device_cache.update.call_args_list]
+        self.assertEqual(writes[-1], {"$set": {"ac_on": True, "temperature": 24}})
+        self.assertNotIn({"$set": {"ac_on": False, "temperature": None}}, writes)
+        mock_mongo.db.hvac_schedules.update_one.assert_called_once_with({"_id": short["_id"]}, {"$set": {"active": False}})
+        self.assertEqual(scheduler.pending, 1)
+
+    @patch('App.hvac_scheduler.mongo')
+    def test_added_schedule_is_not_duplicated_by_resync(self, mock_mongo):
+        doc = {"_id": ObjectId(), "room": "boot", "start": _at(10), "end": _at(20), "active": False}
+        mock_mongo.db.hvac_schedules.find.return_value = [doc]
+        scheduler = HvacScheduler()
+        scheduler._running = True
+
+        scheduler.add(doc)
+        scheduler._load()
+
+        self.assertEqual(len(scheduler._heap), 2)
+
+    @patch('App.hvac_scheduler.mongo')
+    def test_schedules_added_by_other_workers_bump_the_version(self, mock_mongo):
+        mock_mongo.db.hvac_schedules.find.return_value = []
+        scheduler = HvacScheduler()
+        scheduler._load()
+        self.assertFalse(scheduler._changed())
+
+        self.versions.current.return_value = ("e.2",)     # record_write("hvac_schedules") elsewhere
+        self.assertTrue(scheduler._changed())
+        scheduler._load()
+        self.assertFalse(scheduler._changed())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,43 @@
+import unittest
+from unittest.mock import patch
+
+from pymongo import ASCENDING, IndexModel
+
+from App.indexes import INDEXES, QUERY_SHAPES, audit, ensure_indexes
+from App.lifecycle import bootstrap_key
+from tests.mongo_utils import local_mongo_db
+
+
+class IndexAuditTests(unittest.TestCase):
+
+    def test_every_shape_has_a_registered_collection(self):
+        self.assertEqual({c for c, _ in QUERY_SHAPES} - set(INDEXES), set())
+
+    def test_no_query_shape_scans_a_collection(self):
+        db = local_mongo_db()
+        if db is None:
+            self.skipTest("no local mongod")
+        for name in INDEXES:
+            db.drop_collection(name)
+        ensure_indexes(db)
+        ensure_indexes(db)      # idempotent on re-deploys
+
+        scans = [(coll, flt, stages) for coll, flt, stages, collscan in audit(db) if collscan]
+        self.assertEqual(scans, [])
+
+        # and the audit does catch a missing index
+        db.checkins.drop_indexes()
+        self.assertTrue(any(c == "checkins" and scan for c, _f, _s, scan in audit(db)))
+
+    def test_bootstrap_key_follows_indexes_and_migrations(self):
+        key = bootstrap_key()
+        self.assertEqual(bootstrap_key(), key)
+        extra = {**INDEXES, "lights": INDEXES["lights"] + [IndexModel([("floor", ASCENDING)], name="floor")]}
+        with patch.dict('App.indexes.INDEXES', extra):
+            self.assertNotEqual(bootstrap_key(), key)
+        with patch('App.seed.MIGRATIONS', ()):
+            self.assertNotEqual(bootstrap_key(), key)
+
+
+if __name__ == "__main__":
+    unittest.main()
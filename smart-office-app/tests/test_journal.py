@@ -0,0 +1,66 @@
+import datetime
+import unittest
+from unittest.mock import patch
+
+from pymongo.errors import AutoReconnect
+
+from App import journal
+
+T0 = datetime.datetime(2026, 10, 18, 9, 0)
+
+
+def at(minutes):
+    return T0 + datetime.timedelta(minutes=minutes)
+
+
+class StateJournalTests(unittest.TestCase):
+
+    def setUp(self):
+        p = patch('App.journal.mongo')
+        self.mongo = p.start()
+        self.addCleanup(p.stop)
+
+    def test_state_at_replays_the_journal_over_the_nearest_snapshot(self):
+        self.mongo.db.state_snapshots.find_one.return_value = {"t": T0, "state": {
+            "lights": [{"room": "london", "is_on": False}, {"room": "boot", "is_on": True}],
+        }}
+        self.mongo.db.state_journal.find.return_value.sort.return_value = [
+            {"t": at(5), "c": "lights", "k": "london", "s": {"is_on": True}},
+            {"t": at(9), "c": "lights", "k": "lobby", "s": {"is_on": True}},   # created after the snapshot
+        ]
+        result = journal.state_at(at(10), ["lights"])
+        self.assertEqual(result["snapshot"], T0)
+        self.assertEqual(result["state"]["lights"], {
+            "london": {"room": "london", "is_on": True},
+            "boot": {"room": "boot", "is_on": True},
+            "lobby": {"room": "lobby", "is_on": True},
+        })
+        flt = self.mongo.db.state_journal.find.call_args.args[0]
+        self.assertEqual(flt["t"], {"$lte": at(10), "$gt": T0})
+
+    def test_without_a_snapshot_only_the_journal_is_replayed(self):
+        self.mongo.db.state_snapshots.find_one.return_value = None
+        self.mongo.db.state_journal.find.return_value.sort.return_value = []
+        result = journal.state_at(at(10))
+        self.assertIsNone(result["snapshot"])
+        self.assertEqual(set(result["state"]), set(journal.JOURNALED))
+        self.assertNotIn("$gt", self.mongo.db.state_journal.find.call_args.args[0]["t"])
+
+    @patch('App.journal.write_behind')
+    def test_entries_are_written_as_one_batch(self, write_behind):
+        journal.record("room_states", [("london", {"ac_on": True}), ("boot", {"ac_on": False})], t=T0)
+        docs = self.mongo.db.state_journal.insert_many.call_args.args[0]
+        self.assertEqual(self.mongo.db.state_journal.insert_many.call_args.kwargs, {"ordered": False})
+        self.assertEqual([(d["c"], d["k"], d["s"], d["t"]) for d in docs], [
+            ("room_states", "london", {"ac_on": True}, T0), ("room_states", "boot", {"ac_on": False}, T0)])
+        write_behind.insert_many.assert_not_called()
+
+    @patch('App.journal.write_behind')
+    def test_entries_fall_back_to_the_retrying_queue(self, write_behind):
+        self.mongo.db.state_journal.insert_many.side_effect = AutoReconnect("no primary")
+        journal.record("lights", [("london", {"is_on": True})], t=T0)
+        coll, docs = write_behind.insert_many.call_args.args
+        self.assertEqual((coll, [d["k"] for d in docs]), ("state_journal", ["london"]))
+
+if __name__ == "__main__":
+    unittest.main()
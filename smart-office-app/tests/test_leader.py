@@ -0,0 +1,109 @@
+import multiprocessing
+import time
+import unittest
+from unittest.mock import MagicMock
+
+from App.leader import LeaderLease, MemoryLeaseStore, MongoLeaseStore
+from tests.mongo_utils import TEST_MONGO_URI, local_mongo_db
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class LeaderLeaseTests(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.store = MemoryLeaseStore(clock=self.clock)
+        self.workers = [LeaderLease("energy-meter", self.store, ttl=10, holder=f"w{i}", clock=self.clock)
+                        for i in range(3)]
+
+    def leaders(self):
+        return [w.holder for w in self.workers if w.is_leader()]
+
+    def test_exactly_one_leader(self):
+        for _ in range(5):
+            for w in self.workers:
+                w.tick()
+            self.clock.now += 3
+            self.assertEqual(self.leaders(), ["w0"])
+
+    def test_failover_after_leader_dies(self):
+        for w in self.workers:
+            w.tick()
+        self.assertEqual(self.leaders(), ["w0"])
+
+        # w0 stops renewing: it steps down before the lease expires for the others
+        self.clock.now += 8.5
+        self.assertEqual(self.leaders(), [])
+        self.workers[1].tick()
+        self.assertEqual(self.leaders(), [])
+        self.clock.now += 2
+        self.workers[1].tick()
+        self.assertEqual(self.leaders(), ["w1"])
+
+    def test_release_hands_over_immediately(self):
+        self.workers[0].tick()
+        self.workers[0].stop()
+        self.assertTrue(self.workers[2].tick())
+
+
+def _contender(run_for, queue):
+    from pymongo import MongoClient
+    db = MongoClient(TEST_MONGO_URI).get_default_database()
+    lease = LeaderLease("test-loop", MongoLeaseStore(db=db), ttl=1.0)
+    held, started, deadline = [], None, time.time() + run_for
+    while time.time() < deadline:
+        lease.tick()
+        if lease.is_leader() and started is None:
+            started = time.time()
+        elif not lease.is_leader() and started is not None:
+            held.append((started, time.time()))
+            started = None
+        time.sleep(0.05)
+    if started is not None:
+        held.append((started, time.time()))   # "crash": no release, the lease must expire
+    queue.put(held)
+
+
+class MongoLeaderTests(unittest.TestCase):
+
+    def test_expiry_uses_the_server_clock(self):
+        leases = MagicMock()
+        leases.find_one_and_update.return_value = {"_id": "test-loop", "holder": "w0"}
+        store = MongoLeaseStore(db={"leases": leases})
+        self.assertTrue(store.try_acquire("test-loop", "w0", 10))
+
+        flt, update = leases.find_one_and_update.call_args.args
+        self.assertIn({"$expr": {"$lt": ["$expires_at", "$$NOW"]}}, flt["$or"])
+        self.assertEqual(update[0]["$set"]["expires_at"], {"$add": ["$$NOW", 10000]})
+        store.release("test-loop", "w0")
+        self.assertEqual(leases.update_one.call_args.args[1], [{"$set": {"expires_at": "$$NOW"}}])
+
+    def test_processes_never_lead_together(self):
+        db = local_mongo_db()
+        if db is None:
+            self.skipTest("no local mongod")
+        db.leases.delete_many({"_id": "test-loop"})
+
+        queue = multiprocessing.Queue()
+        procs = [multiprocessing.Process(target=_contender, args=(1.5 if i == 0 else 4.0, queue)) for i in range(3)]
+        for p in procs:
+            p.start()
+            time.sleep(0.1)
+        intervals = sorted(i for _ in procs for i in queue.get(timeout=10))
+        for p in procs:
+            p.join()
+
+        self.assertGreaterEqual(len(intervals), 2)      # first leader exits, someone takes over
+        for (s1, e1), (s2, e2) in zip(intervals, intervals[1:]):
+            self.assertLessEqual(e1, s2)
+
+
+if __name__ == "__main__":
+    unittest.main()
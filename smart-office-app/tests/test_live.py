@@ -0,0 +1,83 @@
+import json
+import unittest
+from unittest.mock import MagicMock, patch
+
+from run import app
+from App.live import RESYNC, LiveBus
+
+DOCS = {
+    "lights": [{"_id": 1, "room": "london", "is_on": False}],
+    "room_states": [{"_id": 2, "room": "london", "ac_on": False, "temperature": None}],
+    "meeting_rooms": [{"_id": 3, "room_name": "london", "is_available": True, "booking_id": None}],
+    "parking_spots": [{"_id": 4, "spot_id": 1, "spot_name": "A1", "status": "available", "users": [],
+                       "attempts": [{"user": "x"}]}],
+}
+
+
+class LiveBusTests(unittest.TestCase):
+
+    def setUp(self):
+        p = patch('App.live.mongo')
+        self.mongo = p.start()
+        self.addCleanup(p.stop)
+        self.mongo.db.__getitem__.side_effect = lambda name: self.colls[name]
+        self.colls = {}
+        for name, docs in DOCS.items():
+            coll = self.colls[name] = MagicMock()
+            coll.find.return_value = [dict(d) for d in docs]
+        self.bus = LiveBus(feeder=False, queue_size=3)
+
+    def test_snapshot_then_deltas(self):
+        sub, snap = self.bus.subscribe(["parking_spots"])
+        self.assertEqual(snap["data"], {"parking_spots": {
+            "A1": {"spot_id": 1, "spot_name": "A1", "status": "available", "users": []}}})
+
+        doc = {"spot_id": 1, "spot_name": "A1", "status": "reserved", "users": ["Nelly"]}
+        self.bus.publish("parking_spots", "A1", doc)
+        self.bus.publish("parking_spots", "A1", dict(doc))      # unchanged -> nothing sent
+        self.bus.publish("lights", "london", {"room": "london", "is_on": True})  # other topic
+        self.assertEqual(sub.queue.get_nowait(), {"topic": "parking_spots", "key": "A1", "doc": doc, "v": 1})
+        self.assertTrue(sub.queue.empty())
+
+    def test_slow_subscriber_gets_resync(self):
+        sub, _snap = self.bus.subscribe(["lights"])
+        for i in range(5):
+            self.bus.publish("lights", "london", {"room": "london", "is_on": i % 2 == 0})
+        events = [sub.queue.get_nowait() for _ in range(sub.queue.qsize())]
+        self.assertIn(RESYNC, events)
+
+    def test_touch_rereads_only_without_change_streams(self):
+        sub, _snap = self.bus.subscribe(["room_states"])
+        coll = self.colls["room_states"]
+        coll.find_one.return_value = {"room": "london", "ac_on": True, "temperature": 21}
+        self.bus.mode = "changestream"
+        self.bus.touch("room_states", "london")
+        coll.find_one.assert_not_called()
+
+        self.bus.mode = "poll"
+        self.bus.touch("room_states", "london")
+        self.assertEqual(sub.queue.get_nowait()["doc"], {"room": "london", "ac_on": True, "temperature": 21})
+
+    def test_sse_stream(self):
+        with patch('App.blueprints.live.live_bus', self.bus):
+            client = app.test_client()
+            r = client.get('/api/live/stream?topics=lights', buffered=False)
+            self.assertEqual(r.mimetype, "text/event-stream")
+            chunks = iter(r.response)
+            self.assertEqual(next(chunks), b"retry: 3000\n\n")
+            snapshot = next(chunks).decode()
+            self.assertTrue(snapshot.startswith("event: snapshot\n"))
+            self.assertEqual(json.loads(snapshot.split("data: ", 1)[1])["data"]["lights"]["london"]["is_on"], False)
+
+            self.bus.publish("lights", "london", {"room": "london", "is_on": True})
+            delta = next(chunks).decode()
+            self.assertTrue(delta.startswith("event: delta\n"))
+            self.assertEqual(json.loads(delta.split("data: ", 1)[1])["doc"], {"room": "london", "is_on": True})
+            r.close()
+            self.assertEqual(self.bus.subscribers, 0)
+
+            self.assertEqual(client.get('/api/live/stream?topics=nope').status_code, 400)
+
+
+if __name__ == "__main__":
+    unittest.main()
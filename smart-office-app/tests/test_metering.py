@@ -0,0 +1,73 @@
+import datetime
+import unittest
+from unittest.mock import MagicMock, patch
+
+from App import metering
+
+T0 = datetime.datetime(2026, 10, 18, 9, 45)
+
+
+class MeteringTests(unittest.TestCase):
+
+    def test_on_interval_is_split_across_hours(self):
+        doc = {"room": "london", "is_on": True, "watts": 60,
+               "meter": {"since": T0, "pending_wh": 5.0}}
+        energy = metering.device_energy("lights", doc, T0 + datetime.timedelta(minutes=30))
+        self.assertAlmostEqual(energy[T0.replace(minute=0)], 0.005 + 0.060 / 4)
+        self.assertAlmostEqual(energy[datetime.datetime(2026, 10, 18, 10)], 0.060 / 4)
+
+    def test_devices_that_are_off_only_report_pending_energy(self):
+        doc = {"room": "london", "ac_on": False, "meter": {"since": T0, "pending_wh": 0.0}}
+        self.assertEqual(metering.device_energy("room_states", doc, T0 + datetime.timedelta(hours=5)), {})
+
+    def test_only_missing_watts_fall_back_to_the_default(self):
+        self.assertEqual(metering.watts("lights", {"is_on": True}), metering.LIGHT_WATTS)
+        self.assertEqual(metering.watts("lights", {"is_on": True, "watts": None}), metering.LIGHT_WATTS)
+        self.assertEqual(metering.watts("lights", {"is_on": True, "watts": 0}), 0.0)
+        meter = metering.metered_update("lights", {"$set": {"is_on": False}}, now=T0)[0]["$set"]["meter"]
+        drawn_wh = meter["pending_wh"]["$add"][1]["$cond"][1]
+        self.assertEqual(drawn_wh["$multiply"][0], {"$ifNull": ["$watts", metering.LIGHT_WATTS]})
+
+    def test_bucket_ops_roll_up_per_room_hour_day_and_org(self):
+        hour = T0.replace(minute=0)
+        ops = metering.bucket_ops([
+            ("lights", "london", {hour: 0.01}),
+            ("room_states", "london", {hour: 0.02}),
+            ("lights", "boot", {hour: 0.03}),
+        ])
+        self.assertEqual(len(ops["energy_hourly"]), 3)      # london, boot, whole office
+        self.assertEqual(len(ops["energy_daily"]), 3)
+        usage = ops["energy_usage"][0]._doc["$inc"]
+        self.assertAlmostEqual(usage["lights_kwh"], 0.04)
+        self.assertAlmostEqual(usage["ac_kwh"], 0.02)
+        self.assertAlmostEqual(usage["total_kwh"], 0.06)
+
+    def test_metered_update_accrues_before_applying_the_new_state(self):
+        pipeline = metering.metered_update("lights", {"$set": {"is_on": False}}, now=T0)
+        self.assertEqual(pipeline[0]["$set"]["meter"]["since"], T0)
+        self.assertEqual(pipeline[1], {"$set": {"is_on": {"$literal": False}}})
+        self.assertEqual(metering.metered_update("meeting_rooms", {"$set": {"tv_on": True}}),
+                         {"$set": {"tv_on": True}})
+
+    def test_settle_skips_devices_written_concurrently(self):
+        lights = MagicMock()
+        lights.find.side_effect = [
+            [{"_id": 1, "room": "london", "is_on": True, "meter": {"since": T0, "pending_wh": 0.0}},
+             {"_id": 2, "room": "boot", "is_on": True, "meter": {"since": T0, "pending_wh": 0.0}}],
+            [{"_id": 1}],       # "boot" was switched between the read and the reset
+        ]
+        lights.bulk_write.return_value.matched_count = 1
+        empty = MagicMock()
+        empty.find.return_value = []
+        buckets = MagicMock()
+        dbs = {"lights": lights, "room_states": empty}
+        with patch('App.metering.mongo') as mongo:
+            mongo.db.__getitem__.side_effect = lambda name: dbs.get(name, buckets)
+            kwh = metering.settle(now=T0 + datetime.timedelta(hours=1))
+        self.assertAlmostEqual(kwh, metering.LIGHT_WATTS / 1000)
+        empty.bulk_write.assert_not_called()
+        self.assertEqual(buckets.bulk_write.call_count, 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
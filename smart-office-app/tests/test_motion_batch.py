@@ -0,0 +1,71 @@
+import json
+import random
+import unittest
+from unittest.mock import patch
+
+from run import app
+from App.rule_engine import RuleEngine
+
+RULES = [
+    {"_id": "r1", "enabled": True, "conditions": [{"type": "motion", "zone": "lobby"}],
+     "actions": [{"device_id": "light.lobby", "action": "turn_on"}]},
+    {"_id": "r2", "enabled": True, "conditions": [{"type": "lux", "lte": 120}, {"type": "time", "after": "18:00"}],
+     "actions": [{"device_id": "light.hall", "action": "set_brightness", "state": {"level": 60}}]},
+    {"_id": "r3", "enabled": True, "conditions": [{"type": "lux", "gte": 120, "lte": 300}],
+     "actions": [{"device_id": "climate.hall", "action": "set_mode", "state": {"mode": "eco"}}]},
+]
+
+
+class MotionBatchTests(unittest.TestCase):
+
+    def setUp(self):
+        self.app = app.test_client()
+        self.app.testing = True
+        engine = RuleEngine()
+        engine.load(RULES)
+        engine._fresh_index = lambda: engine._index
+        patches = [
+            patch('App.blueprints.automation_rules.rule_engine', engine),
+            patch('App.blueprints.automation_rules.write_behind'),
+        ]
+        for p in patches:
+            p.start()
+            self.addCleanup(p.stop)
+
+    def _events(self):
+        rnd = random.Random(3)
+        events = []
+        for i in range(60):
+            events.append({
+                "sensor_id": f"pir-{i % 7}",
+                "detected": rnd.random() < 0.9,
+                "zone": rnd.choice(["lobby", "hall"]),
+                "metadata": {"lux": rnd.choice([50, 119, 120, 121, 300, 301])},
+                "timestamp": f"2026-10-18T{rnd.choice([17, 18, 19])}:{rnd.randint(0, 59):02d}:00Z",
+            })
+        events.append({"detected": True})        # invalid on purpose
+        return events
+
+    def test_batch_matches_single_endpoint(self):
+        events = self._events()
+        singles = []
+        for e in events:
+            r = self.app.post('/api/automation/triggers/motion', json=e)
+            singles.append({"status": r.status_code, "body": r.get_json()})
+
+        r = self.app.post('/api/automation/triggers/motion/batch', json=events)
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(r.get_json()["results"], singles)
+
+    def test_ndjson_stream(self):
+        events = self._events()[:5]
+        body = "\n".join(json.dumps(e) for e in events) + "\nnot-json\n"
+        r = self.app.post('/api/automation/triggers/motion/batch', data=body,
+                          content_type='application/x-ndjson')
+        lines = [json.loads(l) for l in r.get_data(as_text=True).splitlines()]
+        self.assertEqual(len(lines), 6)
+        self.assertEqual(lines[-1], {"status": 400, "body": {"error": "invalid JSON"}})
+
+
+if __name__ == "__main__":
+    unittest.main()
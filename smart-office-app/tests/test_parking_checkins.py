@@ -0,0 +1,92 @@
+import random
+import unittest
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+from run import app
+from App.blueprints.parking import rebuild_checkin_summaries, rebuild_reservation_summaries
+from App.indexes import ensure_indexes
+from App.write_behind import WriteBehind
+from tests.mongo_utils import local_mongo_db
+
+
+def scan_violations(db):
+    """The previous full-scan /violations logic, as the reference."""
+    violations = []
+    for spot in db.parking_spots.find({}, {"_id": 0}).sort("spot_id"):
+        users = set(spot.get("users", [])) | {a.get("user") for a in spot.get("attempts", []) if a.get("user")}
+        if spot.get("status") == "reserved" and len(users) > 1:
+            violations.append({"spot_id": spot["spot_id"], "users": sorted(users),
+                               "violation_reason": "Conflicting reservations (double booking attempt)"})
+    checkin_map = {}
+    for ci in db.checkins.find({}, {"_id": 0}):
+        checkin_map.setdefault(ci["spot_id"], set()).add(ci["user"])
+    for sid in sorted(checkin_map):
+        if len(checkin_map[sid]) > 1:
+            violations.append({"spot_id": sid, "users": sorted(checkin_map[sid]),
+                               "violation_reason": "Multiple users checked in to same spot"})
+    return violations
+
+
+class CheckinSummaryTests(unittest.TestCase):
+
+    def setUp(self):
+        self.app = app.test_client()
+        self.app.testing = True
+        for p in (patch('App.blueprints.parking.write_behind', MagicMock()),
+                  patch('App.blueprints.parking.record_write')):
+            p.start()
+            self.addCleanup(p.stop)
+
+    @patch('App.blueprints.parking.mongo')
+    def test_checkin_does_not_rescan(self, mock_mongo):
+        mock_mongo.db.parking_spots.find_one.return_value = {
+            "spot_id": 2, "spot_name": "A2", "status": "reserved", "users": ["Nelly"]}
+        mock_mongo.db.checkin_summaries.find_one_and_update.return_value = {"users": ["Basil", "Nelly"]}
+        r = self.app.post('/api/parking/checkin', json={"user": "Basil", "spot_id": 2})
+        self.assertEqual(r.status_code, 403)
+        mock_mongo.db.checkins.find.assert_not_called()
+        flt, update = mock_mongo.db.violations.update_one.call_args.args
+        self.assertEqual((flt["type"], update["$set"]["users"]), ("multi_checkin", ["Basil", "Nelly"]))
+
+    def test_matches_scan_based_logic(self):
+        db = local_mongo_db()
+        if db is None:
+            self.skipTest("no local mongod")
+        for name in ("parking_spots", "parking_attempts", "checkins", "checkin_summaries", "violations"):
+            db.drop_collection(name)
+        ensure_indexes(db, ["parking_spots", "checkin_summaries", "violations"])
+        db.parking_spots.insert_many([
+            {"spot_id": i, "spot_name": f"A{i}", "status": "available", "users": []} for i in range(1, 9)
+        ])
+
+        rnd = random.Random(7)
+        users = ["Nelly", "Basil", "Admin", "Visitor1"]
+        mongo = SimpleNamespace(db=db)
+        with patch('App.blueprints.parking.mongo', mongo), patch('App.write_behind.mongo', mongo), \
+                patch('App.blueprints.parking.write_behind', WriteBehind(enabled=False)):
+            for _ in range(80):
+                body = {"user": rnd.choice(users), "spot_id": rnd.randint(1, 8)}
+                self.app.post(rnd.choice(['/api/parking/reserve', '/api/parking/checkin']), json=body)
+
+            expected = scan_violations(db)
+            self.assertTrue(any("check" in v["violation_reason"] for v in expected))
+            self.assertEqual(self.app.get('/api/parking/violations').get_json()["violations"], expected)
+            self.assertEqual(self.app.get('/api/parking/violations?spot_id=3').get_json()["violations"],
+                             [v for v in expected if v["spot_id"] == 3])
+
+            # rebuilding from the raw check-ins gives the same summaries
+            before = list(db.checkin_summaries.find().sort("_id"))
+            db.checkin_summaries.delete_many({})
+            rebuild_checkin_summaries()
+            rebuild_reservation_summaries()
+            after = list(db.checkin_summaries.find().sort("_id"))
+            for doc in before + after:
+                for field in ("users", "reservers"):
+                    if field in doc:
+                        doc[field] = sorted(doc[field])
+            self.assertEqual(after, before)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,119 @@
+import threading
+import unittest
+from collections import Counter
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+from run import app
+from App.blueprints.parking import MAX_EMBEDDED_ATTEMPTS
+from App.indexes import ensure_indexes
+from App.versions import versions
+from tests.mongo_utils import local_mongo_db
+
+
+class ReserveSpotTests(unittest.TestCase):
+
+    def setUp(self):
+        self.app = app.test_client()
+        self.app.testing = True
+        self.write_behind = MagicMock()
+        versions.clear()
+        self.addCleanup(versions.clear)
+        for p in (patch('App.blueprints.parking.write_behind', self.write_behind),
+                  patch('App.blueprints.parking.record_write')):
+            p.start()
+            self.addCleanup(p.stop)
+
+    @patch('App.blueprints.parking.mongo')
+    def test_single_round_trip(self, mock_mongo):
+        coll = mock_mongo.db.parking_spots
+        coll.find_one_and_update.return_value = {"spot_id": 1, "spot_name": "A1", "status": "available", "users": []}
+        r = self.app.post('/api/parking/reserve', json={"user": "Nelly", "spot_id": 1})
+        self.assertEqual(r.status_code, 200)
+        coll.find_one.assert_not_called()
+        coll.update_one.assert_not_called()
+        self.assertEqual(self.write_behind.insert.call_args.args[1]["outcome"], "reserved")
+
+        # the pre-image shows someone else already holds it -> 409 + violation
+        coll.find_one_and_update.return_value = {"spot_id": 1, "spot_name": "A1", "status": "reserved", "users": ["Basil"]}
+        r = self.app.post('/api/parking/reserve', json={"user": "Nelly", "spot_id": 1})
+        self.assertEqual(r.status_code, 409)
+        flt, update = mock_mongo.db.violations.update_one.call_args.args
+        self.assertEqual(update["$set"]["users"], ["Basil", "Nelly"])
+
+    @patch('App.versions.mongo')
+    @patch('App.blueprints.parking.mongo')
+    def test_listings_leave_out_attempts(self, mock_mongo, _versions_mongo):
+        mock_mongo.db.parking_spots.find.return_value = []
+        for url in ('/api/parking/spots/all', '/api/parking/spots/available'):
+            self.app.get(url)
+            self.assertEqual(mock_mongo.db.parking_spots.find.call_args.args[1]["attempts"], 0)
+
+    @patch('App.blueprints.parking.mongo')
+    def test_reservers_are_kept_on_the_spot_summary(self, mock_mongo):
+        mock_mongo.db.parking_spots.find_one_and_update.return_value = {
+            "spot_id": 1, "spot_name": "A1", "status": "reserved", "users": ["Basil"]}
+        self.app.post('/api/parking/reserve', json={"user": "Nelly", "spot_id": 1})
+        collection, op = self.write_behind.submit.call_args.args
+        self.assertEqual((collection, op._filter), ("checkin_summaries", {"_id": "1"}))
+        fields = op._doc[0]["$set"]
+        self.assertEqual(fields["reservers"]["$setUnion"][1], {"$literal": ["Basil", "Nelly"]})
+        self.assertTrue(fields["reserved"])
+
+    @patch('App.blueprints.parking.mongo')
+    def test_violations_are_one_read_of_the_summaries(self, mock_mongo):
+        mock_mongo.db.checkin_summaries.find.return_value.sort.return_value = [
+            {"spot_id": 1, "day": None, "reservers": ["Visitor1", "Nelly"], "double": True,
+             "users": ["Admin", "Basil"], "multi": True},
+            {"spot_id": 2, "day": None, "reservers": ["Basil", "Guest2"], "double": True, "users": ["Basil"]},
+        ]
+        r = self.app.get('/api/parking/violations')
+        self.assertEqual([(v["spot_id"], v["users"]) for v in r.get_json()["violations"]],
+                         [(1, ["Nelly", "Visitor1"]), (2, ["Basil", "Guest2"]), (1, ["Admin", "Basil"])])
+        flt = mock_mongo.db.checkin_summaries.find.call_args.args[0]
+        self.assertEqual(flt, {"$or": [{"day": None, "double": True}, {"day": None, "multi": True}]})
+        mock_mongo.db.parking_spots.find.assert_not_called()
+        mock_mongo.db.parking_attempts.aggregate.assert_not_called()
+
+    def test_concurrent_reservers_never_share_a_spot(self):
+        db = local_mongo_db()
+        if db is None:
+            self.skipTest("no local mongod")
+        for name in ("parking_spots", "violations"):
+            db.drop_collection(name)
+        ensure_indexes(db, ["parking_spots", "violations"])
+        spots = 5
+        db.parking_spots.insert_many([
+            {"spot_id": i, "spot_name": f"A{i}", "status": "available", "users": []} for i in range(1, spots + 1)
+        ])
+
+        users = [f"user{i}" for i in range(40)]
+        results, barrier = [], threading.Barrier(len(users))
+
+        def worker(user):
+            client = app.test_client()
+            barrier.wait()
+            for spot_id in range(1, spots + 1):
+                r = client.post('/api/parking/reserve', json={"user": user, "spot_id": spot_id})
+                results.append((spot_id, user, r.status_code))
+
+        with patch('App.blueprints.parking.mongo', SimpleNamespace(db=db)):
+            threads = [threading.Thread(target=worker, args=(u,)) for u in users]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+
+        winners = Counter(spot_id for spot_id, _u, status in results if status == 200)
+        self.assertEqual(winners, {i: 1 for i in range(1, spots + 1)})
+        for spot in db.parking_spots.find():
+            self.assertEqual(spot["status"], "reserved")
+            self.assertEqual(len(spot["users"]), 1)
+            self.assertIn((spot["spot_id"], spot["users"][0], 200), results)
+            self.assertEqual(len(spot["attempts"]), min(len(users), MAX_EMBEDDED_ATTEMPTS))
+        self.assertEqual(db.violations.count_documents({"type": "double_booking", "active": True}), spots)
+        self.assertEqual(self.write_behind.insert.call_count, len(users) * spots)
+
+
+if __name__ == "__main__":
+    unittest.main()
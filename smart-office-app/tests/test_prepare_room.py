@@ -0,0 +1,54 @@
+import unittest
+from unittest.mock import patch
+
+from run import app
+from App import create_app
+from App.bench import with_database
+
+LONDON = {"room_name": "london", "has_projector": True, "has_tv": False, "projector_on": False, "tv_on": False}
+
+
+class PrepareRoomTests(unittest.TestCase):
+
+    def setUp(self):
+        self.app = app.test_client()
+        self.app.testing = True
+        p = patch('App.blueprints.meeting_rooms.device_cache')
+        self.cache = p.start()
+        self.addCleanup(p.stop)
+        self.cache.get.side_effect = lambda coll, key: dict(LONDON) if coll == "meeting_rooms" else None
+
+    def test_light_and_equipment_go_out_as_one_batch_without_rereads(self):
+        self.cache.update_many.return_value = [{"room": "london", "is_on": True}, {**LONDON, "projector_on": True}]
+        r = self.app.post('/api/meetings/rooms/london/prepare', json={"light": True, "projector": True, "tv": True})
+        self.assertEqual(r.status_code, 200)
+        self.cache.update_many.assert_called_once_with([
+            ("lights", "london", {"$set": {"is_on": True}}, True),
+            ("meeting_rooms", "london", {"$set": {"projector_on": True}}, False),
+        ])
+        self.assertEqual(self.cache.get.call_count, 1)      # just the room, from memory
+        data = r.get_json()
+        self.assertEqual(data["actions"], ["Lights ON", "Projector ON", "No TV in this room"])
+        self.assertEqual(data["equipment"], {"projector": True, "projector_on": True, "tv": False, "tv_on": False,
+                                             "light": True, "light_on": True})
+
+    def test_unknown_room(self):
+        self.cache.get.side_effect = lambda coll, key: None
+        r = self.app.post('/api/meetings/rooms/nowhere/prepare', json={"light": True})
+        self.assertEqual(r.status_code, 404)
+        self.cache.update_many.assert_not_called()
+
+
+class BenchWiringTests(unittest.TestCase):
+
+    def test_baseline_endpoint_only_behind_the_flag(self):
+        self.assertNotIn("bench", app.blueprints)
+        self.assertIn("bench", create_app({"BENCH_ENDPOINTS": True}).blueprints)
+
+    def test_scratch_uri_keeps_hosts_and_options(self):
+        self.assertEqual(with_database("mongodb://u:p@h1,h2:27017/smart_office?replicaSet=rs0", "smart_office_bench_1"),
+                         "mongodb://u:p@h1,h2:27017/smart_office_bench_1?replicaSet=rs0")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,103 @@
+import random
+import unittest
+
+from App.rule_engine import RuleEngine
+
+
+def legacy_match(rules, zone, nowm, meta):
+    """The original scan from trigger_motion, kept here as the reference."""
+    def hhmm(s):
+        try: h, m = map(int, (s or "0:0").split(":")); return h*60 + m
+        except: return None
+
+    matched = []
+    for r in rules:
+        ok = True
+        for c in (r.get("conditions") or []):
+            t = c.get("type")
+            if t == "motion" and c.get("zone") and c["zone"] != zone:
+                ok = False; break
+            if t == "time":
+                a = hhmm(c.get("after"))
+                b4 = hhmm(c.get("before") or "23:59")
+                if a is not None and nowm < a:  ok = False; break
+                if b4 is not None and nowm > b4: ok = False; break
+            if t == "lux":
+                lux = meta.get("lux")
+                if lux is None or ("lte" in c and not (lux <= c["lte"])) or ("gte" in c and not (lux >= c["gte"])):
+                    ok = False; break
+        if ok:
+            matched.append(str(r["_id"]))
+    return matched
+
+
+ZONES = ["lobby", "hall", "office-1", "office-2", None]
+
+
+def random_condition(rnd):
+    kind = rnd.choice(["motion", "time", "lux", "other"])
+    if kind == "motion":
+        return {"type": "motion", "zone": rnd.choice(ZONES)}
+    if kind == "time":
+        c = {"type": "time"}
+        if rnd.random() < 0.8:
+            c["after"] = f"{rnd.randint(0, 23)}:{rnd.randint(0, 59):02d}"
+        if rnd.random() < 0.7:
+            c["before"] = rnd.choice([f"{rnd.randint(0, 23)}:{rnd.randint(0, 59):02d}", "bad"])
+        return c
+    if kind == "lux":
+        c = {"type": "lux"}
+        if rnd.random() < 0.6:
+            c["lte"] = rnd.randint(0, 400)
+        if rnd.random() < 0.6:
+            c["gte"] = rnd.randint(0, 400)
+        return c
+    return {"type": "temperature", "gte": 20}
+
+
+class RuleEngineTests(unittest.TestCase):
+
+    def test_matches_legacy_scan(self):
+        rnd = random.Random(7)
+        rules = [
+            {"_id": i, "enabled": True, "actions": [],
+             "conditions": [random_condition(rnd) for _ in range(rnd.randint(0, 4))]}
+            for i in range(400)
+        ]
+        engine = RuleEngine()
+        engine.load(rules)
+        engine._fresh_index = lambda: engine._index  # no Mongo in unit tests
+
+        for _ in range(2000):
+            zone = rnd.choice(ZONES)
+            nowm = rnd.randint(0, 23 * 60 + 59)
+            meta = {"lux": rnd.randint(0, 400)} if rnd.random() < 0.8 else {}
+            got = [r.rule_id for r in engine.match(zone, nowm, meta)]
+            self.assertEqual(got, legacy_match(rules, zone, nowm, meta))
+
+    def test_add_rule_incrementally(self):
+        engine = RuleEngine()
+        engine.load([{"_id": 1, "enabled": True, "conditions": [{"type": "motion", "zone": "lobby"}]}], version=1)
+        engine._fresh_index = lambda: engine._index
+
+        engine.add_rule({"_id": 2, "enabled": True, "conditions": []}, version=2)
+        self.assertEqual([r.rule_id for r in engine.match("lobby", 600, {})], ["1", "2"])
+
+        # a version gap means another worker changed the rules -> wait for a reload
+        engine.add_rule({"_id": 3, "enabled": True, "conditions": []}, version=5)
+        self.assertEqual([r.rule_id for r in engine.match("lobby", 600, {})], ["1", "2"])
+
+    def test_rule_reloaded_before_its_version_bump_is_not_added_twice(self):
+        engine = RuleEngine()
+        rule = {"_id": 2, "enabled": True, "conditions": []}
+        # create_rule inserted the rule, a concurrent reload saw it at the old version 1...
+        engine.load([{"_id": 1, "enabled": True, "conditions": []}, rule], version=1)
+        engine._fresh_index = lambda: engine._index
+
+        engine.add_rule(rule, version=2)        # ...then the bump arrived
+        self.assertEqual([r.rule_id for r in engine.match("lobby", 600, {})], ["1", "2"])
+        self.assertEqual(engine._version, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
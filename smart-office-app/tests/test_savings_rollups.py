@@ -0,0 +1,123 @@
+import unittest
+from datetime import datetime
+from unittest.mock import MagicMock, patch
+
+from App import savings_rollups
+from tests.mongo_utils import local_mongo_db
+
+RAW = {
+    "2026-10-17": {"executions": 1, "kwh": 0.06, "devices": {"light.hall": 0.06}},
+    "2026-10-18": {"executions": 2, "kwh": 0.36, "devices": {"light.hall": 0.06, "climate.hall": 0.3}},
+}
+
+
+class SavingsRollupTests(unittest.TestCase):
+
+    def test_one_increment_per_day(self):
+        executions = [
+            {"created_ts": datetime(2026, 10, 17, 23, 59), "energy_kwh_est": 0.06,
+             "energy_by_device": [{"device_id": "light.hall", "kwh": 0.06}]},
+            {"created_ts": datetime(2026, 10, 18, 8, 0), "energy_kwh_est": 0.36,
+             "energy_by_device": [{"device_id": "light.hall", "kwh": 0.06},
+                                  {"device_id": "climate.hall", "kwh": 0.3}]},
+            {"created_ts": datetime(2026, 10, 18, 9, 0), "energy_kwh_est": 0.0, "energy_by_device": []},
+        ]
+        ops = savings_rollups.rollup_increments(executions)
+        self.assertEqual([op._filter["_id"] for op in savings_rollups.rollup_ops(executions)], list(ops))
+
+        self.assertEqual(set(ops), {"2026-10-17", "2026-10-18"})
+        self.assertEqual(ops["2026-10-18"]["executions"], 2)
+        self.assertAlmostEqual(ops["2026-10-18"]["kwh"], 0.36)
+        self.assertAlmostEqual(ops["2026-10-18"]["devices.climate%2Ehall"], 0.3)
+
+    def test_device_key_round_trip(self):
+        for dev in ("light.hall", "climate.$x", "odd%2Ename"):
+            key = savings_rollups.device_key(dev)
+            self.assertNotIn(".", key)
+            self.assertEqual(savings_rollups.device_name(key), dev)
+
+
+class RollupMaintenanceTests(unittest.TestCase):
+
+    def setUp(self):
+        p = patch('App.savings_rollups.mongo')
+        self.mongo = p.start()
+        self.addCleanup(p.stop)
+        self.rollups = MagicMock()
+        self.mongo.db.__getitem__.side_effect = lambda name: self.rollups
+
+    def test_read_rollups_is_one_range_read_with_decoded_device_ids(self):
+        self.rollups.find.return_value = [
+            {"_id": "2026-10-18", "executions": 2, "kwh": 0.36, "devices": {"light%2Ehall": 0.06, "climate%2Ehall": 0.3}},
+            {"_id": "2026-10-19"},
+        ]
+        out = savings_rollups.read_rollups("2026-10-18")
+        self.rollups.find.assert_called_once_with({"_id": {"$gte": "2026-10-18"}})
+        self.assertEqual(out, {
+            "2026-10-18": {"executions": 2, "kwh": 0.36, "devices": {"light.hall": 0.06, "climate.hall": 0.3}},
+            "2026-10-19": {"executions": 0, "kwh": 0.0, "devices": {}},
+        })
+
+    @patch('App.savings_rollups.raw_rollups', return_value=RAW)
+    def test_rebuild_replaces_days_and_drops_stale_ones(self, raw_rollups):
+        self.assertEqual(savings_rollups.rebuild("2026-10-17"), 2)
+        raw_rollups.assert_called_once_with("2026-10-17")
+        self.rollups.delete_many.assert_called_once_with({"_id": {"$gte": "2026-10-17", "$nin": list(RAW)}})
+        ops = {op._filter["_id"]: op._doc for op in self.rollups.bulk_write.call_args.args[0]}
+        self.assertEqual(ops["2026-10-18"], {"executions": 2, "kwh": 0.36,
+                                             "devices": {"light%2Ehall": 0.06, "climate%2Ehall": 0.3}})
+
+    @patch('App.savings_rollups.raw_rollups', return_value=RAW)
+    def test_check_reports_every_kind_of_drift(self, _raw):
+        with patch('App.savings_rollups.read_rollups', return_value={
+            "2026-10-18": {"executions": 3, "kwh": 0.36, "devices": {"light.hall": 0.1, "climate.hall": 0.3}},
+            "2026-10-19": {"executions": 1, "kwh": 0.06, "devices": {}},
+        }):
+            problems = savings_rollups.check()
+        self.assertEqual(problems, [
+            "2026-10-17: missing rollup",
+            "2026-10-18: executions raw=2 rollup=3",
+            "2026-10-18: light.hall raw=0.0600 rollup=0.1000",
+            "2026-10-19: rollup without executions",
+        ])
+        with patch('App.savings_rollups.read_rollups', return_value=RAW):
+            self.assertEqual(savings_rollups.check(), [])
+
+    def test_rebuild_then_check_on_a_real_database(self):
+        db = local_mongo_db()
+        if db is None:
+            self.skipTest("no local mongod")
+        db.automation_executions.drop()
+        db[savings_rollups.ROLLUP_COLLECTION].drop()
+        executions = [
+            {"created_ts": datetime(2026, 10, 17, 23, 59), "energy_kwh_est": 0.06,
+             "energy_by_device": [{"device_id": "light.hall", "kwh": 0.06}]},
+            {"created_ts": datetime(2026, 10, 18, 8, 0), "energy_kwh_est": 0.36,
+             "energy_by_device": [{"device_id": "light.hall", "kwh": 0.06}, {"device_id": "climate.hall", "kwh": 0.3}]},
+        ]
+        db.automation_executions.insert_many([dict(e) for e in executions])
+        self.mongo.db = db
+
+        # incremental rollups (as logged at execution time) agree with the raw data
+        db[savings_rollups.ROLLUP_COLLECTION].bulk_write(savings_rollups.rollup_ops(executions))
+        self.assertEqual(savings_rollups.check(), [])
+
+        db[savings_rollups.ROLLUP_COLLECTION].update_one({"_id": "2026-10-18"}, {"$inc": {"executions": 1}})
+        db[savings_rollups.ROLLUP_COLLECTION].insert_one({"_id": "2026-10-20", "executions": 1, "kwh": 1.0})
+        self.assertEqual(len(savings_rollups.check()), 2)
+
+        # an increment replayed after a lost acknowledgement is only counted once
+        db[savings_rollups.ROLLUP_COLLECTION].delete_many({})
+        ops = savings_rollups.rollup_ops(executions)
+        for _attempt in range(3):
+            db[savings_rollups.ROLLUP_COLLECTION].bulk_write(ops, ordered=False)
+        self.assertEqual(savings_rollups.check(), [])
+
+        self.assertEqual(savings_rollups.rebuild(), 2)
+        self.assertEqual(savings_rollups.check(), [])
+        self.assertEqual(savings_rollups.read_rollups("2026-10-18")["2026-10-18"]["devices"],
+                         {"light.hall": 0.06, "climate.hall": 0.3})
+
+
+if __name__ == "__main__":
+    unittest.main()
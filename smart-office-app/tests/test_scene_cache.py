@@ -0,0 +1,50 @@
+import unittest
+from unittest.mock import patch
+
+from bson import ObjectId
+
+from App.scene_cache import SceneCache
+
+SCENE = {"name": "evening-eco", "devices": [{"device_id": "light.hall", "state": {"power": "off"}}]}
+
+
+class SceneCacheTests(unittest.TestCase):
+
+    @patch('App.scene_cache.mongo')
+    def test_hits_after_first_lookup(self, mock_mongo):
+        mock_mongo.db.automation_scenes.find_one.return_value = SCENE
+        cache = SceneCache()
+
+        first = cache.resolve("evening-eco")
+        second = cache.resolve("evening-eco")
+
+        self.assertEqual(first, [{"device_id": "light.hall", "action": "set_state", "state": {"power": "off"}}])
+        self.assertEqual(first, second)
+        mock_mongo.db.automation_scenes.find_one.assert_called_once_with({"name": "evening-eco"})
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+    @patch('App.scene_cache.mongo')
+    def test_object_id_lookup_and_invalidation(self, mock_mongo):
+        oid = ObjectId()
+        mock_mongo.db.automation_scenes.find_one.return_value = None
+        cache = SceneCache()
+
+        self.assertEqual(cache.resolve(str(oid)), [])
+        mock_mongo.db.automation_scenes.find_one.assert_called_once_with({"_id": oid})
+
+        mock_mongo.db.automation_scenes.find_one.return_value = SCENE
+        cache.invalidate(scene_id=oid)
+        self.assertEqual(len(cache.resolve(str(oid))), 1)
+
+    @patch('App.scene_cache.mongo')
+    def test_lru_eviction(self, mock_mongo):
+        mock_mongo.db.automation_scenes.find_one.return_value = SCENE
+        cache = SceneCache(maxsize=2)
+        for name in ("a", "b", "c"):
+            cache.resolve(name)
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.evictions, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,60 @@
+import unittest
+from unittest.mock import patch
+
+from run import app
+from App.device_cache import device_cache
+from App.versions import versions
+
+
+class VersionedEndpointTests(unittest.TestCase):
+
+    def setUp(self):
+        self.app = app.test_client()
+        self.app.testing = True
+        versions.clear()
+        device_cache.invalidate()
+        self.addCleanup(versions.clear)
+        self.addCleanup(device_cache.invalidate)
+        p = patch('App.versions.mongo')
+        self.versions_mongo = p.start()
+        self.addCleanup(p.stop)
+        self.counters = [{"_id": "lights", "epoch": "e1", "v": 4}]
+        self.versions_mongo.db.collection_versions.find.side_effect = lambda *a: list(self.counters)
+
+    @patch('App.device_cache.journal')
+    @patch('App.device_cache.mongo')
+    def test_not_modified_without_touching_lights(self, mock_mongo, _journal):
+        mock_mongo.db.__getitem__.return_value.find.return_value = [{"room": "london", "is_on": True}]
+        r = self.app.get('/api/environment/lights/status')
+        self.assertEqual((r.status_code, r.get_json()), (200, {"london": True}))
+        etag = r.headers["ETag"]
+
+        r = self.app.get('/api/environment/lights/status', headers={"If-None-Match": etag})
+        self.assertEqual(r.status_code, 304)
+        r = self.app.get('/api/environment/lights/status')         # no ETag: cached body
+        self.assertEqual(r.get_json(), {"london": True})
+        self.assertEqual(mock_mongo.db.__getitem__.return_value.find.call_count, 1)
+
+        # a write (here or in another worker) bumps the counter -> fresh body
+        self.versions_mongo.db.collection_versions.find_one_and_update.return_value = \
+            {"_id": "lights", "epoch": "e1", "v": 5}
+        mock_mongo.db.__getitem__.return_value.find_one_and_update.return_value = {"room": "london", "is_on": False}
+        self.app.post('/api/environment/lights/control', json={"room": "london", "state": False})
+        # fresh at once, before the bump itself has landed
+        r = self.app.get('/api/environment/lights/status', headers={"If-None-Match": etag})
+        self.assertEqual((r.status_code, r.get_json()), (200, {"london": False}))
+        self.assertNotEqual(r.headers["ETag"], etag)
+        device_cache.drain()
+        r = self.app.get('/api/environment/lights/status')
+        self.assertEqual((r.get_json(), r.headers["ETag"]), ({"london": False}, '"e1.5"'))
+
+    def test_counters_are_reread_after_ttl(self):
+        self.assertEqual(versions.current("lights", "parking_spots"), ("e1.4", "0"))
+        self.counters = [{"_id": "lights", "epoch": "e1", "v": 9}]
+        self.assertEqual(versions.current("lights"), ("e1.4",))       # still cached
+        versions._loaded_at -= versions.ttl
+        self.assertEqual(versions.current("lights"), ("e1.9",))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,115 @@
+import unittest
+from datetime import datetime
+from unittest.mock import patch, MagicMock
+
+from pymongo import UpdateOne
+from pymongo.errors import AutoReconnect, BulkWriteError, ServerSelectionTimeoutError
+
+from App import savings_rollups
+from App.write_behind import WriteBehind
+
+
+class WriteBehindTests(unittest.TestCase):
+
+    @patch('App.write_behind.mongo')
+    def test_batches_and_flushes_on_stop(self, mock_mongo):
+        events = MagicMock()
+        mock_mongo.db.__getitem__.side_effect = lambda name: events
+        wb = WriteBehind(batch_size=50, flush_interval=5)
+
+        for i in range(120):
+            wb.insert("automation_events", {"n": i})
+        wb.stop()
+
+        written = [d["n"] for call in events.insert_many.call_args_list for d in call.args[0]]
+        self.assertEqual(sorted(written), list(range(120)))
+        for call in events.insert_many.call_args_list:
+            self.assertLessEqual(len(call.args[0]), 50)
+            self.assertEqual(call.kwargs, {"ordered": False})
+        self.assertEqual(wb.depth, 0)
+
+    @patch('App.write_behind.mongo')
+    def test_full_queue_writes_synchronously(self, mock_mongo):
+        events = MagicMock()
+        mock_mongo.db.__getitem__.side_effect = lambda name: events
+        wb = WriteBehind(maxsize=1, put_timeout=0)
+        wb._ensure_worker = lambda: None    # no worker draining the queue
+
+        wb.insert("automation_events", {"n": 1})
+        wb.insert("automation_events", {"n": 2})
+
+        self.assertEqual(wb.sync_writes, 1)
+        events.insert_many.assert_called_once_with([{"n": 2}], ordered=False)
+        wb.flush()
+        self.assertEqual(events.insert_many.call_count, 2)
+
+    @patch('App.write_behind.mongo')
+    def test_failed_flush_is_retried_then_requeued(self, mock_mongo):
+        events = MagicMock()
+        events.insert_many.side_effect = AutoReconnect("primary stepped down")
+        mock_mongo.db.__getitem__.side_effect = lambda name: events
+        wb = WriteBehind(attempts=3, retry_delay=0)
+        wb._ensure_worker = lambda: None
+
+        wb.insert("automation_events", {"n": 1})
+        wb.flush()
+        self.assertEqual(events.insert_many.call_count, 3)
+        self.assertEqual((wb.errors, wb.dropped, wb.depth), (3, 0, 1))
+
+        events.insert_many.side_effect = None
+        wb.flush()
+        self.assertEqual(events.insert_many.call_args.args[0], [{"n": 1}])
+        self.assertEqual(wb.depth, 0)
+
+    @patch('App.write_behind.mongo')
+    def test_increments_are_not_resent_after_an_unacknowledged_write(self, mock_mongo):
+        rollups = MagicMock()
+        rollups.bulk_write.side_effect = [AutoReconnect("connection reset"), None]
+        mock_mongo.db.__getitem__.side_effect = lambda name: rollups
+        wb = WriteBehind(attempts=3, retry_delay=0)
+        wb._ensure_worker = lambda: None
+
+        inc = UpdateOne({"_id": "2026-10-18"}, {"$inc": {"executions": 1}}, upsert=True)
+        guarded = savings_rollups.rollup_ops([{"created_ts": datetime(2026, 10, 18, 9, 0), "energy_kwh_est": 0.1}])[0]
+        wb.submit("energy_savings_daily", inc)
+        wb.submit("energy_savings_daily", guarded)
+        wb.submit("energy_savings_daily", {"n": 1})
+        wb.flush()
+
+        # the $inc may already have been applied: only the replayable writes go again
+        sent = [c.args[0] for c in rollups.bulk_write.call_args_list]
+        self.assertEqual(len(sent[0]), 3)
+        self.assertIs(sent[1][0], guarded)
+        self.assertEqual([op._doc for op in sent[1][1:]], [{"n": 1}])
+        self.assertEqual((wb.dropped, wb.depth), (1, 0))
+
+    @patch('App.write_behind.mongo')
+    def test_unreachable_server_keeps_every_write(self, mock_mongo):
+        rollups = MagicMock()
+        rollups.bulk_write.side_effect = [ServerSelectionTimeoutError("no primary"), None]
+        mock_mongo.db.__getitem__.side_effect = lambda name: rollups
+        wb = WriteBehind(attempts=3, retry_delay=0)
+        wb._ensure_worker = lambda: None
+
+        wb.submit("energy_savings_daily", UpdateOne({"_id": "2026-10-18"}, {"$inc": {"executions": 1}}))
+        wb.flush()
+        self.assertEqual(rollups.bulk_write.call_count, 2)
+        self.assertEqual(wb.dropped, 0)
+
+    @patch('App.write_behind.mongo')
+    def test_only_rejected_writes_are_dropped(self, mock_mongo):
+        events = MagicMock()
+        events.insert_many.side_effect = BulkWriteError({"writeErrors": [
+            {"index": 1, "code": 11000, "errmsg": "E11000 duplicate key"}]})
+        mock_mongo.db.__getitem__.side_effect = lambda name: events
+        wb = WriteBehind(attempts=3, retry_delay=0)
+        wb._ensure_worker = lambda: None
+
+        wb.insert_many("automation_events", [{"n": 1}, {"n": 2}, {"n": 3}])
+        wb.flush()
+        events.insert_many.assert_called_once()
+        self.assertEqual((wb.dropped, wb.depth), (1, 0))
+
+
+if __name__ == "__main__":
+    unittest.main()
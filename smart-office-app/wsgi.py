@@ -0,0 +1,4 @@
+# wsgi.py - production entry point:
+#   gunicorn -c gunicorn.conf.py wsgi:app
+# Seeding is a separate one-shot step:  python -m App.commands seed
+from run import app  # noqa: F401  (routes, /metrics and health probes live in run.py)